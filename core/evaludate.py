@@ -161,14 +161,23 @@ def accuracy(output, target, hm_type='gaussian', thr=0.5):
     First value to be returned is average accuracy across 'idxs',
     followed by individual accuracies
     '''
-    idx = list(range(output.shape[1]))
-    norm = 1.0
-    if hm_type == 'gaussian':
-        pred, _ = get_max_preds(output)
-        target, _ = get_max_preds(target)
-        h = output.shape[2]
-        w = output.shape[3]
-        norm = np.ones((pred.shape[0], 2)) * np.array([h, w]) / 10
+    if hm_type != 'gaussian':
+        raise ValueError(f"Unknown heatmap type: {hm_type}")
+    pred, _ = get_max_preds(output)
+    return coord_accuracy(pred, target, thr)
+
+
+def coord_accuracy(pred, target, thr=0.5):
+    '''
+    PCK of predicted coordinates in heatmap pixels (the argmax of the
+    heatmaps in accuracy, or decoded from the SimCC head) against the
+    ground truth heatmaps, at thr times a tenth of the heatmap size
+    '''
+    idx = list(range(pred.shape[1]))
+    h = target.shape[2]
+    w = target.shape[3]
+    target, _ = get_max_preds(target)
+    norm = np.ones((pred.shape[0], 2)) * np.array([h, w]) / 10
     dists = calc_dists(pred, target, norm)  # use a fixed length as a measure rather than the length of body parts
 
     acc = np.zeros((len(idx) + 1))
@@ -8,13 +8,35 @@ from torch.cuda.amp import GradScaler, autocast
 from utils.common import TRAIN_PHASE, VAL_PHASE, TEST_PHASE
 from datasets.process.heatmaps_process import get_final_preds, get_final_preds_coor
 from utils.utils_save_results import save_batch_examples
-from .evaludate import accuracy, pck_accuracy
-
-def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, device, experiment_dir, save_examples=False):
+from .evaludate import accuracy, pck_accuracy, coord_accuracy
+from models.best.cpu_profile import autocast_context
+from datasets.transforms import device_transforms
+
+def reset_peak_memory(device):
+    if str(device).startswith('cuda'):
+        torch.cuda.reset_peak_memory_stats(device)
+
+def peak_memory_gb(device):
+    """Peak CUDA memory allocated since the last reset_peak_memory, in GiB (0 on the CPU)."""
+    if str(device).startswith('cuda'):
+        return torch.cuda.max_memory_allocated(device) / 1024 ** 3
+    return 0.0
+
+def output_accuracy(model, output, target_heatmaps):
+    """PCK of a batch for the heatmap head, or the SimCC head (MODEL.HEAD 'simcc') whose output is decoded first."""
+    simcc_head = getattr(model, 'simcc_head', None)
+    if simcc_head is not None:
+        coords, _ = simcc_head.decode(output.detach())
+        return coord_accuracy(coords.cpu().numpy(), target_heatmaps.detach().cpu().numpy())
+    return accuracy(output.detach().cpu().numpy(), target_heatmaps.detach().cpu().numpy())
+
+def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, device, experiment_dir, save_examples=False,
+                             distillation=None):
     batch_time = AverageMeter()
     data_time = AverageMeter()
     losses = AverageMeter()
     acc = AverageMeter()
+    peak_memory = AverageMeter()
 
     # Switch to train mode
     model.train()
@@ -35,9 +57,13 @@ def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epo
 
     for i, (x, meta, target_heatmaps, target_heatmaps_weight) in enumerate(pbar):
         data_start = time.time()
+        reset_peak_memory(device)
 
         # Move input and target data to device
         x = x.to(device, non_blocking=True)
+        if 'crop_theta' in meta:
+            # TRAIN.DEVICE_AUGMENTATION: crop and normalize the uint8 canvases here
+            x = device_transforms(x, meta['crop_theta'], cfg.MODEL.IMAGE_SIZE)
         target_heatmaps = target_heatmaps.to(device, non_blocking=True)
         target_heatmaps_weight = target_heatmaps_weight.to(device, non_blocking=True)
         
@@ -47,6 +73,8 @@ def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epo
         with autocast():
             output = model(x, meta)
             loss = criterion(output, target_heatmaps, target_heatmaps_weight)
+            if distillation is not None:
+                loss = loss + distillation(output, meta)
             loss = loss / accumulation_steps  # Normalize loss by accumulation steps
 
         # Backpropagate the loss and accumulate gradients
@@ -62,25 +90,27 @@ def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epo
             optimizer.zero_grad()
 
         # Compute accuracy
-        _, avg_acc, cnt, _ = accuracy(output.detach().cpu().numpy(), target_heatmaps.detach().cpu().numpy())
+        _, avg_acc, cnt, _ = output_accuracy(model, output, target_heatmaps)
 
         # Update running loss and accuracy
         losses.update(loss.item() * accumulation_steps, x.size(0))  # Multiply back by accumulation steps to get the actual loss
         acc.update(avg_acc, cnt)
+        peak_memory.update(peak_memory_gb(device))
 
         # Update timing
         batch_time.update(time.time() - end)
         end = time.time()
 
         if i % 100 == 0:
-            tqdm_desc = f'Epoch {epoch} [Loss: {losses.avg:.6f}] [Acc: {acc.avg:.3f}] [Data: {data_time.avg:.3f}s] [Batch: {batch_time.avg:.3f}s]'
+            tqdm_desc = f'Epoch {epoch} [Loss: {losses.avg:.6f}] [Acc: {acc.avg:.3f}] [Data: {data_time.avg:.3f}s] [Batch: {batch_time.avg:.3f}s] [Mem: {peak_memory.max:.2f}G]'
             pbar.set_description(tqdm_desc)
 
 
     # Print summary for the epoch
     print(f'Training Epoch {epoch} Summary:\t'
           f'Loss {losses.avg:.6f}\t'
-          f'Acc {acc.avg:.3f}\t')
+          f'Acc {acc.avg:.3f}\t'
+          f'Peak memory {peak_memory.max:.2f}G (step avg {peak_memory.avg:.2f}G)')
     
 
 
@@ -89,11 +119,13 @@ def train_batch_accumulation(cfg, train_loader, model, criterion, optimizer, epo
 
     return losses.avg, acc.avg
 
-def train(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, device, experiment_dir, save_examples=False):
+def train(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, device, experiment_dir, save_examples=False,
+          distillation=None):
     batch_time = AverageMeter()
     data_time = AverageMeter()
     losses = AverageMeter()
     acc = AverageMeter()
+    peak_memory = AverageMeter()
 
     # switch to train mode
     model.train()
@@ -115,9 +147,13 @@ def train(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, dev
     for i, (x, meta, target_heatmaps, target_heatmaps_weight) in enumerate(pbar):
         
         data_start = time.time()
+        reset_peak_memory(device)
 
         #x = torch.stack([input_prev, input_x, input_next], dim=1).to(device, non_blocking=True
         x = x.to(device, non_blocking=True)
+        if 'crop_theta' in meta:
+            # TRAIN.DEVICE_AUGMENTATION: crop and normalize the uint8 canvases here
+            x = device_transforms(x, meta['crop_theta'], cfg.MODEL.IMAGE_SIZE)
         target_heatmaps = target_heatmaps.to(device, non_blocking=True)
         target_heatmaps_weight = target_heatmaps_weight.to(device, non_blocking=True)
         
@@ -127,6 +163,8 @@ def train(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, dev
             output = model(x, meta)
             #loss = criterion(output, meta['target'].to(device), meta['target_weight'].to(device))
             loss = criterion(output, target_heatmaps, target_heatmaps_weight)
+            if distillation is not None:
+                loss = loss + distillation(output, meta)
 
         optimizer.zero_grad()
         scaler.scale(loss).backward()
@@ -134,24 +172,26 @@ def train(cfg, train_loader, model, criterion, optimizer, epoch, output_dir, dev
         scaler.step(optimizer)
         scaler.update()
 
-        _, avg_acc, cnt, _ = accuracy(output.detach().cpu().numpy(), target_heatmaps.detach().cpu().numpy())
+        _, avg_acc, cnt, _ = output_accuracy(model, output, target_heatmaps)
 
         losses.update(loss.item(), x.size(0))
 
         acc.update(avg_acc, cnt)
+        peak_memory.update(peak_memory_gb(device))
 
         # acc.update(output.acc.item(), len(input_x))
         batch_time.update(time.time() - end)
         end = time.time()
 
         if i % 100 == 0:
-            tqdm_desc = f'Epoch {epoch} [Loss: {losses.avg:.6f}] [Acc: {acc.avg:.3f}] [Data: {data_time.avg:.3f}s] [Batch: {batch_time.avg:.3f}s]'
+            tqdm_desc = f'Epoch {epoch} [Loss: {losses.avg:.6f}] [Acc: {acc.avg:.3f}] [Data: {data_time.avg:.3f}s] [Batch: {batch_time.avg:.3f}s] [Mem: {peak_memory.max:.2f}G]'
             pbar.set_description(tqdm_desc)
 
 
     print(f'Training Epoch {epoch} Summary:\t'
           f'Loss {losses.avg:.6f}\t'
-          f'Acc {acc.avg:.3f}')
+          f'Acc {acc.avg:.3f}\t'
+          f'Peak memory {peak_memory.max:.2f}G (step avg {peak_memory.avg:.2f}G)')
 
     total_time = time.time() - total_time
     print("\033[95m" + f"Total time: {total_time // 60:.0f} minutes and {total_time % 60:.2f} seconds" + "\033[0m\n")
@@ -190,14 +230,16 @@ def validate(config, val_loader, val_dataset, model, criterion, output_dir, epoc
             target_heatmaps = target_heatmaps.to(device, non_blocking=True)
             target_heatmaps_weight = target_heatmaps_weight.to(device, non_blocking=True)
 
-            with autocast():
+            with autocast_context(config, device):
                 output = model(x, meta)
                 #pred_coor = output.pred_jts.detach().cpu().numpy()
                 #score_coor = output.maxvals.detach().cpu().numpy()
 
                 loss = criterion(output, target_heatmaps, target_heatmaps_weight)
+            if output.dtype == torch.bfloat16:
+                output = output.float()  # bf16 CPU autocast (CPU.PROFILE), numpy has no bf16
 
-            _, avg_acc, cnt, _ = accuracy(output.detach().cpu().numpy(), target_heatmaps.detach().cpu().numpy())
+            _, avg_acc, cnt, _ = output_accuracy(model, output, target_heatmaps)
             
             # get len batch size
             acc.update(avg_acc, cnt)
@@ -217,7 +259,14 @@ def validate(config, val_loader, val_dataset, model, criterion, output_dir, epoc
             score = meta['score'].numpy()
             num_images =  x.size(0)
 
-            preds, maxvals = get_final_preds(output.clone().cpu().numpy(), center, scale)
+            if getattr(model, 'simcc_head', None) is not None:
+                # coordinates decoded on the device, no heatmap transfer
+                coords, maxvals = model.simcc_head.decode(output)
+                heatmap_width, heatmap_height = config.MODEL.HEATMAP_SIZE
+                preds, maxvals = get_final_preds_coor(coords.cpu().numpy(), maxvals.cpu().numpy(), center, scale,
+                                                      heatmap_height, heatmap_width)
+            else:
+                preds, maxvals = get_final_preds(output.clone().cpu().numpy(), center, scale)
             #preds, maxvals = get_final_preds(output, center, scale)
 
             all_preds[idx:idx + num_images, :, 0:2] = preds[:, :, 0:2]
@@ -276,9 +325,11 @@ class AverageMeter(object):
         self.avg = 0
         self.sum = 0
         self.count = 0
+        self.max = 0
 
     def update(self, val, n=1):
         self.val = val
+        self.max = max(self.max, val)
         self.sum += val * n
         self.count += n
         self.avg = self.sum / self.count if self.count != 0 else 0
\ No newline at end of file
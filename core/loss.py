@@ -29,8 +29,95 @@ class JointsMSELoss(nn.Module):
         return loss / num_joints
 
 
+class SimCCLoss(nn.Module):
+    """KL divergence between the SimCC x / y distributions and the marginals of the target heatmaps.
+
+    The 1-D labels are the Gaussian target heatmaps summed over y (resp. x), resampled to the SimCC
+    bins and normalized, so the head is trained on the same targets as the heatmap head.
+    """
+
+    def __init__(self, use_target_weight, heatmap_size, split_ratio):
+        super(SimCCLoss, self).__init__()
+        self.use_target_weight = use_target_weight
+        self.num_bins_x = (int(heatmap_size[0]) - 1) * split_ratio + 1
+        self.num_bins_y = (int(heatmap_size[1]) - 1) * split_ratio + 1
+
+    def labels(self, target):
+        target = target.float()
+        label_x = F.interpolate(target.sum(dim=2), size=self.num_bins_x, mode='linear', align_corners=True)
+        label_y = F.interpolate(target.sum(dim=3), size=self.num_bins_y, mode='linear', align_corners=True)
+        return (label_x / label_x.sum(dim=-1, keepdim=True).clamp_min(1e-6),
+                label_y / label_y.sum(dim=-1, keepdim=True).clamp_min(1e-6))
+
+    def forward(self, output, target, target_weight, effective_num_joints: int = None):
+        logits_x, logits_y = output.float().split([self.num_bins_x, self.num_bins_y], dim=-1)
+        label_x, label_y = self.labels(target)
+        loss = F.kl_div(F.log_softmax(logits_x, dim=-1), label_x, reduction='none').sum(dim=-1) \
+            + F.kl_div(F.log_softmax(logits_y, dim=-1), label_y, reduction='none').sum(dim=-1)  # [B, K]
+        if self.use_target_weight:
+            loss = loss * target_weight.reshape(loss.shape)
+        return loss.mean()
+
+
+class DistillationLoss(nn.Module):
+    """Teacher supervision of a student Poseidon, on top of the ground truth loss.
+
+    The teacher outputs come with the batch meta (PoseTrack with DISTILL.ENABLED, precomputed by
+    tools/precompute_teacher.py): MSE between the student and teacher heatmaps and, with feature_weight > 0,
+    attention transfer between the fused features entering the heatmap head (channel mean of the squared
+    features, L2 normalized, so that the student and teacher widths do not need to match).
+    """
+
+    def __init__(self, heatmap_weight=1.0, feature_weight=0.0, model=None):
+        super(DistillationLoss, self).__init__()
+        self.heatmap_weight = heatmap_weight
+        self.feature_weight = feature_weight
+        self.features = None
+        self.handle = None
+        if feature_weight > 0:
+            if model is None:
+                raise ValueError("The feature distillation needs the student model")
+            self.handle = model.deconv_layer.register_forward_pre_hook(self._capture)
+
+    def _capture(self, module, inputs):
+        self.features = inputs[0]
+
+    @staticmethod
+    def attention_map(features):
+        return F.normalize(features.float().pow(2).mean(dim=1).flatten(1), dim=1)
+
+    def forward(self, output, meta):
+        loss = 0
+        if self.heatmap_weight > 0:
+            teacher = meta['teacher_heatmaps'].to(output.device, non_blocking=True)
+            loss = loss + self.heatmap_weight * F.mse_loss(output.float(), teacher)
+
+        if self.feature_weight > 0:
+            teacher = meta['teacher_attention'].to(output.device, non_blocking=True)
+            features = self.features
+            if features.shape[-2:] != teacher.shape[-2:]:
+                features = F.interpolate(features, size=teacher.shape[-2:], mode='bilinear', align_corners=False)
+            student = self.attention_map(features)
+            teacher = F.normalize(teacher.float().flatten(1), dim=1)
+            loss = loss + self.feature_weight * F.mse_loss(student, teacher)
+            self.features = None
+        return loss
+
+
+def get_distillation_loss(cfg, model, device):
+    """DistillationLoss of cfg.DISTILL, None when the distillation is disabled."""
+    if not cfg.DISTILL.ENABLED:
+        return None
+    if cfg.MODEL.HEAD != 'heatmap':
+        raise ValueError("Distillation needs the heatmap head (MODEL.HEAD 'heatmap')")
+    loss_fn = DistillationLoss(cfg.DISTILL.HEATMAP_WEIGHT, cfg.DISTILL.FEATURE_WEIGHT, model=model)
+    return loss_fn.to(device)
+
+
 def get_loss_function(cfg, device):
-    if cfg.LOSS.NAME == 'JointsMSELoss':
+    if cfg.MODEL.HEAD == 'simcc':
+        loss_fn = SimCCLoss(cfg.LOSS.USE_TARGET_WEIGHT, cfg.MODEL.HEATMAP_SIZE, cfg.MODEL.SIMCC_SPLIT_RATIO)
+    elif cfg.LOSS.NAME == 'JointsMSELoss':
         loss_fn = JointsMSELoss(use_target_weight=cfg.LOSS.USE_TARGET_WEIGHT)
     else:
         raise ValueError(f"Unknown loss function: {cfg.LOSS.NAME}")
@@ -10,5 +10,8 @@ from .zoo.posetrack import *
 # dataset zoo
 from .zoo.build import build_train_loader, build_eval_loader, get_dataset_name
 
+# samplers
+from .samplers import VideoBlockSampler, VideoSequentialSampler, build_train_sampler, build_val_sampler
+
 # datasets (Required for DATASET_REGISTRY)
 from .zoo.posetrack.PoseTrack import PoseTrack
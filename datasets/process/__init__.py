@@ -7,4 +7,10 @@ from .pose_process import fliplr_joints, half_body_transform
 from .heatmaps_process import get_max_preds, get_final_preds, generate_heatmaps, get_final_preds_coor
 
 from .data_format import convert_data_to_annorect_struct
+
+from .teacher_store import TeacherStore
+
+from .frame_cache import SharedFrameCache
+
+from .frame_store import FrameStore, FrameStoreWriter
 # from .structure import *
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Decoded-frame cache shared by the DataLoader workers (DATASET.FRAME_CACHE_GB).
+
+Every sample decodes the full-resolution frames of its temporal window, so a frame is decoded once
+per person in it and once more for every neighbouring window that overlaps it. The cache keeps
+decoded frames in a shared-memory slab of fixed-size slots (one frame of at most
+DATASET.FRAME_CACHE_MAX_SIZE each), evicted least recently used. The slot table (path hash, frame
+shape, last use, version) and the hit / miss counters are shared numpy arrays guarded by one lock,
+created in the main process before the workers start, from the multiprocessing context of the workers.
+
+Frames are copied out of the slab without holding the lock: each slot carries a version that is odd
+while the slot is being written, and a read whose version changed during the copy counts as a miss.
+"""
+import hashlib
+import os
+import os.path as osp
+import sys
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# counters of the shared header
+_TICK, _HITS, _MISSES, _EVICTIONS, _UNCACHEABLE = range(5)
+_HEADER = 8
+
+
+def _path_key(path):
+    key = int.from_bytes(hashlib.blake2b(path.encode(), digest_size=8).digest(), 'little', signed=True)
+    return key or 1  # 0 marks an empty slot
+
+
+def _attach(name):
+    # spawned workers share the resource tracker of the main process, which unlinks the segments
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameCache:
+    """Byte-budgeted LRU of decoded uint8 frames, keyed by image path, shared across processes."""
+
+    def __init__(self, budget_bytes, max_frame_size=(1920, 1080), channels=3, mp_context=None):
+        """
+        Args:
+            budget_bytes (int): Size of the shared slab of frames.
+            max_frame_size (tuple): (width, height) of the largest cached frame, the size of a slot.
+                Larger frames are decoded every time.
+            channels (int): Channels of the decoded frames.
+            mp_context: multiprocessing context the DataLoader workers are started with
+                (multiprocessing_context), the default start method when None.
+        """
+        self.slot_bytes = int(max_frame_size[0]) * int(max_frame_size[1]) * channels
+        self.num_slots = int(budget_bytes) // self.slot_bytes
+        if self.num_slots < 1:
+            raise ValueError(f"Frame cache budget of {budget_bytes} bytes is smaller than one "
+                             f"{max_frame_size[0]}x{max_frame_size[1]} frame")
+        shm_dir = '/dev/shm'
+        if osp.isdir(shm_dir):
+            stats = os.statvfs(shm_dir)
+            available = stats.f_bavail * stats.f_frsize
+            if self.num_slots * self.slot_bytes > available:
+                raise ValueError(f"Frame cache of {self.num_slots * self.slot_bytes / 2 ** 30:.1f} GB does not fit in "
+                                 f"{shm_dir} ({available / 2 ** 30:.1f} GB free), lower DATASET.FRAME_CACHE_GB or "
+                                 f"enlarge the shared memory (docker --shm-size)")
+
+        self._frames_shm = shared_memory.SharedMemory(create=True, size=self.num_slots * self.slot_bytes)
+        self._meta_shm = shared_memory.SharedMemory(create=True, size=self._meta_bytes(self.num_slots))
+        self._lock = (mp_context or mp.get_context()).Lock()
+        self._views()
+        self._meta[:] = 0
+        self._owner = os.getpid()
+        self._finalizer = weakref.finalize(self, SharedFrameCache._release, self._owner, self._frames_shm,
+                                           self._meta_shm)
+
+    @staticmethod
+    def _meta_bytes(num_slots):
+        # header, then keys, last use and versions (int64) and shapes (3 x int64) per slot
+        return (_HEADER + 6 * num_slots) * 8
+
+    def _views(self):
+        meta = np.ndarray((_HEADER + 6 * self.num_slots,), dtype=np.int64, buffer=self._meta_shm.buf)
+        self._meta = meta
+        self._header = meta[:_HEADER]
+        slots = meta[_HEADER:]
+        n = self.num_slots
+        self._keys, self._last_used, self._versions = slots[:n], slots[n:2 * n], slots[2 * n:3 * n]
+        self._shapes = slots[3 * n:].reshape(n, 3)
+        self._frames = np.ndarray((self.num_slots, self.slot_bytes), dtype=np.uint8, buffer=self._frames_shm.buf)
+
+    def __getstate__(self):
+        # workers started with spawn / forkserver attach to the segments by name
+        state = {key: value for key, value in self.__dict__.items()
+                 if key in ('slot_bytes', 'num_slots', '_lock', '_owner')}
+        state['frames_name'], state['meta_name'] = self._frames_shm.name, self._meta_shm.name
+        return state
+
+    def __setstate__(self, state):
+        frames_name, meta_name = state.pop('frames_name'), state.pop('meta_name')
+        self.__dict__.update(state)
+        self._frames_shm, self._meta_shm = _attach(frames_name), _attach(meta_name)
+        self._finalizer = None
+        self._views()
+
+    @staticmethod
+    def _release(owner, frames_shm, meta_shm):
+        if os.getpid() != owner:
+            return  # forked worker
+        for shm in (frames_shm, meta_shm):
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """Free the shared memory (main process only, once the workers have stopped)."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def get(self, path):
+        """Copy of the cached frame of `path`, or None."""
+        key = _path_key(path)
+        with self._lock:
+            slots = np.flatnonzero(self._keys == key)
+            if len(slots) == 0:
+                self._header[_MISSES] += 1
+                return None
+            slot = int(slots[0])
+            version = int(self._versions[slot])
+            shape = tuple(int(size) for size in self._shapes[slot])
+            self._header[_TICK] += 1
+            self._last_used[slot] = self._header[_TICK]
+        nbytes = shape[0] * shape[1] * shape[2]
+        frame = self._frames[slot, :nbytes].copy().reshape(shape)
+        if self._versions[slot] != version:
+            # evicted and rewritten during the copy
+            with self._lock:
+                self._header[_MISSES] += 1
+            return None
+        with self._lock:
+            self._header[_HITS] += 1
+        return frame
+
+    def put(self, path, frame):
+        """Store the decoded uint8 frame [H, W, C] of `path`, evicting the least recently used one."""
+        frame = np.ascontiguousarray(frame)
+        if frame.dtype != np.uint8 or frame.ndim != 3 or frame.nbytes > self.slot_bytes:
+            with self._lock:
+                self._header[_UNCACHEABLE] += 1
+            return
+        key = _path_key(path)
+        with self._lock:
+            if np.any(self._keys == key):
+                return  # decoded concurrently by another worker
+            # free slot first, else the least recently used slot that is not being written
+            candidates = np.flatnonzero(self._versions % 2 == 0)
+            if len(candidates) == 0:
+                return
+            slot = int(candidates[np.argmin(self._last_used[candidates])])
+            if self._keys[slot] != 0:
+                self._header[_EVICTIONS] += 1
+            self._keys[slot] = 0
+            self._versions[slot] += 1  # odd: being written
+        self._frames[slot, :frame.nbytes] = frame.reshape(-1)
+        with self._lock:
+            self._shapes[slot] = frame.shape
+            self._keys[slot] = key
+            self._versions[slot] += 1
+            self._header[_TICK] += 1
+            self._last_used[slot] = self._header[_TICK]
+
+    def read(self, paths, decode):
+        """Frames of `paths`: cached ones are copied, the others decoded with decode(list of paths) and cached."""
+        frames = [self.get(path) for path in paths]
+        missing = [i for i, frame in enumerate(frames) if frame is None]
+        if missing:
+            for i, frame in zip(missing, decode([paths[i] for i in missing])):
+                frames[i] = frame
+                if frame is not None:
+                    self.put(paths[i], frame)
+        return frames
+
+    def stats(self):
+        """Hit / miss counters of all processes since the cache was created."""
+        with self._lock:
+            hits, misses = int(self._header[_HITS]), int(self._header[_MISSES])
+            evictions, uncacheable = int(self._header[_EVICTIONS]), int(self._header[_UNCACHEABLE])
+            cached = int(np.count_nonzero(self._keys))
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'evictions': evictions,
+            'uncacheable': uncacheable,
+            'cached_frames': cached,
+            'slots': self.num_slots,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Frame cache: {stats['hit_rate']:.1%} hit rate ({stats['hits']} hits, {stats['misses']} misses), "
+                f"{stats['cached_frames']}/{stats['slots']} frames cached, {stats['evictions']} evictions")
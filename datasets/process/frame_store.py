@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Pre-packed frames of a dataset, one container per video (tools/pack_frames.py, DATASET.FRAME_STORE).
+
+Reading a window otherwise opens and decodes one image file per frame. The packer writes the frames
+of each video folder into a single file:
+- 'raw': decoded uint8 frames [N, h, w, 3] in a memory-mapped array, optionally downscaled so that
+  the longest side is at most max_size. Frames are read without a copy or a decode.
+- 'encoded': the original JPEG / PNG bytes concatenated, with the offset of each frame. The file is
+  memory-mapped and each frame is decoded from its slice, as from its image file.
+
+Frames are looked up by image path (video folder relative to the packed image directory, and file
+name). A downscaled frame comes with the affine transform from image to frame pixels, so the crops
+of the dataset can be taken from the smaller frame directly (see PoseTrack._read_window).
+"""
+import io
+import json
+import os
+import os.path as osp
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+STORE_VERSION = 1
+
+
+def decode_frame(buffer, image_format='jpg'):
+    """Decode image bytes exactly as utils.utils_image reads the image files of this format."""
+    if image_format == 'jpg':
+        from utils.utils_image import jpeg
+        return jpeg.decode(buffer)
+    return np.array(Image.open(io.BytesIO(bytes(buffer))).convert('RGB'))
+
+
+def scale_transform(image_size, frame_size):
+    """3x3 affine from image pixels to the pixels of the image resized (cv2.resize) to frame_size."""
+    sx, sy = frame_size[0] / image_size[0], frame_size[1] / image_size[1]
+    # pixel centers are aligned: x' + 0.5 = (x + 0.5) * sx
+    return np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]], dtype=np.float64)
+
+
+class FrameStore:
+    """Read-only access to the frames packed in `path` by FrameStoreWriter."""
+
+    def __init__(self, path, image_dir, max_open=64):
+        """
+        Args:
+            path (str): Store directory.
+            image_dir (str): Image directory the store was packed from (DATASET.IMG_DIR), against
+                which the video folders of the image paths are resolved.
+            max_open (int): Video containers kept memory-mapped per process.
+        """
+        with open(osp.join(path, 'store.json')) as f:
+            self.info = json.load(f)
+        if self.info['version'] > STORE_VERSION:
+            raise ValueError(f"Unsupported frame store version: {self.info['version']}")
+        self.path = path
+        self.image_dir = osp.abspath(image_dir)
+        self.mode = self.info['mode']
+        self.image_format = self.info['image_format']
+        self.videos = self.info['videos']
+        self.frame_index = {video: {name: i for i, name in enumerate(entry['frames'])}
+                            for video, entry in self.videos.items()}
+        self.max_open = max_open
+        self._open = OrderedDict()
+
+    @property
+    def downscaled(self):
+        return any(entry['frame_size'] != entry['image_size'] for entry in self.videos.values())
+
+    def __getstate__(self):
+        # memory maps are reopened by each worker
+        state = dict(self.__dict__)
+        state['_open'] = OrderedDict()
+        return state
+
+    def locate(self, image_path):
+        """(video, frame index) of an image path, None if the frame is not in the store."""
+        video, name = osp.split(osp.relpath(osp.abspath(image_path), self.image_dir))
+        index = self.frame_index.get(video, {}).get(name)
+        return None if index is None else (video, index)
+
+    def _container(self, video):
+        container = self._open.get(video)
+        if container is None:
+            entry = self.videos[video]
+            file = osp.join(self.path, entry['file'])
+            if self.mode == 'raw':
+                width, height = entry['frame_size']
+                container = np.memmap(file, dtype=np.uint8, mode='r', shape=(len(entry['frames']), height, width, 3))
+            else:
+                container = np.memmap(file, dtype=np.uint8, mode='r')
+            self._open[video] = container
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        else:
+            self._open.move_to_end(video)
+        return container
+
+    def read(self, image_paths):
+        """Frames of image_paths (all in one video).
+
+        Returns:
+            list of np.ndarray: Frames [h, w, 3]; read-only views of the container in 'raw' mode.
+            np.ndarray: 3x3 affine from image pixels to frame pixels (identity unless downscaled).
+            tuple: (width, height) of the original images.
+        """
+        locations = [self.locate(path) for path in image_paths]
+        missing = [path for path, location in zip(image_paths, locations) if location is None]
+        if missing:
+            raise FileNotFoundError(f"Frames not in the frame store {self.path}: {missing}")
+        video = locations[0][0]
+        if any(location[0] != video for location in locations):
+            raise ValueError("FrameStore.read reads the frames of a single video")
+        entry = self.videos[video]
+        container = self._container(video)
+        if self.mode == 'raw':
+            frames = [container[index] for _, index in locations]
+        else:
+            offsets = entry['offsets']
+            frames = [decode_frame(container[offsets[index]:offsets[index + 1]], self.image_format)
+                      for _, index in locations]
+        return frames, scale_transform(entry['image_size'], entry['frame_size']), tuple(entry['image_size'])
+
+
+class FrameStoreWriter:
+    """Pack video folders of frames into a FrameStore directory."""
+
+    def __init__(self, path, mode='raw', image_format='jpg', max_size=0):
+        """
+        Args:
+            mode (str): 'raw' (decoded uint8 frames) or 'encoded' (original image bytes).
+            image_format (str): 'jpg' or 'png', the DATASET IMAGE_FORMAT.
+            max_size (int): 'raw' only, downscale frames whose longest side is larger (0 = original size).
+        """
+        if mode not in ('raw', 'encoded'):
+            raise ValueError(f"Unknown frame store mode: {mode}")
+        if mode == 'encoded' and max_size:
+            raise ValueError("Only 'raw' frame stores can be downscaled")
+        self.path = path
+        self.mode = mode
+        self.image_format = image_format
+        self.max_size = max_size
+        self.videos = {}
+        os.makedirs(osp.join(path, 'videos'), exist_ok=True)
+
+    def add_video(self, video, frame_files):
+        """Pack the image files frame_files (in frame order) of the folder `video` (relative to the image dir)."""
+        file = osp.join('videos', f"{len(self.videos):06d}.{'u8' if self.mode == 'raw' else 'bin'}")
+        entry = {'file': file, 'frames': [osp.basename(frame_file) for frame_file in frame_files]}
+        with open(osp.join(self.path, file), 'wb') as f:
+            if self.mode == 'raw':
+                for frame_file in frame_files:
+                    with open(frame_file, 'rb') as image:
+                        frame = decode_frame(image.read(), self.image_format)
+                    height, width = frame.shape[:2]
+                    entry.setdefault('image_size', [width, height])
+                    if [width, height] != entry['image_size']:
+                        raise ValueError(f"Frames of {video} have different sizes, 'raw' stores need one size per video")
+                    scale = min(1.0, self.max_size / max(width, height)) if self.max_size else 1.0
+                    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+                    if size != (width, height):
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    entry['frame_size'] = list(size)
+                    f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+            else:
+                offsets = [0]
+                for frame_file in frame_files:
+                    with open(frame_file, 'rb') as image:
+                        data = image.read()
+                    if 'image_size' not in entry:
+                        height, width = decode_frame(data, self.image_format).shape[:2]
+                        entry['image_size'] = entry['frame_size'] = [width, height]
+                    f.write(data)
+                    offsets.append(offsets[-1] + len(data))
+                entry['offsets'] = offsets
+        self.videos[video] = entry
+        return entry
+
+    def close(self):
+        info = {
+            'version': STORE_VERSION,
+            'mode': self.mode,
+            'image_format': self.image_format,
+            'max_size': self.max_size,
+            'videos': self.videos,
+        }
+        with open(osp.join(self.path, 'store.json'), 'w') as f:
+            json.dump(info, f)
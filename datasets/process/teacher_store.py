@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Memory-mapped store of teacher predictions for distillation (tools/precompute_teacher.py).
+
+The teacher runs once over the un-augmented training windows. Its heatmaps (and optionally the
+attention map of the fused features of the query frame, their channel mean of squares) are written as
+fp16 arrays indexed by dataset sample, together with the crop (center, scale) of each sample. At training time the student sample is augmented (scale,
+rotation, flip, half body), so the teacher maps are warped with the affine transform between the two
+crops before they are compared with the student output.
+"""
+import json
+import os
+import os.path as osp
+
+import cv2
+import numpy as np
+
+from .affine_transform import get_affine_transform
+
+STORE_VERSION = 2
+
+
+class TeacherStore:
+    """fp16 teacher heatmaps [N, K, H, W] and feature attention maps [N, 1, h, w] of N training samples."""
+
+    def __init__(self, path, mode='r'):
+        """Open the store in `path`, read-only ('r') or for writing ('r+')."""
+        with open(osp.join(path, 'store.json')) as f:
+            self.info = json.load(f)
+        if self.info['version'] > STORE_VERSION:
+            raise ValueError(f"Unsupported teacher store version: {self.info['version']}")
+        self.path = path
+        self.num_samples = self.info['num_samples']
+        self.heatmap_size = tuple(self.info['heatmap_size'])  # (width, height)
+        self.heatmaps = np.memmap(osp.join(path, 'heatmaps.f16'), dtype=np.float16, mode=mode,
+                                  shape=tuple(self.info['heatmaps_shape']))
+        if self.info.get('features_shape'):
+            raise ValueError(f"The teacher store {path} holds the full teacher features (version 1): write it again "
+                             f"with tools/precompute_teacher.py --features, which stores their attention maps")
+        self.attention = None
+        if self.info.get('attention_shape'):
+            self.attention = np.memmap(osp.join(path, 'attention.f16'), dtype=np.float16, mode=mode,
+                                       shape=tuple(self.info['attention_shape']))
+        self.centers = np.load(osp.join(path, 'centers.npy'), mmap_mode=mode)
+        self.scales = np.load(osp.join(path, 'scales.npy'), mmap_mode=mode)
+
+    @classmethod
+    def create(cls, path, num_samples, heatmaps_shape, heatmap_size, attention_shape=None):
+        """Allocate an empty store in `path` and open it for writing.
+
+        Args:
+            heatmaps_shape (tuple): (K, H, W) of the teacher heatmaps.
+            heatmap_size (tuple): (width, height) the teacher heatmaps cover, i.e. cfg.MODEL.HEATMAP_SIZE.
+            attention_shape (tuple): (h, w) of the fused features' attention maps, None to store heatmaps only.
+        """
+        os.makedirs(path, exist_ok=True)
+        info = {
+            'version': STORE_VERSION,
+            'num_samples': num_samples,
+            'heatmaps_shape': [num_samples, *heatmaps_shape],
+            'heatmap_size': list(heatmap_size),
+            'attention_shape': [num_samples, 1, *attention_shape] if attention_shape else None,
+        }
+        with open(osp.join(path, 'store.json'), 'w') as f:
+            json.dump(info, f, indent=4)
+        np.memmap(osp.join(path, 'heatmaps.f16'), dtype=np.float16, mode='w+', shape=tuple(info['heatmaps_shape']))
+        if attention_shape:
+            np.memmap(osp.join(path, 'attention.f16'), dtype=np.float16, mode='w+',
+                      shape=tuple(info['attention_shape']))
+        np.save(osp.join(path, 'centers.npy'), np.zeros((num_samples, 2), dtype=np.float32))
+        np.save(osp.join(path, 'scales.npy'), np.zeros((num_samples, 2), dtype=np.float32))
+        return cls(path, mode='r+')
+
+    def write(self, start, heatmaps, centers, scales, attention=None):
+        """Store the teacher outputs of samples start .. start + len(heatmaps) - 1."""
+        end = start + len(heatmaps)
+        self.heatmaps[start:end] = heatmaps
+        self.centers[start:end] = centers
+        self.scales[start:end] = scales
+        if attention is not None:
+            self.attention[start:end] = attention
+
+    def flush(self):
+        for array in (self.heatmaps, self.attention, self.centers, self.scales):
+            if array is not None:
+                array.flush()
+
+    def targets(self, index, meta, heatmap_size, flip_pairs):
+        """Teacher maps of sample `index`, warped onto the (augmented) student crop described by `meta`.
+
+        Args:
+            meta (dict): Student sample meta: center, scale, rotation, flipped, image_width.
+            heatmap_size (tuple): (width, height) of the student heatmaps.
+            flip_pairs (list): Left / right joint pairs swapped by a horizontal flip.
+
+        Returns:
+            dict: 'teacher_heatmaps' float32 [K, H, W] and, if the store has attention maps, 'teacher_attention'
+                float32 [H / 4, W / 4] (channel mean of the squared features, on the student token grid).
+        """
+        center, scale = self.centers[index], self.scales[index]
+        heatmaps = self._warp(self.heatmaps[index], center, scale, self.heatmap_size, meta, heatmap_size)
+        if meta['flipped']:
+            for a, b in flip_pairs:
+                heatmaps[[a, b]] = heatmaps[[b, a]]
+        targets = {'teacher_heatmaps': heatmaps}
+
+        if self.attention is not None:
+            attention = self.attention[index]
+            grid_size = (attention.shape[2], attention.shape[1])
+            student_grid = (int(heatmap_size[0]) // 4, int(heatmap_size[1]) // 4)
+            targets['teacher_attention'] = self._warp(attention, center, scale, grid_size, meta, student_grid)[0]
+        return targets
+
+    @staticmethod
+    def _warp(maps, center, scale, size, meta, output_size):
+        # teacher map -> image, (mirror), image -> student map
+        to_image = np.vstack([get_affine_transform(center, scale, 0, size, inv=1), [0, 0, 1]])
+        to_student = np.vstack([get_affine_transform(np.asarray(meta['center'], dtype=np.float32),
+                                                     np.asarray(meta['scale'], dtype=np.float32),
+                                                     float(meta['rotation']), output_size), [0, 0, 1]])
+        if meta['flipped']:
+            mirror = np.array([[-1, 0, meta['image_width'] - 1], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+            to_image = mirror @ to_image
+        trans = to_student @ to_image
+        maps = np.ascontiguousarray(np.asarray(maps, dtype=np.float32).transpose(1, 2, 0))
+        warped = cv2.warpAffine(maps, trans[:2], (int(output_size[0]), int(output_size[1])), flags=cv2.INTER_LINEAR)
+        if warped.ndim == 2:
+            warped = warped[:, :, None]
+        return warped.transpose(2, 0, 1).copy()
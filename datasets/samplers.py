@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Locality-aware samplers (TRAIN.SAMPLER, VAL.SAMPLER).
+
+A window reads the frames around its center frame, so the samples of one video chunk share most of
+their frames. With plain shuffling consecutive samples come from random videos, and neither the page
+cache nor the decoded-frame cache (datasets/process/frame_cache.py) is reused. VideoBlockSampler
+shuffles (video, chunk of frames) blocks instead of samples, and reads several blocks at once,
+round robin, so that a batch still mixes several videos while the frames in use at any time stay
+few. VideoSequentialSampler reads the samples in video and frame order, for evaluation.
+"""
+import os.path as osp
+from collections import defaultdict
+
+import torch
+from torch.utils.data import Sampler
+
+
+def sample_locations(data):
+    """(video, frame index) of each data item: the image folder and the number in the file name."""
+    locations = []
+    for item in data:
+        video, name = osp.split(item['image'])
+        try:
+            frame = int(osp.splitext(name)[0])
+        except ValueError:
+            frame = int(item.get('frame_id', 0))
+        locations.append((video, frame))
+    return locations
+
+
+class VideoBlockSampler(Sampler):
+    """Shuffle blocks of `block_frames` consecutive frames of a video, read `interleave` blocks at a time.
+
+    Within a block the samples are in frame order, all the persons of a frame next to each other.
+    Each batch of `interleave` consecutive samples therefore comes from `interleave` different blocks
+    (usually different videos), and the frames of a block are all used within about
+    (block samples) batches. The order is seeded with seed + epoch: call set_epoch before every epoch,
+    as for DistributedSampler, to change it.
+    """
+
+    def __init__(self, data, block_frames=8, interleave=16, seed=0):
+        self.block_frames = block_frames
+        self.interleave = max(interleave, 1)
+        self.seed = seed
+        self.epoch = 0
+        blocks = defaultdict(list)
+        for index, (video, frame) in enumerate(sample_locations(data)):
+            blocks[(video, frame // block_frames)].append((frame, index))
+        self.blocks = [[index for _, index in sorted(samples)] for _, samples in sorted(blocks.items())]
+        self.num_samples = len(data)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        order = torch.randperm(len(self.blocks), generator=generator).tolist()
+
+        pending = iter(order)
+        active = []
+        for block in pending:
+            active.append(iter(self.blocks[block]))
+            if len(active) == self.interleave:
+                break
+        while active:
+            # one sample of every active block, a finished block is replaced by the next one
+            for i in range(len(active)):
+                index = next(active[i], None)
+                while index is None:
+                    block = next(pending, None)
+                    if block is None:
+                        break
+                    active[i] = iter(self.blocks[block])
+                    index = next(active[i], None)
+                if index is None:
+                    active[i] = None
+                    continue
+                yield index
+            active = [samples for samples in active if samples is not None]
+
+    def __len__(self):
+        return self.num_samples
+
+
+class VideoSequentialSampler(Sampler):
+    """All the samples of a video in frame order, one video after the other."""
+
+    def __init__(self, data):
+        locations = sample_locations(data)
+        self.order = sorted(range(len(data)), key=lambda index: (locations[index], index))
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+
+def build_train_sampler(cfg, dataset):
+    """Sampler of TRAIN.SAMPLER for the training DataLoader, None for plain shuffling ('random')."""
+    if cfg.TRAIN.SAMPLER == 'random':
+        return None
+    if cfg.TRAIN.SAMPLER == 'video_block':
+        return VideoBlockSampler(dataset.data, block_frames=cfg.TRAIN.SAMPLER_BLOCK_FRAMES,
+                                 interleave=cfg.TRAIN.SAMPLER_INTERLEAVE or cfg.TRAIN.BATCH_SIZE, seed=cfg.SEED)
+    raise ValueError(f"Unknown training sampler: {cfg.TRAIN.SAMPLER}")
+
+
+def build_val_sampler(cfg, dataset):
+    """Sampler of VAL.SAMPLER for the validation DataLoader, None for the dataset order ('default')."""
+    if cfg.VAL.SAMPLER == 'default':
+        return None
+    if cfg.VAL.SAMPLER == 'video':
+        return VideoSequentialSampler(dataset.data)
+    raise ValueError(f"Unknown validation sampler: {cfg.VAL.SAMPLER}")
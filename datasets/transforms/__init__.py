@@ -2,3 +2,4 @@
 # -*- coding:utf8 -*-
 
 from .build import build_transforms, reverse_transforms
+from .device import device_transforms, canvas_size, canvas_transform
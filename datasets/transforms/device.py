@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Crop augmentation on the training device (TRAIN.DEVICE_AUGMENTATION).
+
+The DataLoader workers otherwise warp every frame to the crop and normalize it, and ship float32
+[T, 3, H, W] windows. With device augmentation they ship uint8 canvases instead: the frame region
+around the crop, at the crop's pixel density, without its rotation or flip (canvas_transform). The
+rotation and flip of each sample travel as an affine_grid theta (meta['crop_theta']), and
+device_transforms warps and normalizes the whole batch at once on the device.
+"""
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .build import mean, std
+
+
+def canvas_size(image_size, max_rotation=0):
+    """(width, height) of the canvas holding the crop image_size rotated by up to max_rotation degrees.
+
+    Each side has the parity of the crop side, so an unrotated crop is an integer shift of the canvas.
+    """
+    width, height = int(image_size[0]), int(image_size[1])
+    angles = np.radians(np.linspace(0, min(abs(max_rotation), 90), 91))
+    box_width = np.max(width * np.abs(np.cos(angles)) + height * np.abs(np.sin(angles)))
+    box_height = np.max(width * np.abs(np.sin(angles)) + height * np.abs(np.cos(angles)))
+    return (width + 2 * math.ceil((box_width - width) / 2 - 1e-6),
+            height + 2 * math.ceil((box_height - height) / 2 - 1e-6))
+
+
+def _normalized(width, height):
+    # pixel coordinates -> affine_grid coordinates (align_corners=False)
+    return np.array([[2 / width, 0, 1 / width - 1], [0, 2 / height, 1 / height - 1], [0, 0, 1]])
+
+
+def canvas_transform(crop_trans, image_size, canvas):
+    """Canvas of the crop crop_trans (2x3 or 3x3 affine image -> crop, a similarity possibly mirrored).
+
+    Returns:
+        np.ndarray: 3x3 affine image -> canvas: the crop center at the canvas center, same scale, no rotation.
+        np.ndarray: 2x3 affine_grid theta sampling the crop from the canvas (device_transforms).
+    """
+    crop_trans = np.vstack([crop_trans[:2], [0, 0, 1]])
+    scale = np.sqrt(abs(np.linalg.det(crop_trans[:2, :2])))
+    center = np.linalg.solve(crop_trans, [image_size[0] / 2, image_size[1] / 2, 1])
+    image_to_canvas = np.array([[scale, 0, canvas[0] / 2 - scale * center[0]],
+                                [0, scale, canvas[1] / 2 - scale * center[1]],
+                                [0, 0, 1]])
+    crop_to_canvas = image_to_canvas @ np.linalg.inv(crop_trans)
+    theta = _normalized(*canvas) @ crop_to_canvas @ np.linalg.inv(_normalized(image_size[0], image_size[1]))
+    return image_to_canvas, theta[:2].astype(np.float32)
+
+
+def device_transforms(x, theta, image_size):
+    """Warp and normalize uint8 canvases on their device.
+
+    Args:
+        x (torch.Tensor): uint8 canvases [B, T, Hc, Wc, 3] of the dataset.
+        theta (torch.Tensor): Crop of each sample in its canvases [B, 2, 3] (meta['crop_theta']).
+        image_size (tuple): (width, height) of the crops.
+
+    Returns:
+        torch.Tensor: Normalized crops [B, T, 3, H, W], as the dataset transforms.
+    """
+    batch_size, num_frames, canvas_height, canvas_width, channels = x.shape
+    frames = x.permute(0, 1, 4, 2, 3).reshape(batch_size * num_frames, channels, canvas_height, canvas_width)
+    frames = frames.float().div_(255)
+    theta = theta.to(device=frames.device, dtype=frames.dtype).repeat_interleave(num_frames, dim=0)
+    output_size = (batch_size * num_frames, channels, int(image_size[1]), int(image_size[0]))
+    grid = F.affine_grid(theta, output_size, align_corners=False)
+    crops = F.grid_sample(frames, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+    crops.sub_(torch.tensor(mean, device=crops.device).view(1, -1, 1, 1))
+    crops.div_(torch.tensor(std, device=crops.device).view(1, -1, 1, 1))
+    return crops.view(batch_size, num_frames, channels, int(image_size[1]), int(image_size[0]))
@@ -7,6 +7,7 @@ import os.path as osp
 import torch
 import copy
 import random
+import multiprocessing as mp
 import cv2
 from pycocotools.coco import COCO
 import logging
@@ -18,13 +19,14 @@ from .posetrack_utils.posetrack_utils import video2filenames
 from .posetrack_utils.poseval.py import evaluate_simple
 from utils.utils_json import read_json_from_file, write_json_to_file
 from utils.utils_bbox import box2cs
-from utils.utils_image import read_image, read_image_pil, read_images_parallel
+from utils.utils_image import read_image, read_image_pil, read_images_parallel, read_files_parallel, jpeg_size, \
+    read_jpeg_regions_parallel, JPEG_SCALE_DENOMS
 from utils.utils_folder import create_folder
 from utils.utils_registry import DATASET_REGISTRY
-from datasets.process import get_affine_transform, fliplr_joints, exec_affine_transform, generate_heatmaps, half_body_transform, \
+from datasets.process import TeacherStore, SharedFrameCache, FrameStore, get_affine_transform, fliplr_joints, exec_affine_transform, generate_heatmaps, half_body_transform, \
     convert_data_to_annorect_struct
 
-from datasets.transforms import build_transforms
+from datasets.transforms import build_transforms, canvas_size, canvas_transform
 from datasets.zoo.base import VideoDataset
 
 from utils.common import TRAIN_PHASE, VAL_PHASE, TEST_PHASE
@@ -81,6 +83,7 @@ class PoseTrack(VideoDataset):
         self.previous_distance = cfg.PREVIOUS_DISTANCE
         self.next_distance = cfg.NEXT_DISTANCE
         self.window_size = cfg.WINDOWS_SIZE
+        self.window_mode = cfg.MODEL.WINDOW_MODE
 
         self.random_aux_frame = cfg.DATASET.RANDOM_AUX_FRAME
 
@@ -119,6 +122,39 @@ class PoseTrack(VideoDataset):
 
         self.data = self._list_data()
 
+        # precomputed teacher predictions for distillation (tools/precompute_teacher.py)
+        self.teacher_store = None
+        if self.train and cfg.DISTILL.ENABLED:
+            self.teacher_store = TeacherStore(cfg.DISTILL.TEACHER_STORE)
+            if self.teacher_store.num_samples != len(self.data):
+                raise ValueError(f"Teacher store has {self.teacher_store.num_samples} samples, "
+                                 f"the training set {len(self.data)}")
+
+        # start method of the DataLoader workers (multiprocessing_context of the loaders), shared by the cache lock
+        self.multiprocessing_context = mp.get_context(cfg.WORKERS_START_METHOD or mp.get_start_method())
+
+        # decoded frames shared by the DataLoader workers, reused by the overlapping windows (training only)
+        self.frame_cache = None
+        if self.train and cfg.DATASET.FRAME_CACHE_GB > 0:
+            self.frame_cache = SharedFrameCache(int(cfg.DATASET.FRAME_CACHE_GB * 2 ** 30),
+                                                max_frame_size=cfg.DATASET.FRAME_CACHE_MAX_SIZE,
+                                                mp_context=self.multiprocessing_context)
+
+        # frames packed by tools/pack_frames.py instead of the image files
+        self.frame_store = None
+        frame_store = cfg.DATASET.FRAME_STORE if self.phase == TRAIN_PHASE else cfg.DATASET.TEST_FRAME_STORE
+        if frame_store:
+            self.frame_store = FrameStore(frame_store, self.img_dir)
+            if self.frame_store.downscaled and cfg.TRAIN.MOTION_AUGMENTATION:
+                raise ValueError("Motion augmentation needs frames at image resolution, pack the frame store "
+                                 "without --max_size")
+
+        # decode only the region of the frames under the crop
+        self.roi_decode = cfg.DATASET.ROI_DECODE
+        if self.roi_decode and (self.image_format != 'jpg' or self.frame_store is not None or self.frame_cache is not None):
+            raise ValueError("DATASET.ROI_DECODE decodes the jpg image files, it cannot be combined with a frame store "
+                             "or the frame cache")
+
         self.model_input_type = cfg.DATASET.INPUT_TYPE
 
         self.show_data_parameters()
@@ -126,6 +162,13 @@ class PoseTrack(VideoDataset):
 
         self.motion_augmentation = cfg.TRAIN.MOTION_AUGMENTATION
 
+        # training windows as uint8 canvases, warped and normalized on the device (datasets/transforms/device.py)
+        self.device_augmentation = self.train and cfg.TRAIN.DEVICE_AUGMENTATION
+        if self.device_augmentation:
+            if self.motion_augmentation:
+                raise ValueError("TRAIN.DEVICE_AUGMENTATION does not support TRAIN.MOTION_AUGMENTATION")
+            self.canvas_size = canvas_size(self.image_size, 2 * self.rotation_factor)
+
         print("motion_augmentation: ", self.motion_augmentation)
 
         #CID
@@ -150,9 +193,13 @@ class PoseTrack(VideoDataset):
             return self._get_single_frame(data_item)
         elif self.model_input_type == 'spatiotemporal_window':
             if self.motion_augmentation:
-                return self._get_spatiotemporal_window_multi_aug(data_item)
+                x, meta, target_heatmaps, target_heatmaps_weight = self._get_spatiotemporal_window_multi_aug(data_item)
             else:
-                return self._get_spatiotemporal_window_multi(data_item)
+                x, meta, target_heatmaps, target_heatmaps_weight = self._get_spatiotemporal_window_multi(data_item)
+
+            if self.teacher_store is not None:
+                meta.update(self.teacher_store.targets(item_index, meta, self.heatmap_size, self.flip_pairs))
+            return x, meta, target_heatmaps, target_heatmaps_weight
 
     def _get_spatiotemporal_window(self, data_item):
 
@@ -395,6 +442,86 @@ class PoseTrack(VideoDataset):
 
         #return input_prev, input_x, input_next, meta, target_heatmaps, target_heatmaps_weight
     
+    def _read_frames(self, image_files, format='jpg'):
+        """Decoded frames of image_files, from the frame store or the image files, through the shared frame
+        cache when DATASET.FRAME_CACHE_GB > 0."""
+        decode = partial(read_images_parallel, format=format)
+        if self.frame_store is not None:
+            if self.frame_store.mode == 'raw':
+                return [np.array(frame) for frame in self.frame_store.read(image_files)[0]]
+            decode = lambda files: self.frame_store.read(files)[0]
+        if self.frame_cache is None:
+            return decode(image_files)
+        return self.frame_cache.read(image_files, decode)
+
+    def _read_window(self, image_files, format='jpg'):
+        """Frames of a window for _frame_transform.
+
+        Returns:
+            list of np.ndarray: Frames, possibly smaller than the images (downscaled frame store).
+            np.ndarray: 3x3 affine from image to frame pixels, None for frames at image resolution.
+            int: Width of the images.
+        """
+        if self.frame_store is not None and self.frame_store.mode == 'raw':
+            # views of the memory-mapped frames, read by the warp without a copy
+            frames, to_frame, (image_width, _) = self.frame_store.read(image_files)
+            return frames, to_frame, image_width
+        frames = self._read_frames(image_files, format)
+        return frames, None, frames[len(frames) // 2].shape[1]
+
+    def _read_window_region(self, jpeg_bufs, trans, flipped, image_size):
+        """Decode only the region of each frame sampled by the crop `trans`, scaled in the DCT domain by the
+        largest factor keeping at least one decoded pixel per crop pixel (DATASET.ROI_DECODE).
+
+        Returns:
+            list of np.ndarray: Decoded regions of the frames (frames of a video have the same size).
+            np.ndarray: 3x3 affine from image to region pixels, for _frame_transform.
+        """
+        image_trans = self._frame_transform(trans, flipped, image_size[0])
+        # image pixels per crop pixel, the same along both axes (similarity)
+        step = 1 / np.sqrt(abs(np.linalg.det(image_trans[:, :2])))
+        scale_denom = max(denom for denom in JPEG_SCALE_DENOMS if denom <= max(step, 1))
+
+        # image box of the crop, with room for the bilinear neighbours and the chroma upsampling at its border
+        crop_width, crop_height = int(self.image_size[0]), int(self.image_size[1])
+        corners = np.array([[0, 0, 1], [crop_width, 0, 1], [0, crop_height, 1], [crop_width, crop_height, 1]])
+        corners = corners @ cv2.invertAffineTransform(image_trans).T
+        margin = 2 * scale_denom + 16
+        x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int) - margin, 0)
+        x1, y1 = np.minimum(np.ceil(corners.max(axis=0)).astype(int) + margin, image_size)
+        region = (int(x0), int(y0), int(x1), int(y1)) if x0 < x1 and y0 < y1 else None
+
+        decoded = read_jpeg_regions_parallel(jpeg_bufs, region, scale_denom)
+        origin_x, origin_y = decoded[len(decoded) // 2][1]
+        to_frame = np.array([[1 / scale_denom, 0, (0.5 - origin_x) / scale_denom - 0.5],
+                             [0, 1 / scale_denom, (0.5 - origin_y) / scale_denom - 0.5],
+                             [0, 0, 1]])
+        return [frame for frame, _ in decoded], to_frame
+
+    @staticmethod
+    def _frame_transform(trans, flipped, image_width, to_frame=None):
+        """Affine warping a frame of _read_window to the crop of `trans` (image -> crop).
+
+        A horizontal flip of the image is folded into the transform instead of flipping the pixels.
+        """
+        frame_trans = np.vstack([trans, [0, 0, 1]])
+        if flipped:
+            frame_trans = frame_trans @ np.array([[-1, 0, image_width - 1], [0, 1, 0], [0, 0, 1]])
+        if to_frame is not None:
+            frame_trans = frame_trans @ np.linalg.inv(to_frame)
+        return frame_trans[:2]
+
+    def _window_bounds(self, current_idx):
+        """First and last frame index of the temporal window of current_idx.
+
+        'centered' windows have the current frame in the middle, 'past' windows end at the current
+        frame so that the context only contains past frames (causal / streaming inference).
+        """
+        if self.window_mode == 'past':
+            return current_idx - (self.window_size - 1), current_idx
+        half_window = self.window_size // 2
+        return current_idx - half_window, current_idx + half_window
+
     def _get_spatiotemporal_window_multi_aug(self, data_item):
 
         #print("Using motion augmentation")
@@ -408,11 +535,10 @@ class PoseTrack(VideoDataset):
         current_idx = int(osp.basename(image_file_path).replace('.jpg', ''))
 
         # Calculate indices for the temporal window
-        half_window = self.window_size // 2
+        start_idx, end_idx = self._window_bounds(current_idx)
 
         if self.train:
-            start_idx = current_idx - half_window
-            end_idx = min(current_idx + half_window, 10000)
+            end_idx = min(end_idx, 10000)
 
             # Generate list of image files for the temporal window
             image_files = [
@@ -420,9 +546,6 @@ class PoseTrack(VideoDataset):
                 for i in range(start_idx, end_idx + 1)
             ]
         else:
-            start_idx = current_idx - half_window
-            end_idx = current_idx + half_window
-
             image_files = []
             for i in range(start_idx, end_idx + 1):
                 if i < 0:
@@ -434,7 +557,7 @@ class PoseTrack(VideoDataset):
 
 
         # Read images in parallel
-        data_numpy_list = read_images_parallel(image_files)
+        data_numpy_list = self._read_frames(image_files)
 
         # Check if any image failed to load
         if any(img is None for img in data_numpy_list):
@@ -476,7 +599,8 @@ class PoseTrack(VideoDataset):
         if self.train:
             # Temporal Augmentation: Time Reversal
             time_reversal_prob = 0.3  # Probability of reversing frames
-            if random.random() < time_reversal_prob:
+            # not for past windows: the query frame has to stay the last one
+            if self.window_mode == 'centered' and random.random() < time_reversal_prob:
                 data_numpy_list = data_numpy_list[::-1]
                 # Update central frame after reversal
                 central_frame_idx = len(data_numpy_list) // 2
@@ -526,6 +650,7 @@ class PoseTrack(VideoDataset):
         scale = data_item["scale"]
         score = data_item.get('score', 1)
         r = 0
+        flipped = False
 
         if self.train:
             if (np.sum(joints_vis[:, 0]) > self.num_joints_half_body and np.random.rand() < self.prob_half_body):
@@ -547,6 +672,7 @@ class PoseTrack(VideoDataset):
 
                 joints, joints_vis = fliplr_joints(joints, joints_vis, central_frame.shape[1], self.flip_pairs)
                 center[0] = central_frame.shape[1] - center[0] - 1
+                flipped = True
 
         # Apply affine transform to all images in the window
         trans = get_affine_transform(center, scale, r, self.image_size)
@@ -589,6 +715,8 @@ class PoseTrack(VideoDataset):
             'scale': scale,
             'rotation': r,
             'score': score,
+            'flipped': flipped,
+            'image_width': central_frame.shape[1],
         }
 
         # Stack input images
@@ -611,11 +739,10 @@ class PoseTrack(VideoDataset):
             current_idx = int(osp.basename(image_file_path).replace('.png', ''))
 
         # Calculate indices for the temporal window
-        half_window = self.window_size // 2
+        start_idx, end_idx = self._window_bounds(current_idx)
 
         if self.train:
-            start_idx = current_idx - half_window
-            end_idx = min(current_idx + half_window, 10000)
+            end_idx = min(end_idx, 10000)
 
             # Generate list of image files for the temporal window
             image_files = [
@@ -634,9 +761,6 @@ class PoseTrack(VideoDataset):
                         image_files.append(osp.join(osp.dirname(image_file_path), f"{str(i).zfill(zero_fill)}.{self.image_format}"))
 
         else:
-            start_idx = current_idx - half_window
-            end_idx = current_idx + half_window
-
             if self.dataset_name == 'jhmdb':
                 image_files = []
                 for i in range(start_idx, end_idx + 1):
@@ -657,22 +781,20 @@ class PoseTrack(VideoDataset):
                     else:
                         image_files.append(osp.join(osp.dirname(image_file_path), f"{str(i).zfill(zero_fill)}.{self.image_format}"))
 
-        if self.image_format == 'jpg':
+        if self.roi_decode:
+            # the frames are decoded once the crop is known (_read_window_region)
+            jpeg_bufs = read_files_parallel(image_files)
+            image_width, image_height = jpeg_size(jpeg_bufs[len(jpeg_bufs) // 2])
+        else:
             # Read images in parallel
-            data_numpy_list = read_images_parallel(image_files)
+            data_numpy_list, to_frame, image_width = self._read_window(image_files, format=self.image_format)
 
-        elif self.image_format == 'png':
-            data_numpy_list = read_images_parallel(image_files, format='png')
-
-        # Check if any image failed to load
-        if any(img is None for img in data_numpy_list):
-            error_files = [file for file, img in zip(image_files, data_numpy_list) if img is None]
-            for file in error_files:
-                self.logger.error(f"Failed to read {file}")
-            raise ValueError(f"Failed to read one or more images")
-
-        # Get the central frame
-        central_frame = data_numpy_list[len(data_numpy_list) // 2]
+            # Check if any image failed to load
+            if any(img is None for img in data_numpy_list):
+                error_files = [file for file, img in zip(image_files, data_numpy_list) if img is None]
+                for file in error_files:
+                    self.logger.error(f"Failed to read {file}")
+                raise ValueError(f"Failed to read one or more images")
 
         # Rest of the processing (joints, center, scale, etc.)
         joints = data_item['joints_3d']
@@ -681,6 +803,7 @@ class PoseTrack(VideoDataset):
         scale = data_item["scale"]
         score = data_item.get('score', 1)
         r = 0
+        flipped = False
 
         if self.train:
             if (np.sum(joints_vis[:, 0]) > self.num_joints_half_body and np.random.rand() < self.prob_half_body):
@@ -698,20 +821,33 @@ class PoseTrack(VideoDataset):
                 if random.random() <= 0.6 else 0
 
             if self.flip and random.random() <= 0.5:
-                data_numpy_list = [img[:, ::-1, :] for img in data_numpy_list]
-
-                joints, joints_vis = fliplr_joints(joints, joints_vis, central_frame.shape[1], self.flip_pairs)
-                center[0] = central_frame.shape[1] - center[0] - 1
+                # the frames are mirrored by the warp below (_frame_transform)
+                joints, joints_vis = fliplr_joints(joints, joints_vis, image_width, self.flip_pairs)
+                center[0] = image_width - center[0] - 1
+                flipped = True
 
         # Apply affine transform to all images in the window
         trans = get_affine_transform(center, scale, r, self.image_size)
-        input_images = [
-            cv2.warpAffine(img, trans, (int(self.image_size[0]), int(self.image_size[1])), flags=cv2.INTER_LINEAR)
-            for img in data_numpy_list
-        ]
+        if self.roi_decode:
+            data_numpy_list, to_frame = self._read_window_region(jpeg_bufs, trans, flipped, (image_width, image_height))
+        if self.device_augmentation:
+            # the region of the crop, unrotated and unflipped: the crop itself is taken by device_transforms
+            image_to_canvas, crop_theta = canvas_transform(self._frame_transform(trans, flipped, image_width),
+                                                           self.image_size, self.canvas_size)
+            frame_trans = image_to_canvas if to_frame is None else image_to_canvas @ np.linalg.inv(to_frame)
+            input_images = [
+                torch.from_numpy(cv2.warpAffine(img, frame_trans[:2], self.canvas_size, flags=cv2.INTER_LINEAR))
+                for img in data_numpy_list
+            ]
+        else:
+            frame_trans = self._frame_transform(trans, flipped, image_width, to_frame)
+            input_images = [
+                cv2.warpAffine(img, frame_trans, (int(self.image_size[0]), int(self.image_size[1])), flags=cv2.INTER_LINEAR)
+                for img in data_numpy_list
+            ]
 
-        if self.transform:
-            input_images = [self.transform(img) for img in input_images]
+            if self.transform:
+                input_images = [self.transform(img) for img in input_images]
 
         # Joint transform and visibility check
         for i in range(self.num_joints):
@@ -744,7 +880,11 @@ class PoseTrack(VideoDataset):
             'scale': scale,
             'rotation': r,
             'score': score,
+            'flipped': flipped,
+            'image_width': image_width,
         }
+        if self.device_augmentation:
+            meta['crop_theta'] = torch.from_numpy(crop_theta)
 
         # Stack input images
         x = torch.stack(input_images, dim=0)
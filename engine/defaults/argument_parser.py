@@ -18,6 +18,10 @@ def default_parse_args():
     parser.add_argument('--test', action='store_true', default=False)
     parser.add_argument('--root_dir', type=str, default='../')
     parser.add_argument('--weights_path', type=str, default=None)
+    parser.add_argument('--compile', action='store_true', default=False,
+                        help='torch.compile the model for validation, warmed up for the val batch sizes')
+    parser.add_argument('--compile_report', action='store_true', default=False,
+                        help='with --compile, print compile time and eager / compiled latency')
     parser.add_argument('opts',
                         help="Modify config options using the command-line",
                         default=None,
@@ -5,8 +5,10 @@ Poseidon multi-frame inference
 ------------------------------
 """
 import argparse
+import contextlib
 import os
 import random
+import time
 
 import cv2
 import numpy as np
@@ -15,7 +17,14 @@ import yaml
 from torchvision import transforms
 from ultralytics import YOLO
 import json
-from models.best.Poseidon import Poseidon
+from collections import OrderedDict
+from models.best.Poseidon import simcc_decode
+from models.best.artifact import load_checkpoint, load_poseidon
+from models.best.onnx_backend import OnnxPoseidon
+from models.best.quantization import is_quantized_checkpoint
+from models.best.compiled import compile_poseidon
+from models.best.cpu_profile import cpu_profile_from_config
+from models.best.incremental import IncrementalEncoder
 from datasets.zoo.posetrack.pose_skeleton import (
     PoseTrack_Official_Keypoint_Ordering,
     PoseTrack_Keypoint_Pairs,
@@ -40,6 +49,10 @@ MAPPED_KP_NAMES = [
     'right_ankle'
 ]
 USED_KP_IDX = [0, 2, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16]
+# Person batches are split in chunks of at most BATCH_BUCKETS[-1] and, with
+# --pad_buckets, zero-padded to the next bucket so the model only ever sees
+# these batch sizes.
+BATCH_BUCKETS = (1, 2, 4, 8, 16)
 USED_KP_COLORS = [
     (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0),
     (0, 255, 255), (255, 0, 255), (192, 192, 192), (128, 0, 128),
@@ -86,7 +99,9 @@ def set_seed(seed: int = 42):
 def parse_args():
     p = argparse.ArgumentParser("Poseidon multi-frame inference")
     p.add_argument("-c", "--config", required=True, help="path to YAML config")
-    p.add_argument("-w", "--weights", required=True, help=".pt checkpoint")
+    p.add_argument("-w", "--weights", required=True,
+                   help=".pt checkpoint, exported Poseidon artifact or, with "
+                        "--backend onnxruntime, exported .onnx graph")
     p.add_argument("-i", "--video_in", required=True, help="input video path")
     p.add_argument("-o", "--video_out", default="output.mp4",
                    help="where to write annotated video")
@@ -97,6 +112,49 @@ def parse_args():
     p.add_argument("--coco_json", default="sample/predictions.json",
                help="file to store COCO-format results")
     p.add_argument("-g", "--gpu", type=int, default=0, help="CUDA device index")
+    p.add_argument("--full_frame", action="store_true",
+                   help="crowded scenes: run the backbone once per full frame and pull "
+                        "each person's features with RoIAlign instead of encoding every crop")
+    p.add_argument("--frame_width", type=int, default=1024,
+                   help="width the frames are resized to with --full_frame (the height "
+                        "keeps the aspect ratio, both rounded to multiples of 16)")
+    p.add_argument("--causal", action="store_true",
+                   help="streaming mode: predict every frame as soon as it is read, "
+                        "with the previous frames of the window as context")
+    p.add_argument("--offline", action="store_true",
+                   help="track people over the whole video first, then encode "
+                        "each (frame, track) crop once and reuse it across windows")
+    p.add_argument("--cache_size", type=int, default=512,
+                   help="max number of cached (frame, track) features in --offline mode")
+    p.add_argument("--incremental_threshold", type=float, default=0.0,
+                   help="--offline, static cameras: recompute the early backbone tokens of "
+                        "a track's crop only for patches whose embedding changed by more "
+                        "than this (relative) since its previous frame (0 = off)")
+    p.add_argument("--incremental_depth", type=int, default=4,
+                   help="number of leading backbone layers reusing cached tokens with "
+                        "--incremental_threshold")
+    p.add_argument("--pad_buckets", action="store_true",
+                   help="pad every person batch to a fixed size in BATCH_BUCKETS "
+                        "so the model only sees static shapes")
+    p.add_argument("--compile", action="store_true",
+                   help="torch.compile the model and warm up every batch bucket "
+                        "(implies --pad_buckets)")
+    p.add_argument("--compile_report", action="store_true",
+                   help="with --compile, print compile time and eager / compiled "
+                        "latency per bucket")
+    p.add_argument("--backend", choices=["torch", "onnxruntime"], default="torch",
+                   help="run Poseidon eagerly in PyTorch, or run the graph exported by "
+                        "tools/export_onnx.py (-w model.onnx) with ONNX Runtime on the CPU")
+    p.add_argument("--ort_threads", type=int, default=0,
+                   help="ONNX Runtime intra-op threads (0 = one per physical core)")
+    p.add_argument("--ort_inter_threads", type=int, default=1,
+                   help="ONNX Runtime inter-op threads")
+    p.add_argument("--cpu_profile", action="store_true",
+                   help="CPU inference profile (also CPU.PROFILE in the config): bf16 autocast "
+                        "where supported, channels-last convolutions, pinned intra-op threads")
+    p.add_argument("--cpu_threads", type=int, default=None,
+                   help="with the CPU profile, intra-op threads (default CPU.NUM_THREADS, "
+                        "0 = one per physical core)")
     return p.parse_args()
 
 
@@ -119,10 +177,31 @@ def load_cfg(path: str):
     cfg.WINDOWS_SIZE = data["MODEL"].get("WINDOWS_SIZE", 5)
     cfg.MODEL.HEATMAP_SIZE = data["MODEL"].get("HEATMAP_SIZE", (96, 72))
     cfg.MODEL.FREEZE_WEIGHTS = data["MODEL"].get("FREEZE_WEIGHTS", False)
+    cfg.MODEL.ATTENTION_BACKEND = data["MODEL"].get("ATTENTION_BACKEND", "mha")
+    cfg.MODEL.LOCAL_ATTENTION_BLOCK = data["MODEL"].get("LOCAL_ATTENTION_BLOCK", 0)
+    cfg.MODEL.LOCAL_ATTENTION_HALO = data["MODEL"].get("LOCAL_ATTENTION_HALO", 2)
+    cfg.MODEL.FUSION_MODE = data["MODEL"].get("FUSION_MODE", "full")
+    cfg.MODEL.FRAME_SKIP_THRESHOLD = data["MODEL"].get("FRAME_SKIP_THRESHOLD", 0.0)
+    cfg.MODEL.FRAME_SKIP_TOPK = data["MODEL"].get("FRAME_SKIP_TOPK", 0)
+    cfg.MODEL.WINDOW_MODE = data["MODEL"].get("WINDOW_MODE", "centered")
+    cfg.MODEL.TOKEN_KEEP_RATIO = data["MODEL"].get("TOKEN_KEEP_RATIO", 1.0)
+    cfg.MODEL.TOKEN_PRUNE_LAYER = data["MODEL"].get("TOKEN_PRUNE_LAYER", 2)
+    cfg.MODEL.HEAD = data["MODEL"].get("HEAD", "heatmap")
+    cfg.MODEL.SIMCC_SPLIT_RATIO = data["MODEL"].get("SIMCC_SPLIT_RATIO", 2)
+    cfg.MODEL.SIGMA = data["MODEL"].get("SIGMA", 2)
+    cfg.MODEL.LEAN_INFERENCE = data["MODEL"].get("LEAN_INFERENCE", False)
 
     cfg.DATASET = C()
     cfg.DATASET.BBOX_ENLARGE_FACTOR = data["DATASET"].get(
         "BBOX_ENLARGE_FACTOR", 1.25)
+
+    cpu = data.get("CPU", {})
+    cfg.CPU = C()
+    cfg.CPU.PROFILE = cpu.get("PROFILE", False)
+    cfg.CPU.BF16 = cpu.get("BF16", True)
+    cfg.CPU.CHANNELS_LAST = cpu.get("CHANNELS_LAST", True)
+    cfg.CPU.NUM_THREADS = cpu.get("NUM_THREADS", 0)
+    cfg.CPU.PIN_THREADS = cpu.get("PIN_THREADS", True)
     return cfg
 
 
@@ -162,17 +241,218 @@ def preprocess_frame(frame, size):
     return tfm(frame)
 
 
-def extract_kps(heatmaps, h_crop, w_crop):
-    _, _, H, W = heatmaps.shape
-    hm = heatmaps[0, USED_KP_IDX].view(len(USED_KP_IDX), -1)
-    maxv, idx = hm.max(dim=1)
-    ys = (idx // W).float() * (h_crop / H)
-    xs = (idx % W).float() * (w_crop / W)
-    return torch.stack([xs, ys], dim=1).cpu().numpy()
+def extract_kps(heatmaps, h_crop, w_crop, cfg=None):
+    """
+    Argmax keypoints of a batch of heatmaps, scaled to each person's crop.
+
+    heatmaps: torch.Tensor([N, K, H, W]), or the [N, K, bins] logits of the SimCC head
+    (MODEL.HEAD 'simcc', decoded with the settings of cfg); h_crop, w_crop: array-like of N crop sizes.
+    Returns a [N, len(USED_KP_IDX), 2] numpy array of (x, y) in crop coordinates.
+    """
+    N = heatmaps.shape[0]
+    if heatmaps.dim() == 3:
+        W, H = cfg.MODEL.HEATMAP_SIZE
+        coords, _ = simcc_decode(heatmaps[:, USED_KP_IDX], cfg.MODEL.HEATMAP_SIZE, cfg.MODEL.SIMCC_SPLIT_RATIO,
+                                 cfg.MODEL.SIGMA)
+    else:
+        _, _, H, W = heatmaps.shape
+        hm = heatmaps[:, USED_KP_IDX].reshape(N, len(USED_KP_IDX), -1)
+        idx = hm.argmax(dim=2)
+        coords = torch.stack([idx % W, idx // W], dim=2).float()
+    crop_scale = torch.as_tensor(
+        np.stack([np.asarray(w_crop, dtype=np.float32) / W,
+                  np.asarray(h_crop, dtype=np.float32) / H], axis=-1),
+        device=heatmaps.device).view(N, 1, 2)
+    coords = coords * crop_scale
+    return coords.cpu().numpy()
+
+
+def bucket_size(n):
+    return next(b for b in BATCH_BUCKETS if b >= n)
+
+
+def run_batched(fn, inp, pad_buckets=False, autocast=contextlib.nullcontext):
+    """
+    Apply `fn` to `inp` ([N, ...]) in chunks of at most BATCH_BUCKETS[-1],
+    optionally zero-padding each chunk up to its bucket size, under `autocast`.
+    """
+    max_batch = BATCH_BUCKETS[-1]
+    outs = []
+    for start in range(0, inp.shape[0], max_batch):
+        chunk = inp[start:start + max_batch]
+        n = chunk.shape[0]
+        if pad_buckets and bucket_size(n) > n:
+            pad = chunk.new_zeros((bucket_size(n) - n, *chunk.shape[1:]))
+            chunk = torch.cat([chunk, pad])
+        with torch.no_grad(), autocast():
+            outs.append(fn(chunk)[:n])
+    return torch.cat(outs)
+
+
+class Throughput:
+    """Accumulates model time and number of persons to report persons/s."""
+
+    def __init__(self, device):
+        self.device = device
+        self.persons = 0
+        self.seconds = 0.0
+
+    def start(self):
+        self._sync()
+        self._t0 = time.perf_counter()
+
+    def stop(self, persons):
+        self._sync()
+        self.seconds += time.perf_counter() - self._t0
+        self.persons += persons
+
+    def _sync(self):
+        if str(self.device).startswith("cuda"):
+            torch.cuda.synchronize(self.device)
+
+    def report(self):
+        rate = self.persons / self.seconds if self.seconds > 0 else 0.0
+        print(f"✔ Poseidon throughput: {self.persons} persons in {self.seconds:.2f}s "
+              f"({rate:.1f} persons/s)")
+
+
+class FrameLatency:
+    """End-to-end latency of each output frame, from reading its query frame to writing it."""
+
+    def __init__(self):
+        self.seconds = []
+
+    def add(self, read_time):
+        self.seconds.append(time.perf_counter() - read_time)
+
+    def report(self, delay_frames):
+        if not self.seconds:
+            return
+        p50, p90, p99 = np.percentile(np.array(self.seconds) * 1000, [50, 90, 99])
+        print(f"✔ Per-frame latency over {len(self.seconds)} frames: p50 {p50:.1f} ms, "
+              f"p90 {p90:.1f} ms, p99 {p99:.1f} ms (query frame {delay_frames} frames "
+              f"behind the newest one)")
+
+
+def full_frame_size(W_img, H_img, width, multiple=16):
+    """(width, height) of the --full_frame backbone input: aspect ratio kept, multiples of the patch size."""
+    height = width * H_img / W_img
+    return (max(multiple, round(width / multiple) * multiple),
+            max(multiple, round(height / multiple) * multiple))
+
+
+def crop_box(xyxy, cfg, W_img, H_img):
+    """Enlarge a detector box and clip it to the image, returns (x1, y1, x2, y2)."""
+    x1, y1, x2, y2 = xyxy
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    w = (x2 - x1) * cfg.DATASET.BBOX_ENLARGE_FACTOR
+    h = (y2 - y1) * cfg.DATASET.BBOX_ENLARGE_FACTOR
+
+    x1c, y1c = int(max(cx - w / 2, 0)), int(max(cy - h / 2, 0))
+    x2c, y2c = int(min(cx + w / 2, W_img)), int(min(cy + h / 2, H_img))
+    return x1c, y1c, x2c, y2c
+
+
+def draw_pose(frame, kps, x1c, y1c):
+    # Create a mapping from keypoint names to their coordinates
+    kp_map = {
+        name: (int(kps[i][0]) + x1c, int(kps[i][1]) + y1c)
+        for i, name in enumerate(MAPPED_KP_NAMES)
+    }
+    if 'nose' in kp_map:
+        kp_map['head_bottom'] = kp_map['nose']
+
+    # Draw circles for each keypoint
+    for i, (px, py) in enumerate(kps):
+        color = USED_KP_COLORS[i]
+        cv2.circle(frame, (int(px) + x1c, int(py) + y1c), 2, color, -1)
+
+    # Draw lines to connect the keypoints
+    for kp1_name, kp2_name, _ in PoseTrack_Keypoint_Pairs:
+        if kp1_name in kp_map and kp2_name in kp_map:
+            pt1 = kp_map[kp1_name]
+            pt2 = kp_map[kp2_name]
+            cv2.line(frame, pt1, pt2, (0, 255, 0), 1)
+
+
+def make_annotation(ann_id, image_id, kps, x1c, y1c, w_crop, h_crop):
+    coco_keypoints = to_coco(kps)
+    # bbox = [x1, y1, width, height] as required by COCO
+    bbox = [float(x1c), float(y1c), float(w_crop), float(h_crop)]
+
+    return {
+        "id": ann_id,
+        "image_id": image_id,
+        "category_id": 1,           # person
+        "keypoints": coco_keypoints,
+        "num_keypoints": 14,
+        "bbox": bbox,
+        "area": float(w_crop*h_crop),
+        "iscrowd": 0
+    }
+
+
+def save_coco_json(path, annotations, num_images):
+    coco_dict = {
+        "info": {"description": "Poseidon predictions"},
+        "images": [
+            {"id": i, "file_name": f"frame_{i:06d}.jpg"}
+            for i in range(num_images)
+        ],
+        "annotations": annotations,
+        "categories": [
+            {
+                "id": 1,
+                "name": "person",
+                "keypoints": [
+                    "nose","left_eye","right_eye","left_ear","right_ear",
+                    "left_shoulder","right_shoulder","left_elbow","right_elbow",
+                    "left_wrist","right_wrist","left_hip","right_hip",
+                    "left_knee","right_knee","left_ankle","right_ankle"
+                ],
+                "skeleton": [
+                    [16, 14], [14, 12], [17, 15], [15, 13], [12, 13],
+                    [6, 8], [8, 10], [7, 9], [9, 11], [6, 7], [6, 12],
+                    [7, 13], [12, 13]
+                ]
+            }
+        ]
+    }
+    with open(path, "w") as f:
+        json.dump(coco_dict, f, indent=4)
+    print(f"✔ COCO file saved to {path}")
+
+
+class FeatureCache:
+    """
+    LRU cache of per-frame Poseidon features keyed by (frame_idx, track_id).
+    Once full, the least recently used entry is evicted, so with a capacity of
+    at least `window * step * max_tracks` every crop is encoded exactly once.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
 
 
 # ─────────────────────── Main loop ───────────────────────
-def process_video(model, detector, device, cfg, args):
+def process_video(model, detector, device, cfg, args, autocast=contextlib.nullcontext):
     cap = cv2.VideoCapture(args.video_in)
     if not cap.isOpened():
         raise RuntimeError(f"Could not open input video {args.video_in!r}")
@@ -186,117 +466,92 @@ def process_video(model, detector, device, cfg, args):
 
         out = make_writer(args.video_out, fps, (W_img, H_img))
 
+        throughput = Throughput(device)
+        latency = FrameLatency()
         annotations = []
         image_id = 0
         ann_id   = 0
         buf: list[np.ndarray] = []
+        read_times: list[float] = []
+        # causal: the newest frame is the query; otherwise the centre frame of window * step frames
+        span = (args.window - 1) * args.step + 1 if args.causal else args.window * args.step
+        query_idx = span - 1 if args.causal else (args.window // 2) * args.step
         while True:
             ok, frame = cap.read()
             if not ok:
                 break
             buf.append(frame)
+            read_times.append(time.perf_counter())
 
-            if len(buf) < args.window * args.step:
+            if args.causal and len(buf) < span:
+                # pad the start of the video with its first frame
+                buf = [buf[0]] * (span - len(buf)) + buf
+                read_times = [read_times[0]] * (span - len(read_times)) + read_times
+            elif len(buf) < span:
                 continue
 
             sampled = buf[::args.step]
-            center = sampled[len(sampled) // 2].copy()
-
-            # ── Human detection on the centre frame ──
-            dets = detector.predict(center, verbose=False)[0]
-            for box in dets.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                w = (x2 - x1) * cfg.DATASET.BBOX_ENLARGE_FACTOR
-                h = (y2 - y1) * cfg.DATASET.BBOX_ENLARGE_FACTOR
-
-                x1c, y1c = int(max(cx - w / 2, 0)), int(max(cy - h / 2, 0))
-                x2c, y2c = int(min(cx + w / 2, W_img)), int(min(cy + h / 2, H_img))
-                w_crop, h_crop = x2c - x1c, y2c - y1c
-
-                crops = [
-                    preprocess_frame(f[y1c:y2c, x1c:x2c], cfg.MODEL.IMAGE_SIZE)
-                    for f in sampled
-                ]
-                inp = torch.stack(crops).unsqueeze(0).to(device)
-
-                with torch.no_grad():
-                    hm = model(inp)
-
-                kps = extract_kps(hm, h_crop, w_crop)
-
-                # Create a mapping from keypoint names to their coordinates
-                kp_map = {
-                    name: (int(kps[i][0]) + x1c, int(kps[i][1]) + y1c)
-                    for i, name in enumerate(MAPPED_KP_NAMES)
-                }
-                if 'nose' in kp_map:
-                    kp_map['head_bottom'] = kp_map['nose']
-
-                # Draw circles for each keypoint
-                for i, (px, py) in enumerate(kps):
-                    color = USED_KP_COLORS[i]
-                    cv2.circle(center, (int(px) + x1c, int(py) + y1c), 2, color, -1)
-
-                # Draw lines to connect the keypoints
-                for kp1_name, kp2_name, _ in PoseTrack_Keypoint_Pairs:
-                    if kp1_name in kp_map and kp2_name in kp_map:
-                        pt1 = kp_map[kp1_name]
-                        pt2 = kp_map[kp2_name]
-                        cv2.line(center, pt1, pt2, (0, 255, 0), 1)
-                
-                # update json annotations
-                coco_keypoints = to_coco(kps)
-                # bbox = [x1, y1, width, height] as required by COCO
-                bbox = [float(x1c), float(y1c), float(w_crop), float(h_crop)]
-
-                annotations.append({
-                    "id": ann_id,
-                    "image_id": image_id,
-                    "category_id": 1,           # person
-                    "keypoints": coco_keypoints,
-                    "num_keypoints": 14,
-                    "bbox": bbox,
-                    "area": float(w_crop*h_crop),
-                    "iscrowd": 0
-                })
-                ann_id += 1
+            query = buf[query_idx].copy()
+
+            # ── Human detection on the query frame ──
+            dets = detector.predict(query, verbose=False)[0]
+            boxes = [crop_box(box.xyxy[0].cpu().numpy(), cfg, W_img, H_img) for box in dets.boxes]
+            if boxes:
+                if args.full_frame:
+                    # ── one backbone pass per frame, [N, T] person features via RoIAlign ──
+                    frame_size = full_frame_size(W_img, H_img, args.frame_width)
+                    inp = torch.stack([preprocess_frame(f, frame_size) for f in sampled]).to(device)
+                    sx, sy = frame_size[0] / W_img, frame_size[1] / H_img
+                    rois = torch.tensor([
+                        [t, x1c * sx, y1c * sy, x2c * sx, y2c * sy]
+                        for x1c, y1c, x2c, y2c in boxes
+                        for t in range(len(sampled))
+                    ], dtype=torch.float32)
+
+                    throughput.start()
+                    with torch.no_grad(), autocast():
+                        feats = model.encode_frames(inp, rois)
+                    feats = feats.view(len(boxes), len(sampled), *feats.shape[1:])
+                    hm = run_batched(model.decode, feats, args.pad_buckets, autocast)
+                    throughput.stop(len(boxes))
+                else:
+                    # ── all persons of the window in a single [N, T, C, H, W] batch ──
+                    inp = torch.stack([
+                        torch.stack([
+                            preprocess_frame(f[y1c:y2c, x1c:x2c], cfg.MODEL.IMAGE_SIZE)
+                            for f in sampled
+                        ])
+                        for x1c, y1c, x2c, y2c in boxes
+                    ]).to(device)
+
+                    throughput.start()
+                    hm = run_batched(model, inp, args.pad_buckets, autocast)
+                    throughput.stop(len(boxes))
+
+                boxes = np.array(boxes)
+                w_crops, h_crops = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+                all_kps = extract_kps(hm, h_crops, w_crops, cfg)
+
+                for (x1c, y1c, _, _), w_crop, h_crop, kps in zip(boxes, w_crops, h_crops, all_kps):
+                    draw_pose(query, kps, x1c, y1c)
+
+                    # update json annotations
+                    annotations.append(make_annotation(ann_id, image_id, kps, x1c, y1c, w_crop, h_crop))
+                    ann_id += 1
 
             # ── ensure frame size is still what we promised ──
-            assert center.shape[0] == H_img and center.shape[1] == W_img
+            assert query.shape[0] == H_img and query.shape[1] == W_img
 
-            out.write(center)
+            out.write(query)
+            latency.add(read_times[query_idx])
             image_id += 1
-            buf = buf[args.step:]
-
-        coco_dict = {
-            "info": {"description": "Poseidon predictions"},
-            "images": [
-                {"id": i, "file_name": f"frame_{i:06d}.jpg"}
-                for i in range(image_id)
-            ],
-            "annotations": annotations,
-            "categories": [
-                {
-                    "id": 1,
-                    "name": "person",
-                    "keypoints": [
-                        "nose","left_eye","right_eye","left_ear","right_ear",
-                        "left_shoulder","right_shoulder","left_elbow","right_elbow",
-                        "left_wrist","right_wrist","left_hip","right_hip",
-                        "left_knee","right_knee","left_ankle","right_ankle"
-                    ],
-                    "skeleton": [
-                        [16, 14], [14, 12], [17, 15], [15, 13], [12, 13],
-                        [6, 8], [8, 10], [7, 9], [9, 11], [6, 7], [6, 12],
-                        [7, 13], [12, 13]
-                    ]
-                }
-            ]
-        }
-        with open(args.coco_json, "w") as f:
-            json.dump(coco_dict, f, indent=4)
-        print(f"✔ COCO file saved to {args.coco_json}")
+            drop = 1 if args.causal else args.step
+            buf = buf[drop:]
+            read_times = read_times[drop:]
+
+        save_coco_json(args.coco_json, annotations, image_id)
+        throughput.report()
+        latency.report(span - 1 - query_idx)
         
     finally:
         cap.release()
@@ -306,6 +561,190 @@ def process_video(model, detector, device, cfg, args):
 
     print(f"✔ Finished writing annotated video to “{args.video_out}”")
     
+# ─────────────────────── Offline (tracked) mode ───────────────────────
+def track_video(detector, video_in):
+    """First pass: run the tracker on every frame, returns {frame_idx: {track_id: xyxy}}."""
+    cap = cv2.VideoCapture(video_in)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open input video {video_in!r}")
+
+    tracks = []
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            dets = detector.track(frame, persist=True, verbose=False)[0]
+            frame_tracks = {}
+            if dets.boxes.id is not None:
+                for tid, xyxy in zip(dets.boxes.id.int().tolist(), dets.boxes.xyxy.cpu().numpy()):
+                    frame_tracks[tid] = xyxy
+            tracks.append(frame_tracks)
+    finally:
+        cap.release()
+    return tracks
+
+
+def track_box(tracks, frame_idx, track_id):
+    """Box of `track_id` at `frame_idx`, or at the nearest frame where it was detected."""
+    if track_id in tracks[frame_idx]:
+        return tracks[frame_idx][track_id]
+    for d in range(1, len(tracks)):
+        for f in (frame_idx - d, frame_idx + d):
+            if 0 <= f < len(tracks) and track_id in tracks[f]:
+                return tracks[f][track_id]
+    raise KeyError(f"Track {track_id} never detected")
+
+
+def process_video_offline(model, detector, device, cfg, args, autocast=contextlib.nullcontext):
+    tracks = track_video(detector, args.video_in)
+    num_frames = len(tracks)
+    half = args.window // 2
+    cache = FeatureCache(args.cache_size)
+    incremental = None
+    if args.incremental_threshold > 0:
+        incremental = IncrementalEncoder(model, args.incremental_threshold, args.incremental_depth)
+
+    cap = cv2.VideoCapture(args.video_in)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open input video {args.video_in!r}")
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        W_img = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        H_img = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if W_img == 0 or H_img == 0:
+            raise RuntimeError("Failed to read frame dimensions from input video")
+
+        out = make_writer(args.video_out, fps, (W_img, H_img))
+
+        throughput = Throughput(device)
+        annotations = []
+        ann_id = 0
+        frames: dict[int, np.ndarray] = {}
+        next_read = 0
+        for t in range(num_frames):
+            # window frames, clamped at the video boundaries
+            idxs = [min(max(t + (k - half) * args.step, 0), num_frames - 1)
+                    for k in range(args.window)]
+
+            # keep only the frames the current window can still touch
+            while next_read <= idxs[-1]:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                frames[next_read] = frame
+                next_read += 1
+            for f in [f for f in frames if f < idxs[0]]:
+                del frames[f]
+
+            center = frames[t].copy()
+            track_ids = list(tracks[t].keys())
+
+            if track_ids:
+                throughput.start()
+
+                # ── encode every (frame, track) crop that is not cached yet ──
+                window_cache = {}
+                missing = []
+                for tid in track_ids:
+                    for f in idxs:
+                        key = (f, tid)
+                        if key in window_cache or key in missing:
+                            continue
+                        feat = cache.get(key)
+                        if feat is None:
+                            missing.append(key)
+                        else:
+                            window_cache[key] = feat
+
+                if missing:
+                    crops = []
+                    for f, tid in missing:
+                        x1c, y1c, x2c, y2c = crop_box(track_box(tracks, f, tid), cfg, W_img, H_img)
+                        crops.append(preprocess_frame(frames[f][y1c:y2c, x1c:x2c], cfg.MODEL.IMAGE_SIZE))
+                    crops = torch.stack(crops).to(device)
+                    if incremental is None:
+                        feats = run_batched(model.encode, crops, args.pad_buckets, autocast)
+                    else:
+                        # frame by frame, so each track's crop reuses the tokens of its previous frame
+                        order = sorted(range(len(missing)), key=lambda j: missing[j][0])
+                        missing = [missing[j] for j in order]
+                        crops = crops[order]
+                        with autocast():
+                            feats = torch.cat([
+                                incremental.encode(crops[[j for j, (f, _) in enumerate(missing) if f == frame]],
+                                                   [tid for f, tid in missing if f == frame])
+                                for frame in sorted({f for f, _ in missing})
+                            ])
+                    for key, feat in zip(missing, feats):
+                        cache.put(key, feat)
+                        window_cache[key] = feat
+
+                # ── decode all tracks of the window from cached features ──
+                window_feats = torch.stack([
+                    torch.stack([window_cache[(f, tid)] for f in idxs])
+                    for tid in track_ids
+                ])
+                hm = run_batched(model.decode, window_feats, args.pad_buckets, autocast)
+                throughput.stop(len(track_ids))
+
+                boxes = np.array([crop_box(tracks[t][tid], cfg, W_img, H_img) for tid in track_ids])
+                w_crops, h_crops = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+                all_kps = extract_kps(hm, h_crops, w_crops, cfg)
+
+                for (x1c, y1c, _, _), w_crop, h_crop, kps in zip(boxes, w_crops, h_crops, all_kps):
+                    draw_pose(center, kps, x1c, y1c)
+                    annotations.append(make_annotation(ann_id, t, kps, x1c, y1c, w_crop, h_crop))
+                    ann_id += 1
+
+            out.write(center)
+
+        save_coco_json(args.coco_json, annotations, num_frames)
+        throughput.report()
+        lookups = cache.hits + cache.misses
+        print(f"✔ Feature cache: {cache.misses} crops encoded for {lookups} window slots "
+              f"({cache.hits / max(lookups, 1):.1%} reused)")
+        if incremental is not None:
+            print(f"✔ Incremental backbone: {incremental.recomputed_fraction:.1%} of the patch "
+                  f"tokens recomputed in the first {incremental.depth} layers")
+
+    finally:
+        cap.release()
+        if 'out' in locals():
+            out.release()
+        cv2.destroyAllWindows()
+
+    print(f"✔ Finished writing annotated video to “{args.video_out}”")
+
+
+# ─────────────────────── Model ───────────────────────
+def load_model(cfg, args, device):
+    """Poseidon from a .pt checkpoint, an exported artifact or an int8 checkpoint,
+    or its ONNX graph with --backend onnxruntime."""
+    if args.causal and args.offline:
+        raise ValueError("--causal is a streaming mode, it cannot be combined with --offline")
+    if args.full_frame and args.offline:
+        raise ValueError("--full_frame cannot be combined with --offline, which caches per-crop features")
+    if args.backend == "onnxruntime":
+        if args.causal:
+            raise ValueError("--causal needs the query index of Poseidon.forward, "
+                             "which the ONNX graph fixes at export time")
+        if args.full_frame:
+            raise ValueError("--full_frame needs Poseidon.encode_frames / decode, "
+                             "which the ONNX graph does not expose")
+        if args.offline:
+            raise ValueError("--offline needs Poseidon.encode / decode, "
+                             "which the ONNX graph does not expose")
+        return OnnxPoseidon(args.weights, args.ort_threads, args.ort_inter_threads)
+
+    # Exported artifacts (tools/export_poseidon.py) are built without mmpose
+    ckpt = load_checkpoint(args.weights)
+    if is_quantized_checkpoint(ckpt) and device != "cpu":
+        raise ValueError("int8 checkpoints only run on the CPU, use -g -1")
+    return load_poseidon(cfg, ckpt, device=device, phase="test").eval()
+
+
 # ─────────────────────── Entrypoint ───────────────────────
 def main():
     args = parse_args()
@@ -316,7 +755,9 @@ def main():
     os.makedirs(os.path.dirname(args.video_out), exist_ok=True)
     os.makedirs(os.path.dirname(args.coco_json), exist_ok=True)
 
-    if torch.backends.mps.is_available():
+    if args.backend == "onnxruntime":
+        device = "cpu"
+    elif torch.backends.mps.is_available():
         device = "mps"
     elif torch.cuda.is_available() and args.gpu >= 0:
         device = f"cuda:{args.gpu}"
@@ -325,13 +766,34 @@ def main():
 
     print("→ Using device:", device)
 
-    model = Poseidon(cfg, phase="test", device=device)
-    ckpt = torch.load(args.weights, map_location=device)
-    model.load_state_dict(ckpt["model_state_dict"])
-    model.to(device).eval()
+    model = load_model(cfg, args, device)
+    if args.causal:
+        # Poseidon predicts the last frame of every window (see Poseidon.query_frame_index)
+        model.window_mode = "past"
+    if args.incremental_threshold > 0 and (not args.offline or args.compile):
+        raise ValueError("--incremental_threshold needs --offline (tracked crops) and eager mode")
+    autocast = contextlib.nullcontext
+    if (args.cpu_profile or cfg.CPU.PROFILE) and device == "cpu" and args.backend == "torch":
+        profile = cpu_profile_from_config(model, cfg, num_threads=args.cpu_threads)
+        autocast = profile.autocast
+        print("→ CPU profile:", profile.summary())
+    if args.compile and args.backend == "torch":
+        # Static shapes: every batch is padded to one of the warmed-up buckets
+        args.pad_buckets = True
+        if args.offline:
+            methods = ("encode", "decode")
+        elif args.full_frame:
+            methods = ("decode",)  # the full-frame backbone input size varies with the video
+        else:
+            methods = ("forward",)
+        compile_poseidon(model, BATCH_BUCKETS, args.window, cfg.MODEL.IMAGE_SIZE, device,
+                         methods=methods, context=autocast, report=args.compile_report)
 
     detector = YOLO("yolov8s-pose.pt")  # or your own weights
-    process_video(model, detector, device, cfg, args)
+    if args.offline:
+        process_video_offline(model, detector, device, cfg, args, autocast)
+    else:
+        process_video(model, detector, device, cfg, args, autocast)
     print("✓ Done!")
     
     
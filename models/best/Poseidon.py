@@ -1,9 +1,9 @@
+import math
 import os
 import sys
 import torch
 import torch.nn as nn
 import numpy as np
-from mmpose.evaluation.functional import keypoint_pck_accuracy
 from easydict import EasyDict
 from utils.common import TRAIN_PHASE, VAL_PHASE, TEST_PHASE
 import cv2
@@ -11,12 +11,149 @@ import os.path as osp
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from contextlib import contextmanager
 import torch.nn.functional as F
-from mmpose.apis import init_model
+from torch.utils.checkpoint import checkpoint
 
 
 from posetimation import get_cfg, update_config 
 
+def multihead_attention(mha, query, key, value, backend='mha'):
+    """Run an nn.MultiheadAttention module with the selected attention backend.
+
+    Args:
+        mha (nn.MultiheadAttention | ProjectedMultiheadAttention): Module holding the projection weights.
+        query, key, value (torch.Tensor[L, B, C]): Sequence-first inputs, as for nn.MultiheadAttention.
+        backend (str): 'mha' calls the module as is, 'sdpa' reuses its weights with
+            F.scaled_dot_product_attention, which never materializes the [L, S] attention matrix
+            when a fused (flash / memory-efficient) kernel is available. ProjectedMultiheadAttention
+            always runs through F.scaled_dot_product_attention.
+
+    Returns:
+        torch.Tensor[L, B, C]: Attention output.
+    """
+    if backend not in ('mha', 'sdpa'):
+        raise ValueError(f"Unknown attention backend: {backend}")
+    if backend == 'mha' and isinstance(mha, nn.MultiheadAttention):
+        attn_output, _ = mha(query, key, value)
+        return attn_output
+
+    q, k, v = _in_projection(mha, query, key, value)
+    dropout_p = mha.dropout if mha.training else 0.0
+    attn_output = F.scaled_dot_product_attention(q, k, v, dropout_p=dropout_p)
+
+    L, B, C = query.shape
+    attn_output = attn_output.permute(2, 0, 1, 3).reshape(L, B, C)
+    return mha.out_proj(attn_output)
+
+
+def _in_projection(mha, query, key, value):
+    # [L, B, C] -> [B, num_heads, L, head_dim]
+    if isinstance(mha, nn.MultiheadAttention) and query is key and key is value:
+        # Self-attention: one matmul with the packed in_proj weights
+        q, k, v = F.linear(query, mha.in_proj_weight, mha.in_proj_bias).chunk(3, dim=-1)
+    else:
+        proj_q, proj_k, proj_v = _projections(mha)
+        q, k, v = proj_q(query), proj_k(key), proj_v(value)
+
+    def split_heads(t):
+        return t.view(t.shape[0], t.shape[1], mha.num_heads, -1).permute(1, 2, 0, 3)
+
+    return split_heads(q), split_heads(k), split_heads(v)
+
+
+def _projections(mha):
+    """q, k, v input projections of an attention module, as callables."""
+    if isinstance(mha, ProjectedMultiheadAttention):
+        return mha.q_proj, mha.k_proj, mha.v_proj
+
+    w_q, w_k, w_v = mha.in_proj_weight.chunk(3)
+    b_q, b_k, b_v = mha.in_proj_bias.chunk(3) if mha.in_proj_bias is not None else (None, None, None)
+    return (lambda x: F.linear(x, w_q, b_q)), (lambda x: F.linear(x, w_k, b_k)), (lambda x: F.linear(x, w_v, b_v))
+
+
+@contextmanager
+def frozen_batch_norm_stats(module):
+    """Restore the running statistics of the BatchNorms of module in train mode on exit."""
+    saved = [(bn, bn.running_mean.clone(), bn.running_var.clone(), bn.num_batches_tracked.clone())
+             for bn in module.modules()
+             if isinstance(bn, nn.modules.batchnorm._BatchNorm) and bn.training and bn.track_running_stats]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for bn, running_mean, running_var, num_batches_tracked in saved:
+                bn.running_mean.copy_(running_mean)
+                bn.running_var.copy_(running_var)
+                bn.num_batches_tracked.copy_(num_batches_tracked)
+
+
+def checkpoint_forward(module, enabled=True):
+    """Run module.forward with activation checkpointing whenever gradients are enabled.
+
+    The activations inside the module are recomputed in backward instead of being kept alive. Only
+    the instance's forward is replaced, so parameter names are unchanged and forward hooks, which run
+    around forward, fire once with the real output. The recompute runs the BatchNorms in train mode
+    again: their running statistics are restored after it, so they are updated once per forward.
+    enabled=False restores the class forward.
+    """
+    if not enabled:
+        module.__dict__.pop('forward', None)
+        return
+    forward = type(module).forward.__get__(module)
+
+    def checkpointed_forward(*args, **kwargs):
+        if not torch.is_grad_enabled():
+            return forward(*args, **kwargs)
+        calls = []
+
+        def run(*args, **kwargs):
+            if not calls:
+                calls.append(True)
+                return forward(*args, **kwargs)
+            # recompute in backward
+            with frozen_batch_norm_stats(module):
+                return forward(*args, **kwargs)
+
+        return checkpoint(run, *args, use_reentrant=False, **kwargs)
+
+    module.forward = checkpointed_forward
+
+
+class ProjectedMultiheadAttention(nn.Module):
+    """nn.MultiheadAttention with the packed in_proj split into q / k / v nn.Linear layers.
+
+    Same computation as the module it is built from (see `from_mha`), but every projection is a
+    regular nn.Linear, so it can be swapped for a quantized one (models/best/quantization.py).
+    """
+    def __init__(self, embed_dim, num_heads, dropout=0.0, bias=True):
+        super(ProjectedMultiheadAttention, self).__init__()
+        self.embed_dim = embed_dim
+        self.num_heads = num_heads
+        self.dropout = dropout
+        self.q_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+        self.k_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+        self.v_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+        self.out_proj = nn.Linear(embed_dim, embed_dim, bias=bias)
+
+    @classmethod
+    def from_mha(cls, mha):
+        module = cls(mha.embed_dim, mha.num_heads, mha.dropout, bias=mha.in_proj_bias is not None)
+        with torch.no_grad():
+            for proj, weight in zip((module.q_proj, module.k_proj, module.v_proj), mha.in_proj_weight.chunk(3)):
+                proj.weight.copy_(weight)
+            if mha.in_proj_bias is not None:
+                for proj, bias in zip((module.q_proj, module.k_proj, module.v_proj), mha.in_proj_bias.chunk(3)):
+                    proj.bias.copy_(bias)
+            module.out_proj.weight.copy_(mha.out_proj.weight)
+            if mha.out_proj.bias is not None:
+                module.out_proj.bias.copy_(mha.out_proj.bias)
+        return module.to(mha.in_proj_weight.device)
+
+    def forward(self, query, key, value):
+        return multihead_attention(self, query, key, value, backend='sdpa'), None
+
+
 class AdaptiveFrameWeighting(nn.Module):
     def __init__(self, embed_dim, num_frames):
         super(AdaptiveFrameWeighting, self).__init__()
@@ -31,8 +168,9 @@ class AdaptiveFrameWeighting(nn.Module):
             nn.Linear(64, 1)
         )
 
-    def forward(self, x):
+    def forward(self, x, inplace=False):
         # x shape: [batch_size, num_frames, embed_dim, height, width]
+        # inplace: weight x itself (lean inference on a window owned by the caller)
         batch_size, num_frames, embed_dim, height, width = x.shape
         
         # Estimate quality for each frame
@@ -43,7 +181,7 @@ class AdaptiveFrameWeighting(nn.Module):
         weights = F.softmax(quality_scores, dim=1).unsqueeze(2).unsqueeze(3).unsqueeze(4)
         
         # Weight frames
-        weighted_x = x * weights
+        weighted_x = x.mul_(weights) if inplace else x * weights
         
         return weighted_x, weights.squeeze()
 
@@ -60,6 +198,9 @@ class PyramidPoolingModule(nn.Module):
             ))
     
     def forward(self, x):
+        if torch.jit.is_tracing():
+            # TorchScript ONNX export: adaptive pooling needs static spatial dims, traced sizes are symbolic
+            x = x.view([int(size) for size in x.shape])
         h, w = x.size(2), x.size(3)
         features = [x]
         for path in self.paths:
@@ -67,17 +208,19 @@ class PyramidPoolingModule(nn.Module):
         return torch.cat(features, dim=1)
 
 class MultiScaleFeatureFusion(nn.Module):
-    def __init__(self, embed_dim, num_heads):
+    def __init__(self, embed_dim, num_heads, attention_backend='mha', fusion_mode='full'):
         super(MultiScaleFeatureFusion, self).__init__()
         self.ppm = PyramidPoolingModule(embed_dim, embed_dim // 4)
         self.fusion_conv = nn.Conv2d(embed_dim * 2, embed_dim, kernel_size=3, padding=1, bias=False)
         self.fusion_norm = nn.BatchNorm2d(embed_dim)
         self.fusion_act = nn.ReLU(inplace=True)
-        self.attention_fusion = AttentionFusion(embed_dim, num_heads)
+        self.attention_fusion = AttentionFusion(embed_dim, num_heads, attention_backend, fusion_mode)
 
 
-    def forward(self, features):
+    def forward(self, features, lean=False):
         # Assume features is a dict of tensors from different layers
+        if lean:
+            return self._lean_forward(features)
         multi_scale_features = {}
         for name, feature in features.items():
             B, num_frames, C, H, W = feature.shape
@@ -93,10 +236,44 @@ class MultiScaleFeatureFusion(nn.Module):
         fused_features = self.attention_fusion(multi_scale_features)
         return fused_features
 
+    def _lean_forward(self, features):
+        # Inference without the intermediate copies: each level is popped from `features` (freed once
+        # fused) and written straight into the token layout AttentionFusion attends over, instead of
+        # keeping every level alive until torch.cat / torch.stack.
+        names = list(features.keys())
+        B, num_frames, C, H, W = features[names[0]].shape
+        level_mode = self.attention_fusion.fusion_mode == 'level'
+        tokens = None
+        for i, name in enumerate(names):
+            feature = features.pop(name).view(-1, C, H, W)
+            level = self.fusion_act(self.fusion_norm(self.fusion_conv(self.ppm(feature))))
+            del feature
+            if tokens is None:
+                shape = (len(names), B * num_frames, H * W, C) if level_mode else (B * num_frames, len(names) * H * W, C)
+                tokens = level.new_empty(shape)
+            level = level.reshape(B * num_frames, H * W, C)
+            if level_mode:
+                tokens[i] = level
+            else:
+                tokens[:, i * H * W:(i + 1) * H * W] = level
+            del level
+        return self.attention_fusion.fuse_tokens(tokens, len(names))
+
 class AttentionFusion(nn.Module):
-    def __init__(self, embed_dim, num_heads):
+    """Fuse the feature levels of each frame into one [B*T, H*W, C] token map.
+
+    fusion_mode 'full' runs self-attention over the concatenated tokens of all levels, so the cost
+    is quadratic in H*W*num_levels. 'level' attends, at each spatial location, from the mean over
+    levels to the num_levels tokens of that location, which is linear in the number of levels.
+    Both modes share the same parameters.
+    """
+    def __init__(self, embed_dim, num_heads, attention_backend='mha', fusion_mode='full'):
         super(AttentionFusion, self).__init__()
+        if fusion_mode not in ('full', 'level'):
+            raise ValueError(f"Unknown fusion mode: {fusion_mode}")
         self.attention = nn.MultiheadAttention(embed_dim, num_heads)
+        self.attention_backend = attention_backend
+        self.fusion_mode = fusion_mode
         self.norm = nn.LayerNorm(embed_dim)
         self.final_proj = nn.Linear(embed_dim, embed_dim)
 
@@ -108,9 +285,26 @@ class AttentionFusion(nn.Module):
         for key, value in features.items():
             features[key] = value.reshape(B*num_frames, H*W, embed_dim)
 
+        if self.fusion_mode == 'level':
+            return self._level_forward(torch.stack(list(features.values()), dim=0))
+
         # Concatenate features along the sequence dimension
         features_cat = torch.cat(list(features.values()), dim=1)  # Shape: [10, 432*num_features, 384]
 
+        return self._full_forward(features_cat, len(features))
+
+    def fuse_tokens(self, tokens, num_levels):
+        """Fusion of levels already laid out for attention, for lean inference (no grad).
+
+        Args:
+            tokens (torch.Tensor): [B*T, num_levels*H*W, C] in 'full' mode, [num_levels, B*T, H*W, C]
+                in 'level' mode. The residual is added in place to the attention output.
+        """
+        if self.fusion_mode == 'level':
+            return self._level_forward(tokens, inplace=True)
+        return self._full_forward(tokens, num_levels, inplace=True)
+
+    def _full_forward(self, features_cat, num_levels, inplace=False):
         # get shape of features
         B_numframes, _, embed_dim = features_cat.shape
         
@@ -118,14 +312,19 @@ class AttentionFusion(nn.Module):
         features_cat = features_cat.transpose(0, 1)
         
         # Apply self-attention
-        attn_output, _ = self.attention(features_cat, features_cat, features_cat)
+        attn_output = multihead_attention(self.attention, features_cat, features_cat, features_cat, self.attention_backend)
         
         # Add residual connection and layer norm
-        fused_features = self.norm(features_cat + attn_output)
-        
+        if inplace:
+            attn_output += features_cat
+            fused_features = self.norm(attn_output)
+        else:
+            fused_features = self.norm(features_cat + attn_output)
+        del attn_output
+
         # Project back to original sequence length
         fused_features = fused_features.transpose(0, 1)  # Shape: [10, 432*num_features, 384]
-        fused_features = fused_features.view(B_numframes, len(features), -1, embed_dim)  # Shape: [10, num_features, 432, 384]
+        fused_features = fused_features.view(B_numframes, num_levels, -1, embed_dim)  # Shape: [10, num_features, 432, 384]
         fused_features = torch.mean(fused_features, dim=1)  # Shape: [10, 432, 384]
         
         # Final projection to ensure we capture information from all feature levels
@@ -133,6 +332,24 @@ class AttentionFusion(nn.Module):
         
         return fused_features
 
+    def _level_forward(self, levels, inplace=False):
+        # Levels as a length-num_levels sequence per location: [num_levels, B*T*H*W, C]
+        num_levels, B_numframes, HW, embed_dim = levels.shape
+        levels = levels.reshape(num_levels, B_numframes * HW, embed_dim)
+
+        # The mean over levels queries the levels of its own location
+        query = levels.mean(dim=0, keepdim=True)  # [1, B*T*H*W, C]
+        attn_output = multihead_attention(self.attention, query, levels, levels, self.attention_backend)
+
+        if inplace:
+            attn_output += query
+            fused_features = self.norm(attn_output)
+        else:
+            fused_features = self.norm(query + attn_output)
+        fused_features = fused_features.view(B_numframes, HW, embed_dim)  # Shape: [10, 432, 384]
+
+        return self.final_proj(fused_features)
+
 
 class ExtractIntermediateLayers(nn.Module):
     def __init__(self, model, return_layers):
@@ -157,35 +374,251 @@ class ExtractIntermediateLayers(nn.Module):
     def forward(self, x):
         self.features = {}
         model_output = self.model(x)[0]
-        return self.features, model_output
+        # Hand the hooked outputs over without keeping tensors on the module (required by torch.export)
+        features, self.features = self.features, {}
+        return features, model_output
+
+class TokenPruning:
+    """Prune low-saliency patch tokens in the later layers of a ViT backbone.
+
+    After layer start_layer the patch tokens are ranked by saliency (cosine distance to the mean token
+    of the crop, which the uniform background is close to) and only the keep_ratio most salient ones
+    go through the following layers; the attention of those layers only sees the kept tokens. The
+    pruned tokens keep their start_layer features, so every layer still returns the full token grid:
+    the hooks of ExtractIntermediateLayers, the final norm and the fusion are unchanged.
+    """
+    def __init__(self, backbone, keep_ratio, start_layer):
+        if not 0 < keep_ratio <= 1:
+            raise ValueError(f"Token keep ratio must be in (0, 1], got {keep_ratio}")
+        if not 0 <= start_layer < len(backbone.layers) - 1:
+            raise ValueError(f"Token pruning layer {start_layer} out of range for {len(backbone.layers)} layers")
+        self.keep_ratio = keep_ratio
+        self.start_layer = start_layer
+        self.num_extra_tokens = getattr(backbone, 'num_extra_tokens', 0)  # class token, never pruned
+        self.keep_index = None
+        self.full_input = None
+
+        layers = backbone.layers
+        self.handles = [layers[start_layer].register_forward_hook(self._select)]
+        for layer in layers[start_layer + 1:]:
+            self.handles.append(layer.register_forward_pre_hook(self._gather))
+            # before the other forward hooks, so that they see the full grid
+            self.handles.append(layer.register_forward_hook(self._scatter, prepend=True))
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def _select(self, module, inputs, output):
+        extra = self.num_extra_tokens
+        patches = output[:, extra:]
+        saliency = 1 - F.cosine_similarity(patches, patches.mean(dim=1, keepdim=True), dim=-1)
+        k = max(1, round(self.keep_ratio * patches.shape[1]))
+        keep = saliency.topk(k, dim=1).indices.sort(dim=1).values + extra
+        if extra:
+            extra_index = torch.arange(extra, device=keep.device).expand(keep.shape[0], -1)
+            keep = torch.cat([extra_index, keep], dim=1)
+        self.keep_index = keep.unsqueeze(-1).expand(-1, -1, output.shape[-1])
+
+    def _gather(self, module, inputs):
+        self.full_input = inputs[0]
+        return (inputs[0].gather(1, self.keep_index), *inputs[1:])
+
+    def _scatter(self, module, inputs, output):
+        full_output = self.full_input.scatter(1, self.keep_index, output)
+        self.full_input = None
+        return full_output
+
 
 class CrossAttention(nn.Module):
-    def __init__(self, embed_dim, num_heads):
+    def __init__(self, embed_dim, num_heads, attention_backend='mha', local_block=0, local_halo=2):
         super(CrossAttention, self).__init__()
         self.mha = nn.MultiheadAttention(embed_dim, num_heads)
+        self.attention_backend = attention_backend
+        self.local_block = local_block
+        self.local_halo = local_halo
 
     def forward(self, query, context):
+        if self.local_block > 0:
+            return self._local_forward(query, context)
+
         # Reshape input: [B, C, H, W] -> [H*W, B, C]
         B, num_context_frames, C, H, W = context.shape
         query = query.view(B, C, -1).permute(2, 0, 1) # [H*W, B, C]
-        context = context.view(B, num_context_frames, C, -1).permute(3, 0, 1, 2) # [H*W, B, num_context_frames, C]
-        context = context.reshape(-1, B, C) # [H*W*num_context_frames, B, C]
+        context = context.view(B, num_context_frames, C, -1).permute(1, 3, 0, 2) # [num_context_frames, H*W, B, C]
+        context = context.reshape(-1, B, C) # [num_context_frames*H*W, B, C]
 
         # Apply weighted attention
-        attn_output, _ = self.mha(query, context, context,)
+        attn_output = multihead_attention(self.mha, query, context, context, self.attention_backend)
         #attn_output = self.dropout(attn_output)
 
         # Reshape output: [H*W, B, C] -> [B, C, H, W]
         attn_output = attn_output.permute(1, 2, 0).view(B, C, H, W)
         return attn_output
 
+    def _local_forward(self, query, context):
+        """Spatially local cross-attention.
+
+        The query grid is split in local_block x local_block blocks; the tokens of a block only attend
+        to the same block, enlarged by local_halo tokens on each side, in every context frame.
+        The attention cost is then linear in H*W instead of quadratic.
+        """
+        B, num_context_frames, C, H, W = context.shape
+        block, halo = self.local_block, self.local_halo
+        num_heads = self.mha.num_heads
+        head_dim = C // num_heads
+
+        # Project on the grid: [B, C, H, W] -> [B, H, W, C]
+        proj_q, proj_k, proj_v = _projections(self.mha)
+        q = proj_q(query.view(B, C, H, W).permute(0, 2, 3, 1))
+        context = context.view(B * num_context_frames, C, H, W).permute(0, 2, 3, 1)
+        k = proj_k(context)
+        v = proj_v(context)
+
+        # Pad the grid to a multiple of the block size
+        pad_h, pad_w = (-H) % block, (-W) % block
+        Hp, Wp = H + pad_h, W + pad_w
+        n_h, n_w = Hp // block, Wp // block
+        valid = query.new_ones(1, 1, H, W, dtype=query.dtype)
+
+        # Query blocks: [B * n_blocks, heads, block*block, head_dim]
+        q = F.pad(q.permute(0, 3, 1, 2), (0, pad_w, 0, pad_h))
+        q = F.unfold(q, kernel_size=block, stride=block)  # [B, C*block*block, n_blocks]
+        q = q.view(B, num_heads, head_dim, block * block, n_h * n_w).permute(0, 4, 1, 3, 2)
+        q = q.reshape(B * n_h * n_w, num_heads, block * block, head_dim)
+
+        # Key / value blocks with halo: [B * n_blocks, heads, frames*window*window, head_dim]
+        window = block + 2 * halo
+
+        def halo_blocks(t, channels):
+            t = F.pad(t, (halo, pad_w + halo, halo, pad_h + halo))
+            return F.unfold(t, kernel_size=window, stride=block).view(-1, channels, window * window, n_h * n_w)
+
+        def context_blocks(t):
+            t = halo_blocks(t.permute(0, 3, 1, 2), C)  # [B*frames, C, window*window, n_blocks]
+            t = t.view(B, num_context_frames, num_heads, head_dim, window * window, n_h * n_w)
+            t = t.permute(0, 5, 2, 1, 4, 3).reshape(B * n_h * n_w, num_heads, num_context_frames * window * window, head_dim)
+            return t
+
+        k, v = context_blocks(k), context_blocks(v)
+
+        # Padded key positions are masked out
+        mask = halo_blocks(valid, 1)[0, 0].t() > 0  # [n_blocks, window*window]
+        mask = mask.repeat(1, num_context_frames).view(1, n_h * n_w, 1, 1, -1).expand(B, -1, -1, -1, -1)
+        mask = mask.reshape(B * n_h * n_w, 1, 1, -1)
+
+        dropout_p = self.mha.dropout if self.training else 0.0
+        attn_output = F.scaled_dot_product_attention(q, k, v, attn_mask=mask, dropout_p=dropout_p)
+
+        # Back to the grid: [B, C, H, W]
+        attn_output = attn_output.view(B, n_h * n_w, num_heads, block * block, head_dim).permute(0, 2, 4, 3, 1)
+        attn_output = F.fold(attn_output.reshape(B, C * block * block, n_h * n_w), output_size=(Hp, Wp),
+                             kernel_size=block, stride=block)
+        attn_output = attn_output[:, :, :H, :W]
+        attn_output = self.mha.out_proj(attn_output.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
+        return attn_output.contiguous()
+
+class GridLayerNorm(nn.LayerNorm):
+    """LayerNorm over [C, H, W] whose affine parameters follow the token grid of the input.
+
+    The parameters are stored for the grid of the configured image size; for other grids they are
+    bilinearly resized, both in forward and when loading a checkpoint trained at another resolution.
+    """
+
+    def forward(self, x):
+        if tuple(x.shape[1:]) == tuple(self.normalized_shape):
+            return super(GridLayerNorm, self).forward(x)
+        weight, bias = self.weight, self.bias
+        if self.elementwise_affine:
+            weight = self._resize(weight, x.shape[2:])
+            bias = self._resize(bias, x.shape[2:]) if bias is not None else None
+        return F.layer_norm(x, x.shape[1:], weight, bias, self.eps)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        for name in ('weight', 'bias'):
+            key = prefix + name
+            if key in state_dict and state_dict[key].shape[1:] != self.normalized_shape[1:]:
+                state_dict[key] = self._resize(state_dict[key], self.normalized_shape[1:])
+        super(GridLayerNorm, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    @staticmethod
+    def _resize(param, size):
+        return F.interpolate(param.unsqueeze(0), size=tuple(size), mode='bilinear', align_corners=False).squeeze(0)
+
+
+def simcc_decode(output, heatmap_size, split_ratio, sigma):
+    """Keypoints of SimCC outputs, in heatmap pixels like the argmax of the heatmap head.
+
+    Args:
+        output (torch.Tensor[N, K, bins_x + bins_y]): SimCCHead logits.
+        heatmap_size (tuple): (width, height) of the heatmaps the bins subdivide.
+        split_ratio (int): Bins per heatmap pixel.
+        sigma (float): Gaussian sigma of the heatmap targets, in heatmap pixels.
+
+    Returns:
+        torch.Tensor[N, K, 2]: (x, y) of each joint.
+        torch.Tensor[N, K, 1]: Confidence: the peak probabilities scaled so that a prediction matching
+            the Gaussian target scores about 1, like a heatmap maximum.
+    """
+    num_bins_x = (int(heatmap_size[0]) - 1) * split_ratio + 1
+    logits_x, logits_y = output.float().split([num_bins_x, output.shape[-1] - num_bins_x], dim=-1)
+    prob_x, index_x = logits_x.softmax(dim=-1).max(dim=-1)
+    prob_y, index_y = logits_y.softmax(dim=-1).max(dim=-1)
+    coords = torch.stack([index_x, index_y], dim=-1).float() / split_ratio
+    peak = 1.0 / (math.sqrt(2 * math.pi) * sigma * split_ratio)  # peak of the normalized 1-D target
+    maxvals = torch.minimum(prob_x, prob_y).unsqueeze(-1) / peak
+    return coords, maxvals
+
+
+class SimCCHead(nn.Module):
+    """Coordinate classification head (SimCC) on the attended token grid, instead of the deconvolutions.
+
+    Each joint gets a distribution over x bins and one over y bins covering the heatmap extent with
+    split_ratio bins per heatmap pixel, so no 4x upsampled feature map or heatmap is ever computed.
+    """
+    def __init__(self, embed_dim, num_joints, grid_size, heatmap_size, split_ratio=2, sigma=2, hidden_dim=256):
+        super(SimCCHead, self).__init__()
+        self.grid_size = tuple(grid_size)
+        self.heatmap_size = tuple(heatmap_size)
+        self.split_ratio = split_ratio
+        self.sigma = sigma
+        self.num_bins_x = (int(heatmap_size[0]) - 1) * split_ratio + 1
+        self.num_bins_y = (int(heatmap_size[1]) - 1) * split_ratio + 1
+
+        self.final_layer = nn.Conv2d(embed_dim, num_joints, kernel_size=3, padding=1)
+        self.mlp = nn.Sequential(
+            nn.Linear(self.grid_size[0] * self.grid_size[1], hidden_dim),
+            nn.LayerNorm(hidden_dim),
+            nn.GELU()
+        )
+        self.cls_x = nn.Linear(hidden_dim, self.num_bins_x)
+        self.cls_y = nn.Linear(hidden_dim, self.num_bins_y)
+
+    def forward(self, x):
+        """[B, embed_dim, h, w] -> [B, K, bins_x + bins_y] logits (x bins first)."""
+        x = self.final_layer(x)
+        if tuple(x.shape[2:]) != self.grid_size:
+            x = F.adaptive_avg_pool2d(x, self.grid_size)
+        x = self.mlp(x.flatten(2))
+        return torch.cat([self.cls_x(x), self.cls_y(x)], dim=-1)
+
+    def decode(self, output):
+        return simcc_decode(output, self.heatmap_size, self.split_ratio, self.sigma)
+
+
 class Poseidon(nn.Module):
-    def __init__(self, cfg, device='cpu', phase='train', num_heads=4):
+    def __init__(self, cfg, device='cpu', phase='train', num_heads=4, vitpose=None):
         super(Poseidon, self).__init__()
         
         self.device = device
 
-        self.model = init_model(cfg.MODEL.CONFIG_FILE, cfg.MODEL.CHECKPOINT_FILE, device=device)
+        # ViTPose backbone + head: built and initialized by mmpose from cfg.MODEL.CONFIG_FILE / CHECKPOINT_FILE,
+        # or passed in already built (see models/best/artifact.py)
+        if vitpose is None:
+            from mmpose.apis import init_model
+            vitpose = init_model(cfg.MODEL.CONFIG_FILE, cfg.MODEL.CHECKPOINT_FILE, device=device)
+        self.model = vitpose
         self.backbone = self.model.backbone
 
         if cfg.MODEL.EMBED_DIM == 384:
@@ -199,6 +632,10 @@ class Poseidon(nn.Module):
 
         self.extract_layers = ExtractIntermediateLayers(self.backbone, self.return_layers)
 
+        # Optional pruning of background tokens in the later backbone layers (see TokenPruning)
+        self.token_pruning = None
+        self.set_token_pruning(cfg.MODEL.TOKEN_KEEP_RATIO, cfg.MODEL.TOKEN_PRUNE_LAYER)
+
         self.deconv_layer = self.model.head.deconv_layers
         self.final_layer = self.model.head.final_layer
         self.num_frames = cfg.WINDOWS_SIZE
@@ -223,14 +660,34 @@ class Poseidon(nn.Module):
         
         self.is_train = True if phase == 'train' else False
 
+        # Attention implementation: 'mha' (nn.MultiheadAttention) or 'sdpa' (F.scaled_dot_product_attention)
+        self.attention_backend = cfg.MODEL.ATTENTION_BACKEND
+
         # Feature Fusion
-        self.feature_fusion = MultiScaleFeatureFusion(self.embed_dim, num_heads=self.num_heads)
+        self.feature_fusion = MultiScaleFeatureFusion(self.embed_dim, num_heads=self.num_heads,
+                                                      attention_backend=self.attention_backend,
+                                                      fusion_mode=cfg.MODEL.FUSION_MODE)
 
         # Adaptive Frame Weighting
         self.adaptive_weighting = AdaptiveFrameWeighting(self.embed_dim, self.num_frames)
 
+        # Inference-time context frame skipping driven by the frame weights (see select_context_frames)
+        self.frame_skip_threshold = cfg.MODEL.FRAME_SKIP_THRESHOLD
+        self.frame_skip_topk = cfg.MODEL.FRAME_SKIP_TOPK
+
+        # No-grad forward that frees each fused level early and weights the window in place (see lean)
+        self.lean_inference = cfg.MODEL.LEAN_INFERENCE
+
+        # Query frame of each window: 'centered' (middle frame) or 'past' (last frame, causal)
+        if cfg.MODEL.WINDOW_MODE not in ('centered', 'past'):
+            raise ValueError(f"Unknown window mode: {cfg.MODEL.WINDOW_MODE}")
+        self.window_mode = cfg.MODEL.WINDOW_MODE
+
         # Cross-Attention
-        self.cross_attention = CrossAttention(self.embed_dim, self.num_heads)
+        self.cross_attention = CrossAttention(self.embed_dim, self.num_heads,
+                                              attention_backend=self.attention_backend,
+                                              local_block=cfg.MODEL.LOCAL_ATTENTION_BLOCK,
+                                              local_halo=cfg.MODEL.LOCAL_ATTENTION_HALO)
 
         # Self-Attention
         self.self_attention = nn.MultiheadAttention(self.embed_dim, self.num_heads)
@@ -243,8 +700,24 @@ class Poseidon(nn.Module):
             for name in self.return_layers.values()
         })
 
+        # Token grid of the backbone for the configured input size (24x18 for 384x288)
+        self.grid_size = self.token_grid(cfg.MODEL.IMAGE_SIZE)
+
         # Layer normalization
-        self.layer_norm = nn.LayerNorm([self.embed_dim, 24, 18])
+        self.layer_norm = GridLayerNorm([self.embed_dim, *self.grid_size])
+
+        # Output head: 'heatmap' (ViTPose deconvolutions) or 'simcc' (coordinates from the token grid)
+        if cfg.MODEL.HEAD not in ('heatmap', 'simcc'):
+            raise ValueError(f"Unknown head: {cfg.MODEL.HEAD}")
+        self.head_type = cfg.MODEL.HEAD
+        self.simcc_head = None
+        if self.head_type == 'simcc':
+            self.simcc_head = SimCCHead(self.embed_dim, self.num_joints, self.grid_size, self.heatmap_size,
+                                        split_ratio=cfg.MODEL.SIMCC_SPLIT_RATIO, sigma=cfg.MODEL.SIGMA)
+            # no deconvolution head: the module slots stay registered (as None), so its weights in older
+            # checkpoints are skipped when loading
+            self.model.head = None
+            self.deconv_layer = self.final_layer = None
 
         # Print learning parameters
         print(f"Poseidon learnable parameters: {round(self.count_trainable_parameters() / 1e6, 1)} M\n\n")
@@ -257,62 +730,272 @@ class Poseidon(nn.Module):
     def count_parameters(model):
         return sum(p.numel() for p in model.parameters())
 
+    def token_grid(self, image_size):
+        """(height, width) of the backbone token grid for an input of image_size = (width, height)."""
+        projection = self.backbone.patch_embed.projection
+        width, height = image_size
 
-    def forward(self, x, meta=None):
-        batch_size, num_frames, C, H, W = x.shape
-        x = x.view(-1, C, H, W)
+        def grid(size, dim):
+            return (size + 2 * projection.padding[dim] - projection.kernel_size[dim]) // projection.stride[dim] + 1
+
+        return grid(height, 0), grid(width, 1)
+
+
+    def encode(self, x):
+        """Per-frame part of the model: backbone, layer norms and multi-scale fusion.
+
+        Args:
+            x (torch.Tensor[N, C, H, W]): Frames (crops) to encode.
+
+        Returns:
+            torch.Tensor[N, embed_dim, h, w]: Fused features, one entry per frame, on the backbone
+                token grid (24x18 for 384x288 inputs).
+        """
+        num_images = x.shape[0]
 
         # Backbone
         intermediate_outputs, model_output = self.extract_layers(x)
+        h, w = model_output.shape[-2:]
 
         # Apply LayerNorm to the extracted features
         for feature_name in intermediate_outputs.keys():
             intermediate_outputs[feature_name] = self.intermediate_layer_norms[feature_name](intermediate_outputs[feature_name])
-            intermediate_outputs[feature_name] = intermediate_outputs[feature_name].view(batch_size, num_frames, self.embed_dim, 24, 18)
-
-        # reshape model output
-        #model_output = model_output.reshape(batch_size*num_frames, -1, self.embed_dim)
+            intermediate_outputs[feature_name] = intermediate_outputs[feature_name].view(num_images, 1, self.embed_dim, h, w)
 
         # concatenate intermediate outputs and model output
         intermediate_outputs['model_output'] = model_output
-        intermediate_outputs['model_output'] = intermediate_outputs['model_output'].view(batch_size, num_frames, self.embed_dim, 24, 18)
-                
+        intermediate_outputs['model_output'] = intermediate_outputs['model_output'].view(num_images, 1, self.embed_dim, h, w)
 
         # Feature Fusion
-        x = self.feature_fusion(intermediate_outputs)
-        
-        # Reshape to separate frames
-        x = x.view(batch_size, num_frames, self.embed_dim, 24, 18) # [batch_size, num_frames, 384, 24, 18]  ß
+        x = self.feature_fusion(intermediate_outputs, lean=self.lean())
+
+        return x.view(num_images, self.embed_dim, h, w)
+
+    def encode_frames(self, frames, boxes):
+        """Multi-person alternative to encode: one backbone pass per full frame, RoIAlign per person.
+
+        The intermediate and final backbone features of each frame are resampled with RoIAlign to the
+        token grid of a crop (24x18 for 384x288) for every box, then go through the same layer norms
+        and multi-scale fusion as encode, so the backbone cost does not grow with the number of people.
+
+        Args:
+            frames (torch.Tensor[F, C, H, W]): Full frames, H and W multiples of the patch size.
+            boxes (torch.Tensor[N, 5]): (frame index, x1, y1, x2, y2) of each person crop, in pixels of frames.
+
+        Returns:
+            torch.Tensor[N, embed_dim, h, w]: Fused features of each box, as encode returns for the crops.
+        """
+        from torchvision.ops import roi_align
+
+        num_images, _, height, width = frames.shape
+        intermediate_outputs, model_output = self.extract_layers(frames)
+        grid_h, grid_w = model_output.shape[-2:]
+        if grid_h * width != grid_w * height:
+            raise ValueError(f"Frame size {width}x{height} must be a multiple of the backbone patch size")
+        h, w = self.grid_size
+        boxes = boxes.to(device=frames.device, dtype=model_output.dtype)
+        num_boxes = boxes.shape[0]
+
+        def roi_features(feature_map):
+            # [F, C, grid_h, grid_w] -> [N, C, h, w], one bilinear sample per token (like resizing the crop)
+            return roi_align(feature_map, boxes, (h, w), spatial_scale=grid_w / width, sampling_ratio=1,
+                             aligned=True)
+
+        features = {}
+        for feature_name, tokens in intermediate_outputs.items():
+            tokens = self.intermediate_layer_norms[feature_name](tokens)  # [F, grid_h*grid_w, C]
+            feature_map = tokens.transpose(1, 2).reshape(num_images, self.embed_dim, grid_h, grid_w)
+            # back to crop tokens [N, h*w, C], viewed as a grid exactly like in encode
+            tokens = roi_features(feature_map).flatten(2).transpose(1, 2).contiguous()
+            features[feature_name] = tokens.view(num_boxes, 1, self.embed_dim, h, w)
+        features['model_output'] = roi_features(model_output).view(num_boxes, 1, self.embed_dim, h, w)
+
+        # Feature Fusion
+        x = self.feature_fusion(features, lean=self.lean())
+
+        return x.view(num_boxes, self.embed_dim, h, w)
+
+    def decode(self, x, return_weights=False, query_index=None):
+        """Windowed part of the model: frame weighting, attention and heatmap head.
+
+        Args:
+            x (torch.Tensor[B, T, embed_dim, h, w]): Encoded features of each window.
+            return_weights (bool): Also return the AdaptiveFrameWeighting weights.
+            query_index (int): Frame of the window to predict, the others are its context. Negative
+                values count from the end (-1: last frame). Defaults to the window mode's query frame.
+
+        Returns:
+            torch.Tensor[B, K, 4h, 4w]: Heatmaps of the query frame, or with the SimCC head
+                torch.Tensor[B, K, bins_x + bins_y] coordinate logits (see simcc_decode).
+            torch.Tensor[B, T]: Softmax weight of each frame (only with return_weights).
+        """
+        return self._decode(x, return_weights=return_weights, query_index=query_index)
+
+    def _decode(self, x, return_weights=False, query_index=None, inplace=False):
+        # inplace (lean inference): x is owned by the caller's forward, it is weighted in place and
+        # its memory holds the query and context frames until the context self-attention (see split_query_inplace)
+        batch_size, num_frames, _, h, w = x.shape
 
         # Adaptive Frame Weighting
-        x, frame_weights = self.adaptive_weighting(x)
+        x, frame_weights = self.adaptive_weighting(x, inplace=inplace)
+        frame_weights = frame_weights.view(batch_size, num_frames)
         
         # Cross-Attention
-        center_frame_idx = num_frames // 2
-        center_frame = x[:, center_frame_idx]
-        context_frames = torch.cat([x[:, :center_frame_idx], x[:, center_frame_idx+1:]], dim=1)
+        query_idx = self.query_frame_index(num_frames, query_index)
+        if inplace:
+            query_frame, context_frames = self.split_query_inplace(x, query_idx)
+        else:
+            query_frame = x[:, query_idx]
+            context_frames = torch.cat([x[:, :query_idx], x[:, query_idx+1:]], dim=1)
+        del x
+
+        if not self.training:
+            context_weights = torch.cat([frame_weights[:, :query_idx], frame_weights[:, query_idx+1:]], dim=1)
+            context_frames = self.select_context_frames(context_frames, context_weights)
+        num_context_frames = context_frames.shape[1]
 
-        context_frames = context_frames.view(-1, self.embed_dim, 24*18).permute(2, 0, 1)
-        context_frames, _ = self.self_attention(context_frames, context_frames, context_frames)
-        context_frames = context_frames.permute(1, 2, 0).view(batch_size, num_frames-1, self.embed_dim, 24, 18)
+        context_frames = context_frames.view(-1, self.embed_dim, h*w).permute(2, 0, 1)
+        context_frames = multihead_attention(self.self_attention, context_frames, context_frames, context_frames,
+                                             self.attention_backend)
+        context_frames = context_frames.permute(1, 2, 0).view(batch_size, num_context_frames, self.embed_dim, h, w)
+        if inplace:
+            # only the query frame still holds the window's memory: keep a copy of it instead
+            query_frame = query_frame.clone()
 
         # Cross-Attention
-        attended_features = self.cross_attention(center_frame, context_frames)
+        attended_features = self.cross_attention(query_frame, context_frames)
         
         # Layer Norm
         attended_features = self.layer_norm(attended_features)
 
         # residual connection
-        attended_features += center_frame
+        attended_features += query_frame
 
-        # Deconvolution layers
-        x = self.deconv_layer(attended_features)
+        if self.simcc_head is not None:
+            # Coordinate classification on the token grid
+            x = self.simcc_head(attended_features)
+        else:
+            # Deconvolution layers
+            x = self.deconv_layer(attended_features)
 
-        # Final layer
-        x = self.final_layer(x)
-        
+            # Final layer
+            x = self.final_layer(x)
+
+        if return_weights:
+            return x, frame_weights
         return x
 
+    @staticmethod
+    def split_query_inplace(x, query_idx):
+        """Query frames [B, embed_dim, h, w] and context frames [B, T-1, embed_dim, h, w] of the contiguous
+        x [B, T, embed_dim, h, w], both views of x's memory.
+
+        For a single window whose query is its first or last frame they are slices of x. Otherwise x is
+        overwritten: the context frames are moved frame by frame to the front of its memory, in temporal
+        order, and the query frames (copied aside, B frames) to the end.
+        """
+        batch_size, num_frames = x.shape[:2]
+        if batch_size == 1 and query_idx in (0, num_frames - 1):
+            start = 1 if query_idx == 0 else 0
+            return x[:, query_idx], x[:, start:start + num_frames - 1]
+
+        query_frame = x[:, query_idx].clone()
+        frames = x.view(batch_size * num_frames, *x.shape[2:])
+        num_context = 0
+        for index in range(batch_size * num_frames):
+            if index % num_frames == query_idx:
+                continue
+            # every frame moves to a lower or equal index, after the frames it could overwrite were moved
+            if num_context != index:
+                frames[num_context].copy_(frames[index])
+            num_context += 1
+        frames[num_context:].copy_(query_frame)
+        return frames[num_context:], frames[:num_context].view(batch_size, num_frames - 1, *x.shape[2:])
+
+    def query_frame_index(self, num_frames, query_index=None):
+        """Index in [0, num_frames) of the predicted frame: query_index, or the window mode's default."""
+        if query_index is None:
+            return num_frames - 1 if self.window_mode == 'past' else num_frames // 2
+        if not -num_frames <= query_index < num_frames:
+            raise IndexError(f"Query index {query_index} out of range for windows of {num_frames} frames")
+        return query_index % num_frames
+
+    def select_context_frames(self, context_frames, context_weights):
+        """Drop low-weight context frames before the context self-attention and cross-attention.
+
+        Keeps at most frame_skip_topk frames and, with frame_skip_threshold, only as many frames as the
+        sample of the batch with the most frames above the threshold (at least one), so that every
+        sample keeps the same number of frames: its highest-weighted ones, in temporal order.
+        The threshold policy is data dependent (one device sync per call).
+
+        Args:
+            context_frames (torch.Tensor[B, T-1, embed_dim, h, w]): Weighted context frames.
+            context_weights (torch.Tensor[B, T-1]): Their AdaptiveFrameWeighting weights.
+
+        Returns:
+            torch.Tensor[B, k, embed_dim, h, w]: Kept context frames.
+        """
+        num_context_frames = context_frames.shape[1]
+        k = num_context_frames
+        if self.frame_skip_topk > 0:
+            k = min(k, self.frame_skip_topk)
+        if self.frame_skip_threshold > 0:
+            num_above = (context_weights >= self.frame_skip_threshold).sum(dim=1).max().item()
+            k = min(k, max(int(num_above), 1))
+        if k == num_context_frames:
+            return context_frames
+
+        keep = context_weights.topk(k, dim=1).indices.sort(dim=1).values  # [B, k]
+        batch_idx = torch.arange(context_frames.shape[0], device=context_frames.device).unsqueeze(1)
+        return context_frames[batch_idx, keep]
+
+    def forward(self, x, meta=None, return_weights=False, query_index=None):
+        batch_size, num_frames, C, H, W = x.shape
+
+        # Per-frame encoding, then windowed decoding
+        if self.lean():
+            # no reference kept here: the encoded window is freed inside _decode
+            return self._decode(self.encode(x.view(-1, C, H, W)).unflatten(0, (batch_size, num_frames)),
+                                return_weights=return_weights, query_index=query_index, inplace=True)
+
+        x = self.encode(x.view(-1, C, H, W))
+        x = x.view(batch_size, num_frames, *x.shape[1:]) # [batch_size, num_frames, 384, 24, 18]
+
+        return self.decode(x, return_weights=return_weights, query_index=query_index)
+
+    def lean(self):
+        """Whether this forward takes the memory-lean path (MODEL.LEAN_INFERENCE, only without autograd)."""
+        return self.lean_inference and not torch.is_grad_enabled()
+
+    def set_token_pruning(self, keep_ratio, start_layer):
+        """Keep only keep_ratio of the patch tokens after backbone layer start_layer (1 = off)."""
+        if self.token_pruning is not None:
+            self.token_pruning.remove()
+            self.token_pruning = None
+        if keep_ratio < 1:
+            self.token_pruning = TokenPruning(self.backbone, keep_ratio, start_layer)
+
+    def set_attention_backend(self, backend):
+        """Run the fusion, self- and cross-attention with backend ('mha' or 'sdpa', see multihead_attention)."""
+        if backend not in ('mha', 'sdpa'):
+            raise ValueError(f"Unknown attention backend: {backend}")
+        self.attention_backend = backend
+        self.feature_fusion.attention_fusion.attention_backend = backend
+        self.cross_attention.attention_backend = backend
+
+    def set_gradient_checkpointing(self, backbone=False, fusion=False):
+        """Trade compute for memory in training (TRAIN.CHECKPOINT_BACKBONE / CHECKPOINT_FUSION).
+
+        Args:
+            backbone (bool): Checkpoint every ViT layer, including the ones hooked by
+                ExtractIntermediateLayers (their hooks still receive the layer outputs).
+            fusion (bool): Checkpoint MultiScaleFeatureFusion. Its BatchNorm running statistics are
+                restored after the recompute, so they match training without checkpointing.
+        """
+        for layer in self.backbone.layers:
+            checkpoint_forward(layer, backbone)
+        checkpoint_forward(self.feature_fusion, fusion)
+
     def set_phase(self, phase):
         self.phase = phase
         self.is_train = True if phase == TRAIN_PHASE else False
@@ -333,6 +1016,8 @@ class Poseidon(nn.Module):
             target_weight (torch.Tensor[N, K, 2]):
                 Weights across different joint types.
         """
+        from mmpose.evaluation.functional import keypoint_pck_accuracy
+
         N = output.shape[0]
 
         _, avg_acc, cnt = keypoint_pck_accuracy(
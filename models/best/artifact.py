@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Self-contained Poseidon artifact: architecture hyperparameters and weights in one file.
+
+Building Poseidon from a training config goes through mmpose `init_model`, which parses the mmpose
+config and reads the full ViTPose checkpoint before the Poseidon weights overwrite it. An artifact
+written by `save_poseidon` is rebuilt by `load_poseidon` without mmpose: the ViTPose backbone is
+built directly from mmpretrain, the heatmap head in plain torch, and the weights are memory-mapped
+and assigned to the model instead of being copied into freshly initialized parameters.
+"""
+import inspect
+
+import torch
+import torch.nn as nn
+from easydict import EasyDict
+
+from posetimation.config.defaults import _C
+from models.best.Poseidon import Poseidon
+from models.best.quantization import is_quantized_checkpoint, load_quantized
+from models.best.pruning import is_pruned_checkpoint, apply_pruning
+
+ARTIFACT_FORMAT = 'poseidon-artifact'
+ARTIFACT_VERSION = 1
+
+# Poseidon hyperparameters stored in the artifact: the architecture the weights belong to
+MODEL_KEYS = ('EMBED_DIM', 'NUM_JOINTS', 'IMAGE_SIZE', 'HEATMAP_SIZE', 'FREEZE_WEIGHTS', 'LOCAL_ATTENTION_BLOCK',
+              'LOCAL_ATTENTION_HALO', 'FUSION_MODE', 'WINDOW_MODE', 'HEAD', 'SIMCC_SPLIT_RATIO', 'SIGMA')
+# Inference-time options of cfg.MODEL, not stored: taken from the config loading the artifact (apply_runtime_config)
+RUNTIME_KEYS = ('ATTENTION_BACKEND', 'FRAME_SKIP_THRESHOLD', 'FRAME_SKIP_TOPK', 'TOKEN_KEEP_RATIO', 'TOKEN_PRUNE_LAYER',
+                'LEAN_INFERENCE')
+# Architecture keys the dataset targets, the loss and the decoders read from the config: they must match the artifact
+HEAD_KEYS = ('IMAGE_SIZE', 'HEATMAP_SIZE', 'HEAD')
+SIMCC_KEYS = ('SIMCC_SPLIT_RATIO', 'SIGMA')
+
+
+class HeatmapHead(nn.Module):
+    """Deconvolution + final conv of mmpose's HeatmapHead, with the same parameter names."""
+    def __init__(self, in_channels, out_channels, deconv_out_channels=(256, 256), deconv_kernel_sizes=(4, 4),
+                 final_kernel_size=1):
+        super(HeatmapHead, self).__init__()
+        layers = []
+        for channels, kernel_size in zip(deconv_out_channels, deconv_kernel_sizes):
+            padding, output_padding = {4: (1, 0), 3: (1, 1), 2: (0, 0)}[kernel_size]
+            layers += [
+                nn.ConvTranspose2d(in_channels, channels, kernel_size, stride=2, padding=padding,
+                                   output_padding=output_padding, bias=False),
+                nn.BatchNorm2d(channels),
+                nn.ReLU(inplace=True),
+            ]
+            in_channels = channels
+        self.deconv_layers = nn.Sequential(*layers)
+        self.final_layer = nn.Conv2d(in_channels, out_channels, kernel_size=final_kernel_size)
+
+
+class ViTPose(nn.Module):
+    """Backbone + head container with the module names of mmpose's TopdownPoseEstimator."""
+    def __init__(self, backbone, head):
+        super(ViTPose, self).__init__()
+        self.backbone = backbone
+        self.head = head
+
+
+def vitpose_arch(model):
+    """Backbone / head hyperparameters of the mmpose model built by `init_model`."""
+    model_cfg = model.model.cfg.model
+    backbone = {k: v for k, v in dict(model_cfg.backbone).items() if k not in ('type', 'init_cfg')}
+    head = dict(model_cfg.head)
+    return {
+        'backbone': backbone,
+        'head': {
+            'in_channels': head['in_channels'],
+            'out_channels': head['out_channels'],
+            'deconv_out_channels': tuple(head.get('deconv_out_channels', (256, 256))),
+            'deconv_kernel_sizes': tuple(head.get('deconv_kernel_sizes', (4, 4))),
+            'final_kernel_size': dict(head.get('final_layer') or {}).get('kernel_size', 1),
+        },
+    }
+
+
+def build_vitpose(arch):
+    from mmpretrain.models.backbones import VisionTransformer
+
+    return ViTPose(VisionTransformer(**arch['backbone']), HeatmapHead(**arch['head']))
+
+
+def save_poseidon(model, cfg, path, pruning=None):
+    """Write `model` (built from `cfg`) as a self-contained artifact.
+
+    Args:
+        model (Poseidon): Model built with mmpose, with the weights to export loaded.
+        cfg: Config the model was built from (yacs CfgNode or the inference.py config).
+        path (str): Output file.
+        pruning (dict): Structure of a pruned model (models/best/pruning.py pruning_info), None otherwise.
+    """
+    artifact = {
+        'format': ARTIFACT_FORMAT,
+        'version': ARTIFACT_VERSION,
+        'cfg': {
+            'MODEL': {key: getattr(cfg.MODEL, key) for key in MODEL_KEYS},
+            'WINDOWS_SIZE': cfg.WINDOWS_SIZE,
+        },
+        'num_heads': model.num_heads,
+        'vitpose': vitpose_arch(model),
+        'model_state_dict': model.state_dict(),
+    }
+    if pruning is not None:
+        artifact['pruning'] = pruning
+    torch.save(artifact, path)
+
+
+def load_checkpoint(path):
+    """torch.load on the CPU, memory-mapping the file when torch supports it (>= 2.1)."""
+    if 'mmap' in inspect.signature(torch.load).parameters:
+        return torch.load(path, map_location='cpu', mmap=True)
+    return torch.load(path, map_location='cpu')
+
+
+def is_poseidon_artifact(checkpoint):
+    return isinstance(checkpoint, dict) and checkpoint.get('format') == ARTIFACT_FORMAT
+
+
+def poseidon_from_artifact(artifact, device='cpu', phase='test'):
+    """Build Poseidon from a loaded artifact without mmpose.
+
+    With torch >= 2.1 the model is created on the meta device and the (memory-mapped) weights are
+    assigned to it, so parameters are neither randomly initialized nor copied. Quantized artifacts
+    (tools/quantize_poseidon.py) are built on the CPU and quantized before loading. Pruned artifacts
+    (tools/prune_poseidon.py) get their pruned structure before loading.
+    """
+    if artifact.get('version', 0) > ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported Poseidon artifact version: {artifact['version']}")
+
+    cfg = EasyDict(artifact['cfg'])
+    # keys missing from older artifacts (and the runtime keys) get their defaults
+    for key in MODEL_KEYS + RUNTIME_KEYS:
+        if key not in cfg.MODEL:
+            cfg.MODEL[key] = _C.MODEL[key]
+    cfg.MODEL.IMAGE_SIZE = tuple(cfg.MODEL.IMAGE_SIZE)
+    cfg.MODEL.HEATMAP_SIZE = tuple(cfg.MODEL.HEATMAP_SIZE)
+    state_dict = artifact['model_state_dict']
+
+    def build(device):
+        model = Poseidon(cfg, device=device, phase=phase, num_heads=artifact['num_heads'],
+                         vitpose=build_vitpose(artifact['vitpose']))
+        if is_pruned_checkpoint(artifact):
+            apply_pruning(model, artifact['pruning'])
+        return model
+
+    if is_quantized_checkpoint(artifact):
+        return load_quantized(build('cpu'), artifact)
+
+    if 'assign' in inspect.signature(nn.Module.load_state_dict).parameters:
+        with torch.device('meta'):
+            model = build(device)
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model = build(device)
+        model.load_state_dict(state_dict)
+
+    return model.to(device)
+
+
+def check_head_config(artifact, cfg):
+    """Raise ValueError when the head settings of cfg.MODEL differ from the ones the artifact was built with."""
+    artifact_cfg = artifact['cfg']['MODEL']
+    head = artifact_cfg.get('HEAD', _C.MODEL.HEAD)
+    keys = HEAD_KEYS + SIMCC_KEYS if head == 'simcc' else HEAD_KEYS
+    for key in keys:
+        expected, value = artifact_cfg.get(key, _C.MODEL[key]), cfg.MODEL[key]
+        if isinstance(expected, (list, tuple)):
+            expected, value = tuple(expected), tuple(value)
+        if value != expected:
+            raise ValueError(f"MODEL.{key} is {value} in the config but {expected} in the artifact: "
+                             f"the targets, loss and decoding would not match the model")
+
+
+def apply_runtime_config(model, cfg):
+    """Set the inference-time options of cfg.MODEL (RUNTIME_KEYS) on a Poseidon built from an artifact."""
+    model.set_attention_backend(cfg.MODEL.ATTENTION_BACKEND)
+    model.frame_skip_threshold = cfg.MODEL.FRAME_SKIP_THRESHOLD
+    model.frame_skip_topk = cfg.MODEL.FRAME_SKIP_TOPK
+    model.set_token_pruning(cfg.MODEL.TOKEN_KEEP_RATIO, cfg.MODEL.TOKEN_PRUNE_LAYER)
+    model.lean_inference = cfg.MODEL.LEAN_INFERENCE
+    return model
+
+
+def load_poseidon(cfg, path=None, device='cpu', phase='test'):
+    """Poseidon from any checkpoint: a .pt training checkpoint, an artifact (exported by `save_poseidon`
+    or pruned by tools/prune_poseidon.py) or an int8 checkpoint of tools/quantize_poseidon.py.
+
+    Args:
+        cfg: Config of the model (yacs CfgNode or the inference.py config). Checkpoints other than
+            artifacts are built from it, artifacts only take its inference-time options (RUNTIME_KEYS)
+            and must have its head settings (check_head_config); None to load artifacts only, with the
+            default options.
+        path (str or dict): Checkpoint file, or a checkpoint already read by `load_checkpoint`. None
+            builds the model of cfg with its initial weights.
+        device (str): Device of the model. int8 checkpoints only run on the CPU.
+        phase (str): Phase of the model.
+    """
+    checkpoint = load_checkpoint(path) if isinstance(path, str) else path
+    if is_quantized_checkpoint(checkpoint) and str(device) != 'cpu':
+        raise ValueError("int8 checkpoints only run on the CPU")
+    if is_poseidon_artifact(checkpoint):
+        if cfg is None:
+            return poseidon_from_artifact(checkpoint, device=device, phase=phase)
+        check_head_config(checkpoint, cfg)
+        return apply_runtime_config(poseidon_from_artifact(checkpoint, device=device, phase=phase), cfg)
+
+    if cfg is None:
+        raise ValueError(f"{path} is not a Poseidon artifact: a config is needed to build the model, "
+                         f"or export it with tools/export_poseidon.py")
+    model = Poseidon(cfg, phase=phase, device=device)
+    if is_quantized_checkpoint(checkpoint):
+        model = load_quantized(model, checkpoint)
+    elif checkpoint is not None:
+        model.load_state_dict(checkpoint['model_state_dict'])
+    return model.to(device)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Compiled (torch.compile) inference mode for Poseidon.
+
+The selected methods (forward, or encode / decode for the offline inference path) are compiled with
+static shapes and warmed up once per batch bucket, so that padding the batches to those buckets
+(inference.py --pad_buckets, the fixed val batch size) never triggers a recompilation at run time.
+Ops dynamo or inductor cannot handle fall back to eager (graph breaks, suppressed backend errors);
+if compilation fails altogether the eager methods are restored.
+"""
+import contextlib
+import time
+
+import torch
+from tabulate import tabulate
+
+
+def example_input(model, method, batch_size, window, image_size, device):
+    width, height = image_size
+    if method == 'forward':
+        return torch.zeros(batch_size, window, 3, height, width, device=device)
+    if method == 'encode':
+        return torch.zeros(batch_size, 3, height, width, device=device)
+    if method == 'decode':
+        h, w = model.token_grid(image_size)
+        return torch.zeros(batch_size, window, model.embed_dim, h, w, device=device)
+    raise ValueError(f"Unknown Poseidon method: {method}")
+
+
+def _timed(fn, x, device, iters=1, context=contextlib.nullcontext):
+    with torch.no_grad(), context():
+        if str(device).startswith('cuda'):
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(iters):
+            fn(x)
+        if str(device).startswith('cuda'):
+            torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / iters
+
+
+def compile_poseidon(model, batch_sizes, window, image_size, device, methods=('forward',), mode='default',
+                     context=contextlib.nullcontext, report=False, iters=10):
+    """Compile `methods` of `model` in place and warm them up for every batch size.
+
+    Args:
+        model (Poseidon): Model in eval mode, on `device`.
+        batch_sizes (iterable of int): Batch buckets to compile ahead of time.
+        window (int): Frames per window.
+        image_size (tuple): (width, height) of the crops.
+        device (str): Device of the model.
+        methods (tuple of str): Poseidon methods to compile: 'forward', 'encode', 'decode'.
+        mode (str): torch.compile mode. 'reduce-overhead' (CUDA graphs) reuses its output buffers,
+            so only use it when outputs are consumed before the next call.
+        context (callable): Context manager the model runs under at inference time (e.g. the
+            autocast of core.function.validate), so that the warmup compiles the same graphs.
+        report (bool): Print the compile time and the eager / compiled steady-state latency per bucket.
+        iters (int): Iterations of the steady-state measurement.
+
+    Returns:
+        bool: True if the model was compiled, False if it was left in eager mode.
+    """
+    if not hasattr(torch, 'compile'):
+        print("\033[93m" + "torch.compile is not available, running in eager mode" + "\033[0m")
+        return False
+
+    import torch._dynamo as dynamo
+    dynamo.config.suppress_errors = True  # fall back to eager on unsupported ops
+    dynamo.config.cache_size_limit = max(dynamo.config.cache_size_limit, 2 * len(set(batch_sizes)))
+
+    eager = {method: getattr(model, method) for method in methods}
+    for method in methods:
+        setattr(model, method, torch.compile(eager[method], mode=mode, dynamic=False))
+
+    rows = []
+    try:
+        for method in methods:
+            for batch_size in sorted(set(batch_sizes)):
+                x = example_input(model, method, batch_size, window, image_size, device)
+                compile_time = _timed(getattr(model, method), x, device, context=context)
+                if report:
+                    eager_time = _timed(eager[method], x, device, iters, context)
+                    compiled_time = _timed(getattr(model, method), x, device, iters, context)
+                    rows.append([method, batch_size, f"{compile_time:.1f}", f"{eager_time * 1000:.1f}",
+                                 f"{compiled_time * 1000:.1f}", f"{eager_time / compiled_time:.2f}"])
+    except Exception as e:
+        for method in methods:
+            setattr(model, method, eager[method])
+        print("\033[93m" + f"torch.compile failed ({type(e).__name__}: {e}), running in eager mode" + "\033[0m")
+        return False
+
+    if report:
+        headers = ["Method", "Batch", "Compile + first run (s)", "Eager (ms)", "Compiled (ms)", "Speedup"]
+        print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+    return True
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+CPU inference profile for Poseidon (CPU.PROFILE in the config, inference.py --cpu_profile).
+
+torch.cuda.amp.autocast does nothing on the CPU, so CPU inference otherwise runs in fp32 with
+PyTorch's default threading. The profile:
+- runs the forward under bf16 autocast when the CPU has native bf16 support (AVX512-BF16 / AMX);
+- keeps the convolutional parts (the fusion's PyramidPoolingModule and fusion_conv, the frame quality
+  estimator of AdaptiveFrameWeighting, the deconvolution head) in channels-last, the layout of the
+  oneDNN convolution kernels. Inputs are converted on entry and outputs made contiguous on exit, so
+  the rest of the model sees the usual layout;
+- sizes the intra-op thread pool to one thread per physical core (hyper-threads only compete for the
+  same matrix units) and pins the process to those cores.
+"""
+import contextlib
+import functools
+import os
+
+import torch
+
+
+@functools.lru_cache(maxsize=None)
+def bf16_supported():
+    """Whether the CPU runs bf16 matmuls / convolutions natively (oneDNN with AVX512-BF16 or AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        pass
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def physical_cores():
+    """One logical CPU per physical core among the CPUs this process may run on."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    cores = {}
+    for cpu in cpus:
+        topology = f'/sys/devices/system/cpu/cpu{cpu}/topology'
+        try:
+            with open(f'{topology}/physical_package_id') as f:
+                package = f.read().strip()
+            with open(f'{topology}/core_id') as f:
+                core = f.read().strip()
+        except OSError:
+            package, core = '0', str(cpu)
+        cores.setdefault((package, core), cpu)
+    return sorted(cores.values())
+
+
+def autocast_context(config, device):
+    """Autocast of inference on `device`: fp16 on CUDA, bf16 on the CPU with CPU.PROFILE (if supported)."""
+    device_type = torch.device(device).type
+    if device_type == 'cuda':
+        return torch.autocast(device_type='cuda')
+    if device_type == 'cpu' and config.CPU.PROFILE and config.CPU.BF16 and bf16_supported():
+        return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def _channels_last_input(module, inputs):
+    return (inputs[0].contiguous(memory_format=torch.channels_last),) + tuple(inputs[1:])
+
+
+def _contiguous_output(module, inputs, output):
+    return output.contiguous()
+
+
+class CpuProfile:
+    """Apply the CPU inference profile to a Poseidon model; `remove` restores the defaults."""
+
+    def __init__(self, model, bf16=True, channels_last=True, num_threads=0, pin_threads=True):
+        """
+        Args:
+            model (Poseidon): Model in eval mode, on the CPU.
+            bf16 (bool): Run under bf16 autocast, when the CPU supports it (see bf16_supported).
+            channels_last (bool): Channels-last convolutional parts.
+            num_threads (int): Intra-op threads (0 = one per physical core).
+            pin_threads (bool): Restrict the process to one logical CPU of each of the num_threads
+                first physical cores.
+        """
+        self.model = model
+        self.bf16 = bf16 and bf16_supported()
+        self._handles = []
+        self._modules = []
+        self._num_threads = torch.get_num_threads()
+        self._affinity = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+
+        cores = physical_cores()
+        self.num_threads = num_threads if num_threads > 0 else len(cores)
+        self.pinned = pin_threads and self._affinity is not None
+        if self.pinned:
+            # more threads than physical cores: pin to as many hyper-threads as needed
+            pinned = cores[:self.num_threads]
+            extra = sorted(self._affinity - set(pinned))
+            os.sched_setaffinity(0, pinned + extra[:max(self.num_threads - len(pinned), 0)])
+        torch.set_num_threads(self.num_threads)
+
+        self.channels_last = channels_last
+        if channels_last:
+            for module, contiguous_output in self.conv_units(model):
+                module.to(memory_format=torch.channels_last)
+                self._handles.append(module.register_forward_pre_hook(_channels_last_input))
+                if contiguous_output:
+                    self._handles.append(module.register_forward_hook(_contiguous_output))
+                self._modules.append(module)
+
+    @staticmethod
+    def conv_units(model):
+        """(module, contiguous output) of the convolutional parts run in channels-last."""
+        fusion = model.feature_fusion
+        units = [(fusion.ppm, False), (fusion.fusion_conv, True),
+                 (model.adaptive_weighting.frame_quality_estimator, True)]
+        if model.simcc_head is not None:
+            units.append((model.simcc_head.final_layer, True))
+        else:
+            units += [(model.deconv_layer, False), (model.final_layer, True)]
+        return units
+
+    def autocast(self):
+        return torch.autocast(device_type='cpu', dtype=torch.bfloat16, enabled=self.bf16)
+
+    def remove(self):
+        for handle in self._handles:
+            handle.remove()
+        for module in self._modules:
+            module.to(memory_format=torch.contiguous_format)
+        self._handles, self._modules = [], []
+        torch.set_num_threads(self._num_threads)
+        if self.pinned:
+            os.sched_setaffinity(0, self._affinity)
+
+    def summary(self):
+        bf16 = 'on' if self.bf16 else 'off' if bf16_supported() else 'off (not supported by this CPU)'
+        pinned = ' pinned to physical cores' if self.pinned else ''
+        return (f"bf16 autocast {bf16}, channels-last {'on' if self.channels_last else 'off'}, "
+                f"{self.num_threads} intra-op threads{pinned}")
+
+
+def cpu_profile_from_config(model, config, num_threads=None):
+    """CpuProfile with the CPU section of the config (num_threads overrides CPU.NUM_THREADS)."""
+    return CpuProfile(model, bf16=config.CPU.BF16, channels_last=config.CPU.CHANNELS_LAST,
+                      num_threads=config.CPU.NUM_THREADS if num_threads is None else num_threads,
+                      pin_threads=config.CPU.PIN_THREADS)
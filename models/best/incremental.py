@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Incremental backbone computation for tracked crops from static cameras.
+
+Consecutive crops of the same track often differ in a few patches only. IncrementalEncoder keeps, per
+track, the patch embeddings and the outputs of the first `depth` ViT layers of the previous frame. For
+a new frame, only the patches whose embedding moved by more than `threshold` (relative L2 distance to
+the cached embedding) go through those layers, and the cached tokens are reused for the others; the
+layers from `depth` on run on the full token grid. When no patch of the batch moved, the reused layers
+do not run at all. In the reused layers the recomputed tokens only attend to each other, so the result
+is an approximation controlled by threshold and depth.
+"""
+from collections import OrderedDict
+
+import torch
+
+
+class _ForwardPatch:
+    """Replacement of a module's forward, removable like a hook handle."""
+
+    def __init__(self, module, forward):
+        self.module = module
+        self.saved = module.__dict__.get('forward')  # e.g. checkpoint_forward's
+        module.forward = forward
+
+    def remove(self):
+        if self.saved is None:
+            self.module.__dict__.pop('forward', None)
+        else:
+            self.module.forward = self.saved
+
+
+class IncrementalEncoder:
+    """Poseidon.encode with per-track reuse of the early backbone tokens (eager mode only)."""
+
+    def __init__(self, model, threshold=0.05, depth=4, capacity=256):
+        """
+        Args:
+            model (Poseidon): Model in eval mode.
+            threshold (float): Relative embedding change above which a patch is recomputed.
+            depth (int): Number of leading ViT layers whose tokens are reused.
+            capacity (int): Max number of tracks kept in the cache (least recently used evicted).
+        """
+        backbone = model.backbone
+        if not 0 < depth <= len(backbone.layers):
+            raise ValueError(f"Incremental depth {depth} out of range for {len(backbone.layers)} layers")
+        if model.token_pruning is not None:
+            raise ValueError("The incremental backbone cannot be combined with token pruning")
+        self.model = model
+        self.threshold = threshold
+        self.depth = depth
+        self.capacity = capacity
+        self.num_extra_tokens = getattr(backbone, 'num_extra_tokens', 0)
+        self.cache = OrderedDict()
+        self.recomputed_tokens = 0
+        self.total_tokens = 0
+
+        self._keys = None
+        self._index = None  # [B, k, C] tokens recomputed in the reused layers, None = all
+        self._skip = False  # no patch changed: the reused layers return their cached outputs
+        self._entries = None
+
+        self.handles = [backbone.patch_embed.register_forward_hook(self._select)]
+        for i, layer in enumerate(backbone.layers[:depth]):
+            self.handles.append(layer.register_forward_pre_hook(self._gather))
+            # before the other forward hooks (ExtractIntermediateLayers), so that they see the full grid
+            self.handles.append(layer.register_forward_hook(self._make_scatter(i), prepend=True))
+            self.handles.append(_ForwardPatch(layer, self._make_forward(layer, i)))
+
+    @property
+    def recomputed_fraction(self):
+        return self.recomputed_tokens / max(self.total_tokens, 1)
+
+    def reset(self):
+        """Forget every track (e.g. at a video change)."""
+        self.cache.clear()
+
+    def remove(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def encode(self, x, keys):
+        """
+        Args:
+            x (torch.Tensor[N, C, H, W]): One crop per track, the next frame of each.
+            keys (list): Track key of each crop, unique within the call.
+
+        Returns:
+            torch.Tensor[N, embed_dim, h, w]: Same output as Poseidon.encode.
+        """
+        keys = list(keys)
+        if len(set(keys)) != len(keys):
+            raise ValueError("Each track can only appear once per incremental encode call")
+        self._keys = keys
+        try:
+            with torch.no_grad():
+                return self.model.encode(x)
+        finally:
+            for key, entry in zip(keys, self._entries or []):
+                self.cache[key] = entry
+                self.cache.move_to_end(key)
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+            self._keys = self._index = self._entries = None
+            self._skip = False
+
+    def forward_windows(self, x):
+        """Poseidon.forward with the frames of each window encoded in temporal order as one track.
+
+        Args:
+            x (torch.Tensor[B, T, C, H, W]): Windows of crops with a fixed box (e.g. PoseTrack windows).
+        """
+        self.reset()
+        features = [self.encode(x[:, t], range(x.shape[0])) for t in range(x.shape[1])]
+        self.reset()
+        return self.model.decode(torch.stack(features, dim=1))
+
+    def _select(self, module, inputs, output):
+        if self._keys is None:
+            return
+        embedding = output[0] if isinstance(output, tuple) else output  # [B, N, C]
+        num_patches = embedding.shape[1]
+        cached = [self.cache.get(key) for key in self._keys]
+        self._skip = False
+
+        if any(entry is None or entry['embedding'].shape != embedding.shape[1:] for entry in cached):
+            # a new track (or crop size) in the batch: full computation for every crop
+            self._index = None
+            self._entries = [{'embedding': e, 'layers': []} for e in embedding]
+            changed = num_patches * len(cached)
+        else:
+            reference = torch.stack([entry['embedding'] for entry in cached])
+            delta = (embedding - reference).norm(dim=-1) / reference.norm(dim=-1).clamp_min(1e-6)
+            k = int((delta > self.threshold).sum(dim=1).max().item())
+            if k == 0:
+                self._index = None
+                self._skip = True
+                self._entries = [{'embedding': entry['embedding'], 'layers': list(entry['layers'])} for entry in cached]
+                self.total_tokens += num_patches * len(cached)
+                return
+            patch_index = delta.topk(k, dim=1).indices.sort(dim=1).values
+            changed = patch_index.numel()
+
+            gather_index = patch_index.unsqueeze(-1).expand(-1, -1, embedding.shape[-1])
+            reference = reference.scatter(1, gather_index, embedding.gather(1, gather_index))
+            self._entries = [{'embedding': e, 'layers': list(entry['layers'])} for e, entry in zip(reference, cached)]
+
+            token_index = patch_index + self.num_extra_tokens
+            if self.num_extra_tokens:
+                extra = torch.arange(self.num_extra_tokens, device=token_index.device)
+                token_index = torch.cat([extra.expand(token_index.shape[0], -1), token_index], dim=1)
+            self._index = token_index.unsqueeze(-1).expand(-1, -1, embedding.shape[-1])
+
+        self.recomputed_tokens += changed
+        self.total_tokens += num_patches * len(cached)
+
+    def _gather(self, module, inputs):
+        if self._keys is None or self._index is None:
+            return None
+        return (inputs[0].gather(1, self._index), *inputs[1:])
+
+    def _make_forward(self, layer, layer_idx):
+        forward = layer.forward
+
+        def incremental_forward(*args, **kwargs):
+            if self._keys is not None and self._skip:
+                return torch.stack([entry['layers'][layer_idx] for entry in self._entries])
+            return forward(*args, **kwargs)
+        return incremental_forward
+
+    def _make_scatter(self, layer_idx):
+        def scatter(module, inputs, output):
+            if self._keys is None or self._skip:
+                return None
+            if self._index is not None:
+                cached = torch.stack([entry['layers'][layer_idx] for entry in self._entries])
+                output = cached.scatter(1, self._index, output)
+            for entry, tokens in zip(self._entries, output):
+                if self._index is None:
+                    entry['layers'].append(tokens)
+                else:
+                    entry['layers'][layer_idx] = tokens
+            return output
+        return scatter
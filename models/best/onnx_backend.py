@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+ONNX export of Poseidon.forward and an ONNX Runtime (CPU) wrapper with the same call interface.
+
+With PyTorch >= 2.5 the graph is captured with torch.export (dynamo=True): the forward hooks of
+ExtractIntermediateLayers run during capture and their outputs become regular graph edges, and both
+the batch and the window length are dynamic. Older versions fall back to the TorchScript exporter with
+static shapes (the adaptive pooling of the PPM cannot be exported with traced spatial sizes); the
+runtime wrapper then pads / splits batches to the exported batch size.
+"""
+import inspect
+import os
+import warnings
+
+import numpy as np
+import torch
+
+ONNX_OPSET = 17
+
+
+def export_onnx(model, path, window, image_size, batch_size=2, dynamic_window=True, opset=ONNX_OPSET, dynamo=None):
+    """Export `model` (Poseidon) to `path`.
+
+    Args:
+        model (Poseidon): Model to export.
+        path (str): Output .onnx file.
+        window (int): Window length of the example input (fixed when dynamic_window is False).
+        image_size (tuple): (width, height) of the input crops.
+        batch_size (int): Batch size of the example input (the exported batch size for the
+            TorchScript fallback).
+        dynamic_window (bool): Allow any window length in the exported graph.
+        opset (int): ONNX opset version of the TorchScript fallback (torch.export uses the
+            exporter's default opset).
+        dynamo (bool): True / False forces torch.export / the TorchScript exporter, None picks
+            torch.export when this PyTorch version supports it.
+    """
+    width, height = image_size
+    dummy = torch.randn(batch_size, window, 3, height, width)
+    model = model.cpu().eval()
+
+    if dynamo is None:
+        dynamo = has_dynamo_export()
+    with torch.no_grad():
+        if dynamo:
+            dynamic_shapes = {0: torch.export.Dim('batch', min=1, max=1024)}
+            if dynamic_window:
+                dynamic_shapes[1] = torch.export.Dim('window', min=2, max=64)
+            torch.onnx.export(model, (dummy,), path, input_names=['frames'], output_names=['heatmaps'],
+                              dynamic_shapes=(dynamic_shapes,), dynamo=True)
+        else:
+            kwargs = {'dynamo': False} if has_dynamo_export() else {}
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', torch.jit.TracerWarning)
+                torch.onnx.export(model, (dummy,), path, input_names=['frames'], output_names=['heatmaps'],
+                                  opset_version=opset, do_constant_folding=True, **kwargs)
+
+
+def has_dynamo_export():
+    """Whether torch.onnx.export can capture the graph with torch.export (PyTorch >= 2.5)."""
+    return 'dynamo' in inspect.signature(torch.onnx.export).parameters
+
+
+def ort_session(path, intra_op_threads=0, inter_op_threads=1):
+    """ONNX Runtime CPU session tuned for a single stream of batched windows.
+
+    Args:
+        intra_op_threads (int): Threads inside each operator (0 = one per physical core).
+        inter_op_threads (int): Threads running independent operators in parallel. Poseidon is a
+            chain of large operators, so sequential execution with one inter-op thread is usually best.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = (ort.ExecutionMode.ORT_SEQUENTIAL if inter_op_threads <= 1
+                              else ort.ExecutionMode.ORT_PARALLEL)
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+class OnnxPoseidon:
+    """Callable drop-in for Poseidon.forward backed by an ONNX Runtime session."""
+
+    def __init__(self, path, intra_op_threads=0, inter_op_threads=1):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"ONNX model not found: {path}")
+        self.session = ort_session(path, intra_op_threads, inter_op_threads)
+        self.input_name = self.session.get_inputs()[0].name
+        # Symbolic dims are strings, static ones ints
+        batch, window = self.session.get_inputs()[0].shape[:2]
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.window = window if isinstance(window, int) else None
+
+    def __call__(self, x, meta=None):
+        if self.window is not None and x.shape[1] != self.window:
+            raise ValueError(f"The ONNX graph was exported for windows of {self.window} frames, got {x.shape[1]}")
+        inp = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+
+        if self.batch_size is None:
+            heatmaps = self.session.run(None, {self.input_name: inp})[0]
+        else:
+            # Static batch: run in chunks, zero-padding the last one
+            outputs = []
+            for start in range(0, len(inp), self.batch_size):
+                chunk = inp[start:start + self.batch_size]
+                pad = self.batch_size - len(chunk)
+                if pad:
+                    chunk = np.concatenate([chunk, np.zeros((pad, *chunk.shape[1:]), dtype=chunk.dtype)])
+                outputs.append(self.session.run(None, {self.input_name: chunk})[0][:self.batch_size - pad])
+            heatmaps = np.concatenate(outputs)
+
+        return torch.from_numpy(heatmaps).to(x.device)
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Structured pruning of Poseidon (tools/prune_poseidon.py).
+
+Whole units are removed from a trained model, so the result is a smaller dense model:
+- attention heads of the ViT backbone layers (rows of qkv, columns of proj), ranked by their
+  contribution to the residual stream on calibration windows;
+- trailing ViT layers after the deepest layer read by the multi-scale fusion (`return_layers`);
+- pool branches of the fusion's PyramidPoolingModule (and the matching input channels of fusion_conv).
+
+The pruned structure is stored with the weights (`pruning_info`), and `apply_pruning` rebuilds it on a
+freshly built model before the state dict is loaded (see models/best/artifact.py).
+"""
+import torch
+import torch.nn as nn
+
+PRUNING_VERSION = 1
+
+
+def head_importance(model, batches):
+    """Contribution of each backbone attention head on the windows of `batches`.
+
+    The importance of a head is the mean L2 norm of its attention output times the norm of its
+    columns in the output projection, i.e. how much it writes into the residual stream.
+
+    Args:
+        model (Poseidon): Model in eval mode.
+        batches (iterable of torch.Tensor[B, T, C, H, W]): Calibration windows.
+
+    Returns:
+        list of torch.Tensor[num_heads]: Importance of the heads of each layer.
+    """
+    layers = model.backbone.layers
+    scores = [torch.zeros(layer.attn.num_heads) for layer in layers]
+    counts = [0] * len(layers)
+
+    def make_hook(idx):
+        def hook(module, inputs):
+            attn = layers[idx].attn
+            heads = inputs[0].detach().float().reshape(-1, attn.num_heads, attn.head_dims)
+            weight = module.weight.detach().float().view(module.out_features, attn.num_heads, attn.head_dims)
+            scores[idx] += (heads.norm(dim=-1).sum(dim=0) * weight.norm(dim=(0, 2))).cpu()
+            counts[idx] += heads.shape[0]
+        return hook
+
+    handles = [layer.attn.proj.register_forward_pre_hook(make_hook(i)) for i, layer in enumerate(layers)]
+    device = next(model.parameters()).device
+    try:
+        with torch.no_grad():
+            for x in batches:
+                model(x.to(device))
+    finally:
+        for handle in handles:
+            handle.remove()
+    return [score / max(count, 1) for score, count in zip(scores, counts)]
+
+
+def select_heads(importance, prune_ratio):
+    """Heads kept per layer after removing the prune_ratio least important heads of the backbone.
+
+    Scores are normalized per layer before the global ranking, and every layer keeps at least one head.
+    """
+    scores = [score / score.sum().clamp_min(1e-12) for score in importance]
+    ranking = sorted((float(score), layer, head) for layer, layer_scores in enumerate(scores)
+                     for head, score in enumerate(layer_scores))
+    num_prune = int(round(prune_ratio * len(ranking)))
+    kept = [set(range(len(layer_scores))) for layer_scores in scores]
+    for _, layer, head in ranking:
+        if num_prune == 0:
+            break
+        if len(kept[layer]) > 1:
+            kept[layer].discard(head)
+            num_prune -= 1
+    return [sorted(heads) for heads in kept]
+
+
+def prune_heads(model, heads):
+    """Keep only the attention heads `heads[i]` (list of head indices) of each backbone layer i."""
+    for layer, kept in zip(model.backbone.layers, heads):
+        attn = layer.attn
+        if len(kept) == attn.num_heads:
+            continue
+        if not kept:
+            raise ValueError("Every backbone layer needs at least one attention head")
+        head_dims = attn.head_dims
+        device = attn.qkv.weight.device
+        index = torch.cat([torch.arange(h * head_dims, (h + 1) * head_dims, device=device) for h in kept])
+        # qkv rows are ordered (q | k | v) x heads x head_dims
+        qkv_index = torch.cat([index + i * attn.num_heads * head_dims for i in range(3)])
+
+        qkv = nn.Linear(attn.qkv.in_features, len(qkv_index), bias=attn.qkv.bias is not None, device=device,
+                        dtype=attn.qkv.weight.dtype)
+        proj = nn.Linear(len(index), attn.proj.out_features, bias=attn.proj.bias is not None, device=device,
+                         dtype=attn.proj.weight.dtype)
+        with torch.no_grad():
+            qkv.weight.copy_(attn.qkv.weight[qkv_index])
+            if qkv.bias is not None:
+                qkv.bias.copy_(attn.qkv.bias[qkv_index])
+            proj.weight.copy_(attn.proj.weight[:, index])
+            if proj.bias is not None:
+                proj.bias.copy_(attn.proj.bias)
+        qkv.weight.requires_grad_(attn.qkv.weight.requires_grad)
+        proj.weight.requires_grad_(attn.proj.weight.requires_grad)
+
+        attn.qkv, attn.proj = qkv, proj
+        attn.num_heads = len(kept)
+        attn.embed_dims = len(kept) * head_dims
+    return model
+
+
+def truncate_backbone(model, depth):
+    """Drop the ViT layers from `depth` on. The layers read by the fusion (return_layers) must be kept."""
+    backbone = model.backbone
+    deepest = max(int(name.split('.')[1]) for name in model.return_layers)
+    if not deepest < depth <= len(backbone.layers):
+        raise ValueError(f"Backbone depth must be in ({deepest}, {len(backbone.layers)}], got {depth}")
+    backbone.layers = backbone.layers[:depth]
+    # the final norm and the output are applied after the new last layer
+    backbone.out_indices = [depth - 1]
+    if hasattr(backbone, 'num_layers'):
+        backbone.num_layers = depth
+    return model
+
+
+def pool_sizes(model):
+    return [path[0].output_size for path in model.feature_fusion.ppm.paths]
+
+
+def prune_pyramid_pooling(model, sizes):
+    """Keep only the PyramidPoolingModule branches of pool size in `sizes`."""
+    fusion = model.feature_fusion
+    paths = fusion.ppm.paths
+    current = pool_sizes(model)
+    missing = [size for size in sizes if size not in current]
+    if missing:
+        raise ValueError(f"No pool branch of size {missing}, the model has {current}")
+    keep = [current.index(size) for size in sizes]
+
+    conv = fusion.fusion_conv
+    branch_channels = [path[1].out_channels for path in paths]
+    offsets = [conv.in_channels - sum(branch_channels)]
+    for channels in branch_channels:
+        offsets.append(offsets[-1] + channels)
+    # input channels of fusion_conv: the features, then one block per pool branch
+    channels = list(range(offsets[0])) + [c for i in keep for c in range(offsets[i], offsets[i + 1])]
+    index = torch.tensor(channels, device=conv.weight.device)
+
+    new_conv = nn.Conv2d(len(channels), conv.out_channels, conv.kernel_size, stride=conv.stride,
+                         padding=conv.padding, bias=conv.bias is not None, device=conv.weight.device,
+                         dtype=conv.weight.dtype)
+    with torch.no_grad():
+        new_conv.weight.copy_(conv.weight[:, index])
+        if conv.bias is not None:
+            new_conv.bias.copy_(conv.bias)
+    new_conv.weight.requires_grad_(conv.weight.requires_grad)
+
+    fusion.ppm.paths = nn.ModuleList(paths[i] for i in keep)
+    fusion.fusion_conv = new_conv
+    return model
+
+
+def pruning_info(model):
+    """Structure of a (pruned) model, stored next to its weights."""
+    return {
+        'version': PRUNING_VERSION,
+        'num_layers': len(model.backbone.layers),
+        'num_heads': [layer.attn.num_heads for layer in model.backbone.layers],
+        'pool_sizes': pool_sizes(model),
+    }
+
+
+def is_pruned_checkpoint(checkpoint):
+    return isinstance(checkpoint, dict) and 'pruning' in checkpoint
+
+
+def apply_pruning(model, info):
+    """Give the unpruned `model` the structure of `info` (pruning_info), before loading the pruned weights."""
+    if info.get('version', 0) > PRUNING_VERSION:
+        raise ValueError(f"Unsupported pruned checkpoint version: {info['version']}")
+    if info['num_layers'] != len(model.backbone.layers):
+        truncate_backbone(model, info['num_layers'])
+    # weights come from the checkpoint: only the number of heads matters
+    prune_heads(model, [list(range(num_heads)) for num_heads in info['num_heads']])
+    if list(info['pool_sizes']) != pool_sizes(model):
+        prune_pyramid_pooling(model, info['pool_sizes'])
+    return model
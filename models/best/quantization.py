@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Post-training int8 quantization of Poseidon for CPU deployment.
+
+- Dynamic int8 (weights int8, activations quantized on the fly) for every nn.Linear: the ViT backbone
+  (qkv / proj / FFN), the fusion projection and the attention blocks. The nn.MultiheadAttention modules
+  are first rewritten as ProjectedMultiheadAttention so their projections are plain nn.Linear layers.
+- Static int8 (activation ranges calibrated on real windows) for the convolutions of the
+  PyramidPoolingModule paths, the multi-scale fusion conv and the AdaptiveFrameWeighting estimator,
+  fused with their BatchNorm / ReLU.
+
+The deconvolution head stays in float. Quantized models only run on the CPU.
+"""
+import warnings
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import (DeQuantStub, QuantStub, convert, fuse_modules, get_default_qconfig, prepare,
+                                   quantize_dynamic)
+
+from models.best.Poseidon import ProjectedMultiheadAttention
+
+QUANTIZATION_VERSION = 1
+
+
+class QuantizedBlock(nn.Module):
+    """Float in / float out wrapper running `module` with static quantization."""
+    def __init__(self, module):
+        super(QuantizedBlock, self).__init__()
+        self.quant = QuantStub()
+        self.module = module
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.module(self.quant(x)))
+
+
+def quantized_engine():
+    """Quantized kernel backend of this machine: x86 / fbgemm on Intel-AMD, qnnpack on ARM."""
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("No quantized engine available in this PyTorch build")
+
+
+def prepare_quantization(model, engine=None):
+    """Rewrite `model` (Poseidon, on the CPU) in place for quantization and insert the static observers."""
+    engine = engine or quantized_engine()
+    torch.backends.quantized.engine = engine
+    model.cpu().eval()
+
+    # Attention modules with plain nn.Linear projections
+    fusion = model.feature_fusion
+    fusion.attention_fusion.attention = ProjectedMultiheadAttention.from_mha(fusion.attention_fusion.attention)
+    model.self_attention = ProjectedMultiheadAttention.from_mha(model.self_attention)
+    model.cross_attention.mha = ProjectedMultiheadAttention.from_mha(model.cross_attention.mha)
+
+    # Static blocks: conv + bn + relu fused, between quant / dequant stubs
+    blocks = []
+    for i, path in enumerate(fusion.ppm.paths):
+        fuse_modules(path, [['1', '2', '3']], inplace=True)  # AdaptiveAvgPool2d, Conv2d, BatchNorm2d, ReLU
+        fusion.ppm.paths[i] = QuantizedBlock(path)
+        blocks.append(fusion.ppm.paths[i])
+
+    fuse_modules(fusion, [['fusion_conv', 'fusion_norm', 'fusion_act']], inplace=True)
+    fusion.fusion_conv = QuantizedBlock(fusion.fusion_conv)
+    blocks.append(fusion.fusion_conv)
+
+    weighting = model.adaptive_weighting
+    fuse_modules(weighting.frame_quality_estimator, [['0', '1']], inplace=True)  # Conv2d, ReLU
+    weighting.frame_quality_estimator = QuantizedBlock(weighting.frame_quality_estimator)
+    blocks.append(weighting.frame_quality_estimator)
+
+    qconfig = get_default_qconfig(engine)
+    for block in blocks:
+        block.qconfig = qconfig
+    prepare(model, inplace=True)
+    return model
+
+
+def convert_quantization(model):
+    """Replace the calibrated static blocks and every remaining nn.Linear with int8 modules, in place."""
+    convert(model, inplace=True)
+    quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def quantize_poseidon(model, calibration_batches=(), engine=None):
+    """Quantize `model` in place.
+
+    Args:
+        model (Poseidon): Float model.
+        calibration_batches (iterable of torch.Tensor[B, T, C, H, W]): Windows used to calibrate the
+            activation ranges of the static blocks. Empty when only the structure is needed, e.g. to
+            load a quantized checkpoint.
+        engine (str): Quantized engine, see `quantized_engine`.
+
+    Returns:
+        Poseidon: The quantized model (CPU only).
+    """
+    prepare_quantization(model, engine)
+    with torch.no_grad():
+        for x in calibration_batches:
+            model(x.cpu())
+    return convert_quantization(model)
+
+
+def quantization_info(engine=None):
+    return {'version': QUANTIZATION_VERSION, 'engine': engine or torch.backends.quantized.engine}
+
+
+def is_quantized_checkpoint(checkpoint):
+    return isinstance(checkpoint, dict) and 'quantization' in checkpoint
+
+
+def load_quantized(model, checkpoint):
+    """Quantize the structure of the float `model` and load the int8 weights of `checkpoint` into it."""
+    info = checkpoint['quantization']
+    if info.get('version', 0) > QUANTIZATION_VERSION:
+        raise ValueError(f"Unsupported quantized checkpoint version: {info['version']}")
+    engine = info.get('engine')
+    if engine not in torch.backends.quantized.supported_engines:
+        engine = quantized_engine()
+    with warnings.catch_warnings():
+        # No calibration here: the quantization parameters come from the checkpoint
+        warnings.filterwarnings('ignore', message='must run observer')
+        quantize_poseidon(model, engine=engine)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    return model
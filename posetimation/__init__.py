@@ -2,9 +2,9 @@
 # -*- coding:utf8 -*-
 
 
-__all__ = ["get_cfg", "update_config", "build_optimizer", "build_lr_scheduler", "build_model", "build_loss"]
+__all__ = ["get_cfg", "update_config", "load_config", "build_optimizer", "build_lr_scheduler", "build_model", "build_loss"]
 
-from .config import get_cfg, update_config
+from .config import get_cfg, update_config, load_config
 #from .optimizer import build_optimizer, build_lr_scheduler
 #from .zoo import build_model
 #from .loss import build_loss
@@ -2,6 +2,6 @@
 # -*- coding:utf8 -*-
 
 
-__all__ = ["update_config", "get_cfg"]
+__all__ = ["update_config", "get_cfg", "load_config"]
 
-from .config import update_config, get_cfg
+from .config import update_config, get_cfg, load_config
@@ -2,6 +2,7 @@
 # -*- coding:utf8 -*-
 
 import os
+from types import SimpleNamespace
 from .my_custom import CfgNode
 
 
@@ -18,6 +19,10 @@ def update_config(cfg: CfgNode, args):
     cfg.DATASET.JSON_DIR = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.DATASET.JSON_DIR))
     cfg.DATASET.IMG_DIR = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.DATASET.IMG_DIR))
     cfg.DATASET.TEST_IMG_DIR = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.DATASET.TEST_IMG_DIR))
+    if cfg.DATASET.FRAME_STORE:
+        cfg.DATASET.FRAME_STORE = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.DATASET.FRAME_STORE))
+    if cfg.DATASET.TEST_FRAME_STORE:
+        cfg.DATASET.TEST_FRAME_STORE = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.DATASET.TEST_FRAME_STORE))
 
     cfg.MODEL.PRETRAINED = os.path.abspath(os.path.join(cfg.ROOT_DIR, cfg.MODEL.PRETRAINED))
 
@@ -30,6 +35,14 @@ def update_config(cfg: CfgNode, args):
     cfg.freeze()
 
 
+def load_config(config_path, root_dir='../'):
+    """Frozen config of the yaml file config_path, its paths resolved against root_dir (the tools' --root_dir)."""
+    args = SimpleNamespace(cfg=os.path.abspath(config_path), rootDir=os.path.abspath(root_dir))
+    cfg = get_cfg(args)
+    update_config(cfg, args)
+    return cfg
+
+
 def get_cfg(args) -> CfgNode:
     """
         Get a copy of the default config.
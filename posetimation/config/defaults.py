@@ -20,6 +20,7 @@ _C.DATA_DIR = ''
 _C.MODEL_DIR = ''
 _C.GPUS = (0,)
 _C.WORKERS = 8
+_C.WORKERS_START_METHOD = ''  # DataLoader worker start method: 'fork', 'spawn' or 'forkserver' ('' = platform default)
 _C.PRINT_FREQ = 20
 _C.PIN_MEMORY = True
 _C.RANK = 0
@@ -99,6 +100,18 @@ _C.MODEL.METHOD = "poseidon"
 _C.MODEL.CONFIG_FILE = ""
 _C.MODEL.CHECKPOINT_FILE = ""
 _C.MODEL.EMBED_DIM = 384
+_C.MODEL.ATTENTION_BACKEND = 'mha'  # 'mha' (nn.MultiheadAttention) or 'sdpa' (F.scaled_dot_product_attention)
+_C.MODEL.LOCAL_ATTENTION_BLOCK = 0  # > 0: local cross-attention on blocks of this size (0 = global)
+_C.MODEL.LOCAL_ATTENTION_HALO = 2  # context tokens added around each block in local cross-attention
+_C.MODEL.FUSION_MODE = 'full'  # 'full' (attention over all levels' tokens) or 'level' (per-location attention across levels)
+_C.MODEL.FRAME_SKIP_THRESHOLD = 0.0  # inference: drop context frames whose AdaptiveFrameWeighting weight is below this (0 = off)
+_C.MODEL.FRAME_SKIP_TOPK = 0  # inference: keep only the k highest-weighted context frames (0 = all)
+_C.MODEL.TOKEN_KEEP_RATIO = 1.0  # < 1: fraction of patch tokens kept by the ViT layers after TOKEN_PRUNE_LAYER (1 = off)
+_C.MODEL.TOKEN_PRUNE_LAYER = 2  # ViT layer whose output ranks the tokens for pruning
+_C.MODEL.WINDOW_MODE = 'centered'  # 'centered' (query frame in the middle of the window) or 'past' (query is the last frame, causal)
+_C.MODEL.HEAD = 'heatmap'  # 'heatmap' (ViTPose deconvolution head) or 'simcc' (x / y bin classification from the token grid)
+_C.MODEL.SIMCC_SPLIT_RATIO = 2  # SimCC bins per heatmap pixel
+_C.MODEL.LEAN_INFERENCE = False  # no-grad forward freeing each fused level early and weighting the window in place
 
 #### LOSS ####
 _C.LOSS = CfgNode()
@@ -134,6 +147,11 @@ _C.DATASET.POSETRACK17_TEST_IMG_DIR = ''
 _C.DATASET.POSETRACK18_TEST_IMG_DIR = ''
 _C.DATASET.INPUT_TYPE = ''
 _C.DATASET.BBOX_ENLARGE_FACTOR = 1.0
+_C.DATASET.FRAME_CACHE_GB = 0.0  # training: shared-memory LRU of decoded frames for all DataLoader workers (0 = off)
+_C.DATASET.FRAME_CACHE_MAX_SIZE = [1920, 1080]  # (width, height) of the largest cached frame, the size of a cache slot
+_C.DATASET.FRAME_STORE = ''  # frames of IMG_DIR packed by tools/pack_frames.py (empty = read the image files)
+_C.DATASET.TEST_FRAME_STORE = ''  # frames of TEST_IMG_DIR packed by tools/pack_frames.py
+_C.DATASET.ROI_DECODE = False  # jpg: decode only the crop region of each frame, DCT-scaled (1/2 - 1/8) for small persons
 
 #### TRAIN ####
 _C.TRAIN = CfgNode()  # cfg.Node
@@ -172,7 +190,28 @@ _C.TRAIN.NUM_JOINTS_HALF_BODY = 8
 _C.TRAIN.LR_SCHEDULER = 'MultiStepLR'
 _C.TRAIN.BATCH_SIZE = 32
 _C.TRAIN.ACCUMULATION_STEPS = 1
+_C.TRAIN.CHECKPOINT_BACKBONE = False  # activation checkpointing of the ViT layers (recomputed in backward)
+_C.TRAIN.CHECKPOINT_FUSION = False  # activation checkpointing of MultiScaleFeatureFusion
 _C.TRAIN.MOTION_AUGMENTATION = False
+_C.TRAIN.DEVICE_AUGMENTATION = False  # workers ship uint8 canvases, cropped / flipped / normalized on the training device
+_C.TRAIN.SAMPLER = 'random'  # 'random' (shuffled samples) or 'video_block' (shuffled blocks of frames of a video, datasets/samplers.py)
+_C.TRAIN.SAMPLER_BLOCK_FRAMES = 8  # video_block: consecutive frames per block
+_C.TRAIN.SAMPLER_INTERLEAVE = 0  # video_block: blocks read at the same time, 0 = TRAIN.BATCH_SIZE
+
+#### DISTILL ####
+_C.DISTILL = CfgNode()
+_C.DISTILL.ENABLED = False
+_C.DISTILL.TEACHER_STORE = ''  # directory written by tools/precompute_teacher.py
+_C.DISTILL.HEATMAP_WEIGHT = 1.0  # MSE between student and (warped) teacher heatmaps
+_C.DISTILL.FEATURE_WEIGHT = 0.0  # attention transfer on the fused features, 0 = heatmaps only
+
+#### CPU ####
+_C.CPU = CfgNode()
+_C.CPU.PROFILE = False  # CPU inference profile for validation / inference on the CPU (models/best/cpu_profile.py)
+_C.CPU.BF16 = True  # bf16 autocast, only used when the CPU supports bf16 natively
+_C.CPU.CHANNELS_LAST = True  # channels-last convolutional parts (fusion PPM, frame quality estimator, head)
+_C.CPU.NUM_THREADS = 0  # intra-op threads, 0 = one per physical core
+_C.CPU.PIN_THREADS = True  # pin the process to those physical cores
 
 #### VAL ####
 _C.VAL = CfgNode()
@@ -192,6 +231,7 @@ _C.VAL.SHIFT_HEATMAP = False
 _C.VAL.SOFT_NMS = False
 _C.VAL.POST_PROCESS = False
 _C.VAL.BATCH_SIZE = 1
+_C.VAL.SAMPLER = 'default'  # 'default' (detection file order) or 'video' (video by video, in frame order)
 
 #### TEST ####
 _C.TEST = CfgNode()
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Peak memory and latency of the Poseidon temporal attention (context self-attention + cross-attention)
+against the window size, for every attention backend.
+
+    python tools/benchmark_attention.py --embed_dim 1280 --batch_size 8 --device cuda:0
+"""
+import argparse
+import multiprocessing as mp
+import os.path as osp
+import resource
+import sys
+import time
+
+import torch
+from tabulate import tabulate
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from models.best.Poseidon import CrossAttention, multihead_attention
+
+BACKENDS = {
+    'mha': dict(attention_backend='mha'),
+    'sdpa': dict(attention_backend='sdpa'),
+    'sdpa-local': dict(attention_backend='sdpa', local_block=6, local_halo=2),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Poseidon attention backends')
+    parser.add_argument('--embed_dim', type=int, default=384)
+    parser.add_argument('--num_heads', type=int, default=4)
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--grid', type=int, nargs=2, default=[24, 18], help='token grid H W')
+    parser.add_argument('--windows', type=int, nargs='+', default=[3, 5, 7, 9])
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--device', type=str, default='cpu')
+    return parser.parse_args()
+
+
+def run(args, backend, window):
+    torch.manual_seed(0)
+    device = torch.device(args.device)
+    H, W = args.grid
+    C = args.embed_dim
+
+    self_attention = torch.nn.MultiheadAttention(C, args.num_heads).to(device).eval()
+    cross_attention = CrossAttention(C, args.num_heads, **BACKENDS[backend]).to(device).eval()
+    attention_backend = BACKENDS[backend]['attention_backend']
+
+    center = torch.randn(args.batch_size, C, H, W, device=device)
+    context = torch.randn(args.batch_size, window - 1, C, H, W, device=device)
+
+    def step():
+        tokens = context.view(-1, C, H * W).permute(2, 0, 1)
+        tokens = multihead_attention(self_attention, tokens, tokens, tokens, attention_backend)
+        tokens = tokens.permute(1, 2, 0).view(args.batch_size, window - 1, C, H, W)
+        return cross_attention(center, tokens)
+
+    if device.type != 'cuda':
+        # ru_maxrss is a high-water mark: read before the warmup step, whose attention peak it would include
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with torch.no_grad():
+        step()  # warmup
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+            torch.cuda.reset_peak_memory_stats(device)
+            base = torch.cuda.memory_allocated(device)
+
+        start = time.perf_counter()
+        for _ in range(args.iters):
+            step()
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        latency = (time.perf_counter() - start) / args.iters
+
+    if device.type == 'cuda':
+        peak = torch.cuda.max_memory_allocated(device) - base
+    else:
+        # ru_maxrss is a high-water mark of the whole process, hence one process per configuration
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - base
+    return latency * 1000, peak / 2 ** 20
+
+
+def main():
+    args = parse_args()
+    ctx = mp.get_context('spawn')
+    rows = []
+    for window in args.windows:
+        for backend in BACKENDS:
+            with ctx.Pool(1) as pool:
+                latency, peak = pool.apply(run, (args, backend, window))
+            rows.append([window, backend, f"{latency:.1f}", f"{peak:.1f}"])
+            print(f"window {window} {backend}: {latency:.1f} ms, {peak:.1f} MiB")
+
+    headers = ["Window", "Backend", "Latency (ms)", "Peak memory (MiB)"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
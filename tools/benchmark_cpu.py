@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+CPU inference profile (models/best/cpu_profile.py) on PoseTrack validation windows: latency per
+window and heatmap accuracy (PCK of the argmax against the targets, as in validate) with PyTorch's
+defaults, then adding thread sizing / pinning, channels-last convolutions and bf16 autocast.
+
+    python tools/benchmark_cpu.py --config configs/posetrack21/configPoseidonVitS.yaml \
+        --weights results/best_model.pt --num_windows 64
+"""
+import argparse
+import contextlib
+import itertools
+import os.path as osp
+import sys
+import time
+
+import torch
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from models.best.cpu_profile import CpuProfile, bf16_supported
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from core.function import output_accuracy
+from utils.common import VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon CPU inference profile')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint, artifact or int8 checkpoint')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--num_windows', type=int, default=64, help='validation windows to run')
+    parser.add_argument('--batch_size', type=int, default=None, help='default: VAL.BATCH_SIZE')
+    parser.add_argument('--threads', type=int, default=0, help='profile intra-op threads (0 = one per physical core)')
+    parser.add_argument('--no_pin', action='store_true', help='do not pin the threads to physical cores')
+    return parser.parse_args()
+
+
+def run(model, batches, autocast=contextlib.nullcontext):
+    """Time per window (ms) and accuracy over `batches`, after one warmup batch."""
+    with torch.no_grad(), autocast():
+        model(batches[0][0])
+        elapsed, windows, correct, count = 0.0, 0, 0.0, 0
+        for x, target_heatmaps in batches:
+            start = time.perf_counter()
+            output = model(x)
+            elapsed += time.perf_counter() - start
+            windows += x.shape[0]
+            _, avg_acc, cnt, _ = output_accuracy(model, output.float(), target_heatmaps)
+            correct += avg_acc * cnt
+            count += cnt
+    return elapsed / windows * 1000, correct / max(count, 1)
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+
+    model = load_poseidon(cfg, args.weights, device='cpu', phase=VAL_PHASE).eval()
+
+    val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+    batch_size = args.batch_size or cfg.VAL.BATCH_SIZE
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=cfg.WORKERS)
+    # windows are loaded once, so data loading is not timed
+    batches = [(x, target_heatmaps) for x, _, target_heatmaps, _ in
+               itertools.islice(val_loader, max(args.num_windows // batch_size, 1))]
+
+    profiles = [
+        ("threads", dict(bf16=False, channels_last=False)),
+        ("+ channels-last", dict(bf16=False, channels_last=True)),
+        ("+ bf16 autocast", dict(bf16=True, channels_last=True)),
+    ]
+    default_threads = torch.get_num_threads()
+    ms, acc = run(model, batches)
+    rows = [["PyTorch defaults (fp32)", default_threads, f"{ms:.1f}", "1.00", f"{acc:.4f}"]]
+    for name, options in profiles:
+        if options['bf16'] and not bf16_supported():
+            print("\033[93m" + "This CPU has no native bf16 support, skipping bf16 autocast" + "\033[0m")
+            continue
+        profile = CpuProfile(model, num_threads=args.threads, pin_threads=not args.no_pin, **options)
+        profile_ms, profile_acc = run(model, batches, profile.autocast)
+        rows.append([name, profile.num_threads, f"{profile_ms:.1f}", f"{ms / profile_ms:.2f}", f"{profile_acc:.4f}"])
+        print(f"{name}: {profile.summary()}")
+        profile.remove()
+
+    headers = ["Profile", "Threads", f"Latency / window bs={batch_size} (ms)", "Speedup", "Accuracy"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
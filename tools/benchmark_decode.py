@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Region-of-interest JPEG decoding (DATASET.ROI_DECODE) on PoseTrack windows: time to load a window
+(read, decode, crop, normalize) with full-frame decoding and with ROI decoding, and the difference
+between the two model inputs. Both datasets draw the same augmentation for a window (the random
+generators are seeded with the window index), so the crops only differ by the decoding.
+
+    python tools/benchmark_decode.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --num_windows 200 --phase train
+"""
+import argparse
+import os.path as osp
+import random
+import sys
+import time
+
+import numpy as np
+import torch
+from tabulate import tabulate
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from utils.common import TRAIN_PHASE, VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon full-frame vs region-of-interest JPEG decoding')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--num_windows', type=int, default=200, help='windows loaded per decoding mode')
+    parser.add_argument('--phase', type=str, default=VAL_PHASE, choices=[TRAIN_PHASE, VAL_PHASE],
+                        help='training windows are augmented (scale, rotation, flip)')
+    return parser.parse_args()
+
+
+def load(dataset, indices):
+    """Model inputs of the windows `indices` and the time (ms) per window."""
+    inputs, elapsed = [], 0.0
+    for index in indices:
+        random.seed(index)
+        np.random.seed(index)
+        start = time.perf_counter()
+        x = dataset[index][0]
+        elapsed += time.perf_counter() - start
+        inputs.append(x)
+    return inputs, elapsed / len(indices) * 1000
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+    cfg.defrost()
+    cfg.DATASET.FRAME_CACHE_GB = 0.0
+    cfg.DATASET.FRAME_STORE = cfg.DATASET.TEST_FRAME_STORE = ''
+    cfg.TRAIN.DEVICE_AUGMENTATION = False
+    cfg.DATASET.ROI_DECODE = False
+    full_cfg = cfg.clone()
+    cfg.DATASET.ROI_DECODE = True
+    roi_cfg = cfg.clone()
+
+    full_dataset, roi_dataset = PoseTrack(full_cfg, phase=args.phase), PoseTrack(roi_cfg, phase=args.phase)
+    indices = np.linspace(0, len(full_dataset) - 1, min(args.num_windows, len(full_dataset))).astype(int).tolist()
+    # the first pass also warms the page cache for both modes
+    full_inputs, full_ms = load(full_dataset, indices)
+    full_inputs, full_ms = load(full_dataset, indices)
+    roi_inputs, roi_ms = load(roi_dataset, indices)
+
+    diff = torch.stack([(a - b).abs().mean() for a, b in zip(full_inputs, roi_inputs)])
+    rows = [["full frame", f"{full_ms:.1f}", "1.00", "-", "-"],
+            ["region of interest", f"{roi_ms:.1f}", f"{full_ms / roi_ms:.2f}", f"{diff.mean():.4f}", f"{diff.max():.4f}"]]
+    headers = ["Decoding", "Time / window (ms)", "Speedup", "Mean |diff| of inputs", "Max window mean |diff|"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Speed / accuracy trade-off of the inference-time context frame skipping (Poseidon.select_context_frames)
+on the PoseTrack validation set: mAP, model time per window and context frames kept, per policy.
+
+    python tools/benchmark_frame_skipping.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --thresholds 0 0.1 0.15 0.2 --topk 2
+"""
+import argparse
+import os.path as osp
+import sys
+
+import torch
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from core.loss import get_loss_function
+from core.function import validate
+from utils.common import VAL_PHASE
+from utils.utils_timer import ModelTimer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon frame skipping speed / accuracy')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.0, 0.1, 0.15, 0.2])
+    parser.add_argument('--topk', type=int, nargs='*', default=[], help='top-k policies to add to the table')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+
+    model = load_poseidon(cfg, args.weights, device=args.device, phase=VAL_PHASE).eval()
+    timer = ModelTimer(model, args.device, count_context=True)
+
+    val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+    val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, num_workers=cfg.WORKERS,
+                            pin_memory=True)
+    loss = get_loss_function(cfg, args.device)
+
+    policies = [(threshold, 0) for threshold in args.thresholds] + [(0.0, k) for k in args.topk]
+    rows = []
+    for threshold, topk in policies:
+        model.frame_skip_threshold, model.frame_skip_topk = threshold, topk
+        timer.reset()
+        _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, model, loss, cfg.OUTPUT_DIR, 0,
+                                           device=args.device)
+        policy = f"top-{topk}" if topk else (f"weight >= {threshold}" if threshold else "all frames")
+        rows.append([policy, f"{perf_indicator:.2f}", f"{timer.elapsed / timer.windows * 1000:.2f}",
+                     f"{timer.context_frames / timer.windows:.2f}"])
+        print(f"{policy}: mAP {perf_indicator:.2f}")
+
+    headers = ["Policy", "mAP", "Model time / window (ms)", "Context frames kept"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
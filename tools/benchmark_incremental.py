@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Speed / accuracy of the incremental backbone (models/best/incremental.py) on the PoseTrack validation
+set. The crops of a PoseTrack window share one box, so the frames of each window are encoded in
+temporal order as one track, as for a static camera: mAP, fraction of recomputed patch tokens and
+model time per window against the full computation, per (threshold, depth) policy.
+
+    python tools/benchmark_incremental.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --thresholds 0.02 0.05 0.1 --depths 4 8
+"""
+import argparse
+import os.path as osp
+import sys
+
+import torch
+import torch.nn as nn
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from models.best.incremental import IncrementalEncoder
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from core.loss import get_loss_function
+from core.function import validate
+from utils.common import VAL_PHASE
+from utils.utils_timer import ModelTimer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon incremental backbone speed / accuracy')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.02, 0.05, 0.1])
+    parser.add_argument('--depths', type=int, nargs='+', default=[4])
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+class IncrementalPoseidon(nn.Module):
+    """Poseidon whose windows go through IncrementalEncoder.forward_windows (for core.function.validate)."""
+
+    def __init__(self, model, incremental):
+        super(IncrementalPoseidon, self).__init__()
+        self.model = model
+        self.incremental = incremental
+
+    def forward(self, x, meta=None):
+        return self.incremental.forward_windows(x)
+
+    def set_phase(self, phase):
+        self.model.set_phase(phase)
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+
+    model = load_poseidon(cfg, args.weights, device=args.device, phase=VAL_PHASE).eval()
+
+    val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+    val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, num_workers=cfg.WORKERS,
+                            pin_memory=True)
+    loss = get_loss_function(cfg, args.device)
+
+    timer = ModelTimer(model, args.device)
+    _, full_map, _, _ = validate(cfg, val_loader, val_dataset, model, loss, cfg.OUTPUT_DIR, 0, device=args.device)
+    full_time = timer.elapsed / timer.windows
+    rows = [["full", "-", f"{full_map:.2f}", "100.0%", f"{full_time * 1000:.2f}", "1.00"]]
+
+    for depth in args.depths:
+        for threshold in args.thresholds:
+            incremental = IncrementalEncoder(model, threshold, depth)
+            wrapper = IncrementalPoseidon(model, incremental)
+            timer = ModelTimer(wrapper, args.device)
+            _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, wrapper, loss, cfg.OUTPUT_DIR, 0,
+                                               device=args.device)
+            incremental.remove()
+            window_time = timer.elapsed / timer.windows
+            rows.append([threshold, depth, f"{perf_indicator:.2f}", f"{incremental.recomputed_fraction:.1%}",
+                         f"{window_time * 1000:.2f}", f"{full_time / window_time:.2f}"])
+            print(f"threshold {threshold}, depth {depth}: mAP {perf_indicator:.2f}")
+
+    headers = ["Threshold", "Depth", "mAP", "Tokens recomputed", "Model time / window (ms)", "Speedup"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Peak GPU memory and time of the Poseidon inference forward, standard against memory-lean
+(MODEL.LEAN_INFERENCE), on random windows of the config's input size.
+
+    python tools/benchmark_memory.py --config configs/posetrack21/configPoseidonVitH.yaml --batch_size 32
+"""
+import argparse
+import os.path as osp
+import sys
+import time
+
+import torch
+from tabulate import tabulate
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from utils.common import VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon inference peak memory, standard vs lean')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, default=None, help='Poseidon .pt checkpoint or artifact (optional)')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--iters', type=int, default=5, help='timed iterations per mode')
+    parser.add_argument('--no_amp', action='store_true', help='fp32 instead of autocast')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def measure(model, x, device, iters, use_amp):
+    """Peak allocated memory (MB, None on CPU) and time per batch (ms) of the no-grad forward."""
+    cuda = str(device).startswith('cuda')
+    with torch.no_grad(), torch.autocast(device_type=torch.device(device).type, enabled=use_amp):
+        model(x)  # warmup
+        if cuda:
+            torch.cuda.synchronize(device)
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats(device)
+            baseline = torch.cuda.memory_allocated(device)
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+        if cuda:
+            torch.cuda.synchronize(device)
+    elapsed = (time.perf_counter() - start) / iters * 1000
+    peak = (torch.cuda.max_memory_allocated(device) - baseline) / 2 ** 20 if cuda else None
+    return peak, elapsed
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+
+    model = load_poseidon(cfg, args.weights, device=args.device, phase=VAL_PHASE).eval()
+
+    cuda = str(args.device).startswith('cuda')
+    if not cuda:
+        print("\033[93m" + "Peak memory is measured with the CUDA allocator: only timings are reported on CPU" + "\033[0m")
+    use_amp = cuda and not args.no_amp
+
+    width, height = cfg.MODEL.IMAGE_SIZE
+    x = torch.randn(args.batch_size, model.num_frames, 3, height, width, device=args.device)
+
+    rows = []
+    results = {}
+    for name, lean in (("standard", False), ("lean", True)):
+        model.lean_inference = lean
+        peak, elapsed = measure(model, x, args.device, args.iters, use_amp)
+        results[name] = peak
+        rows.append([name, f"{peak:.0f}" if peak is not None else "-", f"{elapsed:.1f}"])
+    if cuda:
+        reduction = 1 - results["lean"] / results["standard"]
+        print("\033[92m" + f"Peak memory reduction at batch {args.batch_size}: {reduction:.1%}" + "\033[0m")
+
+    headers = ["Forward", f"Peak memory bs={args.batch_size} (MB)", f"Time / batch bs={args.batch_size} (ms)"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Throughput / accuracy table of Poseidon for one or more configs (e.g. the 384x288 and 256x192 tiers).
+
+    python tools/benchmark_resolution.py \
+        --configs configs/posetrack21/configPoseidonVitH.yaml configs/posetrack21/configPoseidonVitH_256x192.yaml \
+        --weights models/poseidon_vith.pt --evaluate
+"""
+import argparse
+import os.path as osp
+import sys
+import time
+
+import torch
+from tabulate import tabulate
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from utils.common import VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon throughput / accuracy per resolution')
+    parser.add_argument('--configs', type=str, nargs='+', required=True)
+    parser.add_argument('--weights', type=str, default=None, help='Poseidon .pt checkpoint')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--evaluate', action='store_true', help='also compute the mAP on the validation set')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def measure_throughput(model, cfg, batch_size, iters, device):
+    width, height = cfg.MODEL.IMAGE_SIZE
+    x = torch.randn(batch_size, cfg.WINDOWS_SIZE, 3, height, width, device=device)
+    with torch.no_grad():
+        model(x)  # warmup
+        if device.startswith('cuda'):
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize(device)
+    return batch_size * iters / (time.perf_counter() - start)
+
+
+def evaluate(model, cfg, device):
+    from torch.utils.data import DataLoader
+    from datasets.zoo.posetrack.PoseTrack import PoseTrack
+    from core.loss import get_loss_function
+    from core.function import validate
+
+    val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+    val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False,
+                            num_workers=cfg.WORKERS, pin_memory=True)
+    loss = get_loss_function(cfg, device)
+    _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, model, loss, cfg.OUTPUT_DIR, 0, device=device)
+    return perf_indicator
+
+
+def main():
+    args = parse_args()
+    rows = []
+    for config_path in args.configs:
+        cfg = load_config(config_path, args.root_dir)
+        model = load_poseidon(cfg, args.weights, device=args.device, phase=VAL_PHASE).eval()
+
+        width, height = cfg.MODEL.IMAGE_SIZE
+        throughput = measure_throughput(model, cfg, args.batch_size, args.iters, args.device)
+        mean_ap = evaluate(model, cfg, args.device) if args.evaluate else float('nan')
+        rows.append([osp.basename(config_path), f"{height}x{width}", "x".join(map(str, model.grid_size)),
+                     f"{throughput:.1f}", f"{mean_ap:.1f}"])
+
+    headers = ["Config", "Input (HxW)", "Token grid", "Windows/s", "mAP"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
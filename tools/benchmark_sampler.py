@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Data loading throughput of the training and validation samplers (datasets/samplers.py): samples/s
+of the DataLoader alone, bytes read from disk (/proc/diskstats, the whole machine) and, with
+DATASET.FRAME_CACHE_GB, the decoded-frame cache hit rate, per sampler.
+
+Disk reads only reflect the sampler when the frames are not already in the page cache: run as root
+with --drop_caches to empty it before each sampler.
+
+    python tools/benchmark_sampler.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --num_batches 200 --drop_caches
+"""
+import argparse
+import itertools
+import os
+import os.path as osp
+import sys
+import time
+
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from datasets.samplers import VideoBlockSampler, VideoSequentialSampler
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from utils.common import TRAIN_PHASE, VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon data loading per sampler')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--num_batches', type=int, default=200, help='batches loaded per sampler')
+    parser.add_argument('--drop_caches', action='store_true', help='empty the page cache before each sampler (root)')
+    parser.add_argument('--no_val', action='store_true', help='only the training samplers')
+    return parser.parse_args()
+
+
+def disk_read_bytes():
+    """Bytes read from the block devices since boot (whole disks, without partitions)."""
+    disks = {name for name in os.listdir('/sys/block') if not name.startswith(('loop', 'ram'))}
+    total = 0
+    with open('/proc/diskstats') as f:
+        for line in f:
+            fields = line.split()
+            if fields[2] in disks:
+                total += int(fields[5]) * 512
+    return total
+
+
+def drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as f:
+        f.write('3\n')
+
+
+def run(dataset, sampler, batch_size, workers, num_batches, shuffle=False, drop=False):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler, num_workers=workers,
+                        multiprocessing_context=dataset.multiprocessing_context if workers > 0 else None)
+    if drop:
+        drop_caches()
+    start_bytes = disk_read_bytes()
+    start = time.perf_counter()
+    samples = 0
+    for x, _, _, _ in itertools.islice(loader, num_batches):
+        samples += x.shape[0]
+    elapsed = time.perf_counter() - start
+    read = disk_read_bytes() - start_bytes
+    hit_rate = "-"
+    if dataset.frame_cache is not None:
+        hit_rate = f"{dataset.frame_cache.stats()['hit_rate']:.1%}"
+        dataset.frame_cache.close()
+    return [f"{samples / elapsed:.1f}", f"{read / 2 ** 30:.2f}", f"{read / max(samples, 1) / 2 ** 20:.1f}", hit_rate]
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+    interleave = cfg.TRAIN.SAMPLER_INTERLEAVE or cfg.TRAIN.BATCH_SIZE
+
+    rows = []
+    # a new dataset per sampler, so each one starts with an empty frame cache
+    dataset = PoseTrack(cfg, phase=TRAIN_PHASE)
+    rows.append(["train", "random"] + run(dataset, None, cfg.TRAIN.BATCH_SIZE, cfg.WORKERS, args.num_batches,
+                                          shuffle=True, drop=args.drop_caches))
+    dataset = PoseTrack(cfg, phase=TRAIN_PHASE)
+    sampler = VideoBlockSampler(dataset.data, block_frames=cfg.TRAIN.SAMPLER_BLOCK_FRAMES, interleave=interleave,
+                                seed=cfg.SEED)
+    rows.append(["train", f"video_block ({cfg.TRAIN.SAMPLER_BLOCK_FRAMES} frames x {interleave})"] +
+                run(dataset, sampler, cfg.TRAIN.BATCH_SIZE, cfg.WORKERS, args.num_batches, drop=args.drop_caches))
+
+    if not args.no_val:
+        dataset = PoseTrack(cfg, phase=VAL_PHASE)
+        rows.append(["val", "default"] + run(dataset, None, cfg.VAL.BATCH_SIZE, cfg.WORKERS, args.num_batches,
+                                             drop=args.drop_caches))
+        dataset = PoseTrack(cfg, phase=VAL_PHASE)
+        rows.append(["val", "video"] + run(dataset, VideoSequentialSampler(dataset.data), cfg.VAL.BATCH_SIZE,
+                                           cfg.WORKERS, args.num_batches, drop=args.drop_caches))
+
+    headers = ["Set", "Sampler", "Samples/s", "Disk read (GB)", "Disk read / sample (MB)", "Frame cache hits"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Cold-start time (imports + model build + weight loading) of Poseidon from the training config
+(mmpose init_model + .pt checkpoint) against the exported artifact (tools/export_poseidon.py).
+
+    python tools/benchmark_startup.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --artifact models/poseidon_vith.artifact.pt --device cuda:0
+
+Each measurement runs in a fresh process. The OS page cache is not dropped, so repeated runs read
+the weights from memory; drop it (e.g. `echo 3 > /proc/sys/vm/drop_caches`) for disk-cold numbers.
+"""
+import argparse
+import multiprocessing as mp
+import os.path as osp
+import resource
+import sys
+import time
+
+from tabulate import tabulate
+
+ROOT = osp.abspath(osp.join(osp.dirname(__file__), '..'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Poseidon cold start')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint')
+    parser.add_argument('--artifact', type=str, required=True, help='exported Poseidon artifact')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--device', type=str, default='cpu')
+    return parser.parse_args()
+
+
+def run(args, method):
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import torch
+
+    from models.best.artifact import load_poseidon
+
+    if method == 'mmpose':
+        from posetimation import load_config
+
+        model = load_poseidon(load_config(args.config, args.root_dir), args.weights, device=args.device)
+    else:
+        model = load_poseidon(None, args.artifact, device=args.device)
+
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize(args.device)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def main():
+    args = parse_args()
+    ctx = mp.get_context('spawn')
+    rows = []
+    for method in ('mmpose', 'artifact'):
+        with ctx.Pool(1) as pool:
+            elapsed, peak = pool.apply(run, (args, method))
+        rows.append([method, f"{elapsed:.2f}", f"{peak:.0f}"])
+        print(f"{method}: {elapsed:.2f} s, {peak:.0f} MiB")
+
+    headers = ["Loader", "Cold start (s)", "Peak RSS (MiB)"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Speed / accuracy trade-off of the backbone token pruning (MODEL.TOKEN_KEEP_RATIO, models/best/Poseidon.py
+TokenPruning) on the PoseTrack validation set: mAP, model time per window and windows/s per keep ratio.
+
+    python tools/benchmark_token_pruning.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --keep_ratios 1 0.75 0.5 --prune_layer 2
+"""
+import argparse
+import os.path as osp
+import sys
+
+import torch
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from core.loss import get_loss_function
+from core.function import validate
+from utils.common import VAL_PHASE
+from utils.utils_timer import ModelTimer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Poseidon token pruning speed / accuracy')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--keep_ratios', type=float, nargs='+', default=[1.0, 0.75, 0.5])
+    parser.add_argument('--prune_layer', type=int, default=None,
+                        help='backbone layer ranking the tokens (default: MODEL.TOKEN_PRUNE_LAYER)')
+    parser.add_argument('--no_eval', action='store_true',
+                        help='only time the model on random windows of the validation batch size')
+    parser.add_argument('--iters', type=int, default=20, help='timed iterations with --no_eval')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+    prune_layer = cfg.MODEL.TOKEN_PRUNE_LAYER if args.prune_layer is None else args.prune_layer
+
+    model = load_poseidon(cfg, args.weights, device=args.device, phase=VAL_PHASE).eval()
+    timer = ModelTimer(model, args.device)
+
+    if not args.no_eval:
+        val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+        val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, num_workers=cfg.WORKERS,
+                                pin_memory=True)
+        loss = get_loss_function(cfg, args.device)
+    else:
+        width, height = cfg.MODEL.IMAGE_SIZE
+        x = torch.randn(cfg.VAL.BATCH_SIZE, cfg.WINDOWS_SIZE, 3, height, width, device=args.device)
+
+    num_tokens = model.grid_size[0] * model.grid_size[1]
+    rows = []
+    for keep_ratio in args.keep_ratios:
+        model.set_token_pruning(keep_ratio, prune_layer)
+        if args.no_eval:
+            with torch.no_grad(), torch.autocast(device_type=torch.device(args.device).type,
+                                                 enabled=str(args.device).startswith('cuda')):
+                model(x)  # warmup
+                timer.reset()
+                for _ in range(args.iters):
+                    model(x)
+            map_value = "-"
+        else:
+            timer.reset()
+            _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, model, loss, cfg.OUTPUT_DIR, 0,
+                                               device=args.device)
+            map_value = f"{perf_indicator:.2f}"
+            print(f"keep ratio {keep_ratio}: mAP {perf_indicator:.2f}")
+        kept = num_tokens if keep_ratio >= 1 else max(1, round(keep_ratio * num_tokens))
+        rows.append([keep_ratio, f"{kept} / {num_tokens}", map_value,
+                     f"{timer.elapsed / timer.windows * 1000:.2f}", f"{timer.windows / timer.elapsed:.1f}"])
+
+    headers = ["Keep ratio", "Tokens after pruning", "mAP", "Model time / window (ms)", "Windows / s"]
+    print(f"Tokens ranked after backbone layer {prune_layer}")
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Export Poseidon.forward to ONNX, check numerical parity with eager PyTorch on random inputs, and
+optionally compare CPU latency of eager PyTorch and ONNX Runtime.
+
+    python tools/export_onnx.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --output poseidon_vith.onnx --benchmark
+
+--weights also accepts an artifact written by tools/export_poseidon.py. The exported graph is run by
+`inference.py --backend onnxruntime -w poseidon_vith.onnx`.
+
+    python tools/export_onnx.py --self_test
+
+exports a tiny randomly initialized Poseidon with every exporter of the installed PyTorch (torch.export
+and TorchScript) and runs the same parity check, without config or weights.
+"""
+import argparse
+import os.path as osp
+import sys
+import tempfile
+import time
+
+import torch
+from easydict import EasyDict
+from tabulate import tabulate
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation.config.defaults import _C
+from models.best.Poseidon import Poseidon
+from models.best.artifact import load_checkpoint, is_poseidon_artifact, load_poseidon, build_vitpose, MODEL_KEYS, \
+    RUNTIME_KEYS
+from models.best.onnx_backend import export_onnx, has_dynamo_export, OnnxPoseidon
+
+# ViT-S-like ViTPose of the self-test: 8 layers (Poseidon fuses layers 3 and 7) on a 12x6 token grid, divisible
+# by the pyramid pooling sizes as the TorchScript export of the adaptive pooling requires
+SELF_TEST_IMAGE_SIZE = (96, 192)
+SELF_TEST_VITPOSE = {
+    'backbone': {'arch': {'embed_dims': 384, 'num_layers': 8, 'num_heads': 6, 'feedforward_channels': 384},
+                 'img_size': (192, 96), 'patch_size': 16, 'qkv_bias': True, 'with_cls_token': False,
+                 'out_type': 'featmap', 'patch_cfg': {'padding': 2}},
+    'head': {'in_channels': 384, 'out_channels': 17, 'deconv_out_channels': (32, 32), 'deconv_kernel_sizes': (4, 4),
+             'final_kernel_size': 1},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export Poseidon to ONNX')
+    parser.add_argument('--config', type=str, default=None, help='training config (not needed for artifacts)')
+    parser.add_argument('--weights', type=str, default=None, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--static_window', action='store_true', help='fix the window length in the graph')
+    parser.add_argument('--atol', type=float, default=1e-3, help='max abs heatmap difference of the parity check')
+    parser.add_argument('--benchmark', action='store_true', help='compare eager / ONNX Runtime CPU latency')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--threads', type=int, nargs='+', default=[0], help='ONNX Runtime intra-op threads to try')
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--self_test', action='store_true',
+                        help='check the export of a tiny random model instead (no config / weights / output)')
+    args = parser.parse_args()
+    if not args.self_test and (args.weights is None or args.output is None):
+        parser.error("--weights and --output are required (or --self_test)")
+    return args
+
+
+def load_model(args):
+    checkpoint = load_checkpoint(args.weights)
+    if is_poseidon_artifact(checkpoint):
+        cfg = None
+        image_size = tuple(checkpoint['cfg']['MODEL']['IMAGE_SIZE'])
+    else:
+        from posetimation import load_config
+
+        if args.config is None:
+            raise ValueError("--config is required to export a .pt checkpoint")
+        cfg = load_config(args.config, args.root_dir)
+        image_size = tuple(cfg.MODEL.IMAGE_SIZE)
+    return load_poseidon(cfg, checkpoint, device='cpu', phase='test').eval(), image_size
+
+
+def self_test_model(window):
+    """Randomly initialized Poseidon on SELF_TEST_VITPOSE, with the default MODEL options."""
+    model_cfg = {key: _C.MODEL[key] for key in MODEL_KEYS + RUNTIME_KEYS}
+    model_cfg.update(EMBED_DIM=384, IMAGE_SIZE=SELF_TEST_IMAGE_SIZE,
+                     HEATMAP_SIZE=(SELF_TEST_IMAGE_SIZE[0] // 4, SELF_TEST_IMAGE_SIZE[1] // 4))
+    cfg = EasyDict({'MODEL': model_cfg, 'WINDOWS_SIZE': window})
+    torch.manual_seed(0)
+    model = Poseidon(cfg, device='cpu', phase='test', num_heads=4, vitpose=build_vitpose(SELF_TEST_VITPOSE))
+    return model.eval()
+
+
+def self_test(args):
+    """Export the self-test model with every available exporter, True if all pass the parity check."""
+    model = self_test_model(args.window)
+    exporters = [('torch.export', True), ('TorchScript', False)] if has_dynamo_export() else [('TorchScript', None)]
+    ok = True
+    with tempfile.TemporaryDirectory() as folder:
+        for name, dynamo in exporters:
+            path = osp.join(folder, 'poseidon.onnx')
+            try:
+                export_onnx(model, path, args.window, SELF_TEST_IMAGE_SIZE, dynamic_window=not args.static_window,
+                            dynamo=dynamo)
+            except Exception as e:
+                print("\033[91m" + f"{name} export failed: {str(e).splitlines()[0]}" + "\033[0m")
+                ok = False
+                continue
+            print("\033[92m" + f"{name} export" + "\033[0m")
+            session = OnnxPoseidon(path)
+            windows = [args.window] if session.window is not None else sorted({3, args.window})
+            ok &= check_parity(model, session, SELF_TEST_IMAGE_SIZE, windows, args.atol)
+    return ok
+
+
+def check_parity(model, session, image_size, windows, atol):
+    """Max abs difference between eager and ONNX Runtime heatmaps on random inputs."""
+    width, height = image_size
+    rows, ok = [], True
+    for batch_size, window in [(1, w) for w in windows] + [(3, w) for w in windows]:
+        x = torch.randn(batch_size, window, 3, height, width)
+        with torch.no_grad():
+            expected = model(x)
+        diff = (session(x) - expected).abs().max().item()
+        ok &= diff <= atol
+        rows.append([batch_size, window, f"{diff:.2e}", "ok" if diff <= atol else "FAIL"])
+    print(tabulate(rows, headers=["Batch", "Window", "Max abs diff", f"atol {atol}"], tablefmt="pipe"))
+    return ok
+
+
+def latency(fn, x, iters):
+    with torch.no_grad():
+        fn(x)  # warmup
+        start = time.perf_counter()
+        for _ in range(iters):
+            fn(x)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def main():
+    args = parse_args()
+    if args.self_test:
+        if not self_test(args):
+            print("\033[91m" + "ONNX export self-test failed" + "\033[0m")
+            sys.exit(1)
+        print("\033[92m" + "ONNX export self-test passed" + "\033[0m")
+        return
+
+    model, image_size = load_model(args)
+
+    export_onnx(model, args.output, args.window, image_size, dynamic_window=not args.static_window)
+    print("\033[92m" + f"ONNX graph saved to {args.output}" + "\033[0m")
+
+    # Parity on random inputs
+    session = OnnxPoseidon(args.output)
+    windows = [args.window] if session.window is not None else sorted({3, args.window})
+    if not check_parity(model, session, image_size, windows, args.atol):
+        print("\033[91m" + "ONNX Runtime output differs from eager PyTorch" + "\033[0m")
+        sys.exit(1)
+
+    if not args.benchmark:
+        return
+
+    width, height = image_size
+    rows = []
+    for batch_size in args.batch_sizes:
+        x = torch.randn(batch_size, args.window, 3, height, width)
+        eager = latency(model, x, args.iters)
+        rows.append([batch_size, f"eager ({torch.get_num_threads()} threads)", f"{eager:.1f}", "1.00"])
+        for threads in args.threads:
+            ort_latency = latency(OnnxPoseidon(args.output, intra_op_threads=threads), x, args.iters)
+            rows.append([batch_size, f"onnxruntime ({threads or 'auto'} threads)", f"{ort_latency:.1f}",
+                         f"{eager / ort_latency:.2f}"])
+    headers = ["Batch", "Backend", "Latency (ms)", "Speedup"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
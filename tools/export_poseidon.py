@@ -0,0 +1,44 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Export a trained Poseidon checkpoint as a self-contained artifact (architecture + weights) that
+`models.best.artifact.load_poseidon` (and inference.py / val.py) load without mmpose.
+
+    python tools/export_poseidon.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --output models/poseidon_vith.artifact.pt
+"""
+import argparse
+import os.path as osp
+import sys
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_checkpoint, is_poseidon_artifact, load_poseidon, save_poseidon
+from utils.common import VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Export a self-contained Poseidon artifact')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint (model_state_dict)')
+    parser.add_argument('--output', type=str, required=True)
+    parser.add_argument('--root_dir', type=str, default='../')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+
+    checkpoint = load_checkpoint(args.weights)
+    if is_poseidon_artifact(checkpoint):
+        raise ValueError(f"{args.weights} is already a Poseidon artifact")
+    model = load_poseidon(cfg, checkpoint, device='cpu', phase=VAL_PHASE)
+
+    save_poseidon(model, cfg, args.output)
+    print("\033[92m" + f"Poseidon artifact saved to {args.output}" + "\033[0m")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Pack the frames of a dataset image directory into a frame store (datasets/process/frame_store.py):
+one file per video folder, read by PoseTrack as memory-mapped slices instead of one image file per
+frame. Every folder of the image directory containing IMAGE_FORMAT files is packed, its frames in
+file name order.
+
+    python tools/pack_frames.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --output data/posetrack21_frames --mode raw --max_size 960
+    python tools/pack_frames.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --output data/posetrack21_val_frames --mode encoded --set test
+
+Then set DATASET.FRAME_STORE (training, IMG_DIR) or DATASET.TEST_FRAME_STORE (TEST_IMG_DIR).
+'raw' stores the decoded frames (no decoding while training, several times the size of the JPEGs
+unless downscaled with --max_size), 'encoded' the original bytes (same size, decoded as before).
+"""
+import argparse
+import os
+import os.path as osp
+import sys
+
+from tabulate import tabulate
+from tqdm import tqdm
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from datasets.process import FrameStoreWriter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pack dataset frames into a frame store')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--output', type=str, required=True, help='frame store directory')
+    parser.add_argument('--mode', type=str, default='raw', choices=['raw', 'encoded'])
+    parser.add_argument('--max_size', type=int, default=0,
+                        help="'raw' only: downscale frames to this longest side (0 = original size)")
+    parser.add_argument('--set', type=str, default='train', choices=['train', 'test'],
+                        help='pack DATASET.IMG_DIR (train) or DATASET.TEST_IMG_DIR (test)')
+    parser.add_argument('--root_dir', type=str, default='../')
+    return parser.parse_args()
+
+
+def video_folders(image_dir, image_format):
+    """{video folder relative to image_dir: sorted frame files} of the folders containing image_format files."""
+    videos = {}
+    for folder, _, files in os.walk(image_dir):
+        frames = sorted(name for name in files if name.endswith(f".{image_format}"))
+        if frames:
+            videos[osp.relpath(folder, image_dir)] = [osp.join(folder, name) for name in frames]
+    return dict(sorted(videos.items()))
+
+
+def folder_bytes(path):
+    return sum(osp.getsize(osp.join(folder, name)) for folder, _, files in os.walk(path) for name in files)
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+    image_dir = cfg.DATASET.IMG_DIR if args.set == 'train' else cfg.DATASET.TEST_IMG_DIR
+
+    videos = video_folders(image_dir, cfg.IMAGE_FORMAT)
+    if not videos:
+        raise ValueError(f"No .{cfg.IMAGE_FORMAT} frames in {image_dir}")
+    writer = FrameStoreWriter(args.output, mode=args.mode, image_format=cfg.IMAGE_FORMAT, max_size=args.max_size)
+    num_frames = 0
+    for video, frame_files in tqdm(videos.items(), desc="Packing videos"):
+        writer.add_video(video, frame_files)
+        num_frames += len(frame_files)
+    writer.close()
+
+    image_bytes = sum(osp.getsize(frame_file) for frame_files in videos.values() for frame_file in frame_files)
+    store_bytes = folder_bytes(args.output)
+    rows = [[image_dir, len(videos), num_frames, f"{image_bytes / 2 ** 30:.2f}", "-"],
+            [f"{args.output} ({args.mode})", len(videos), len(videos), f"{store_bytes / 2 ** 30:.2f}",
+             f"{store_bytes / max(image_bytes, 1):.2f}"]]
+    headers = ["Frames", "Videos", "Files", "Size (GB)", "Size / images"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+    print("\033[92m" + f"Set DATASET.{'FRAME_STORE' if args.set == 'train' else 'TEST_FRAME_STORE'} "
+          f"to {args.output}" + "\033[0m")
+
+
+if __name__ == '__main__':
+    main()
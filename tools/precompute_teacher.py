@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Precompute the teacher predictions for distillation (DISTILL in the student config). The teacher
+(e.g. the ViT-H Poseidon) runs once over the un-augmented training windows and its heatmaps, and
+with --features the attention map of the fused features entering its heatmap head (channel mean of
+their squares, 1 x h x w), are written as fp16 to a memory-mapped store (datasets/process/teacher_store.py) indexed like the student training set.
+
+    python tools/precompute_teacher.py --config configs/posetrack21/configPoseidonVitS.yaml \
+        --teacher_config configs/posetrack21/configPoseidonVitH.yaml --teacher_weights results/best_model.pt \
+        --output results/teacher_vith --features
+
+Then train the student with DISTILL.ENABLED True and DISTILL.TEACHER_STORE results/teacher_vith.
+"""
+import argparse
+import os.path as osp
+import sys
+
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_poseidon
+from datasets.process import TeacherStore
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from utils.common import TRAIN_PHASE, VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Precompute Poseidon teacher predictions for distillation')
+    parser.add_argument('--config', type=str, required=True, help='student config (training set)')
+    parser.add_argument('--teacher_config', type=str, required=True)
+    parser.add_argument('--teacher_weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--output', type=str, required=True, help='teacher store directory')
+    parser.add_argument('--features', action='store_true', help='also store the attention maps of the fused features (feature loss)')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--batch_size', type=int, default=None, help='default: teacher VAL.BATCH_SIZE')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def distillation_config(path, root_dir):
+    cfg = load_config(path, root_dir)
+    cfg.defrost()
+    cfg.DISTILL.ENABLED = False  # the teacher store does not exist yet
+    cfg.TRAIN.DEVICE_AUGMENTATION = False  # the windows go to the teacher as they are
+    cfg.freeze()
+    return cfg
+
+
+def main():
+    args = parse_args()
+    cfg = distillation_config(args.config, args.root_dir)
+    teacher_cfg = distillation_config(args.teacher_config, args.root_dir)
+    if teacher_cfg.MODEL.HEAD != 'heatmap':
+        raise ValueError("The teacher needs the heatmap head (MODEL.HEAD 'heatmap')")
+
+    model = load_poseidon(teacher_cfg, args.teacher_weights, device=args.device, phase=VAL_PHASE).eval()
+
+    # training windows of the teacher, without augmentation
+    dataset = PoseTrack(teacher_cfg, phase=TRAIN_PHASE)
+    dataset.train = False
+    num_samples = len(PoseTrack(cfg, phase=TRAIN_PHASE))
+    if num_samples != len(dataset):
+        raise ValueError(f"The teacher training set has {len(dataset)} samples, the student {num_samples}: "
+                         f"the configs must use the same training annotations")
+    loader = DataLoader(dataset, batch_size=args.batch_size or teacher_cfg.VAL.BATCH_SIZE, shuffle=False,
+                        num_workers=teacher_cfg.WORKERS, pin_memory=True)
+
+    captured = {}
+    handle = None
+    if args.features:
+        # attention map of the features (see DistillationLoss), C times smaller than the features
+        def capture(module, inputs):
+            captured['attention'] = inputs[0].float().pow(2).mean(dim=1, keepdim=True)
+
+        handle = model.deconv_layer.register_forward_pre_hook(capture)
+
+    store = None
+    start = 0
+    use_amp = str(args.device).startswith('cuda')
+    with torch.no_grad():
+        for x, meta, _, _ in tqdm(loader, desc='Teacher'):
+            with torch.autocast(device_type=torch.device(args.device).type, enabled=use_amp):
+                heatmaps = model(x.to(args.device, non_blocking=True), meta)
+            attention = captured['attention'].cpu().numpy() if args.features else None
+            if store is None:
+                store = TeacherStore.create(args.output, len(dataset), heatmaps.shape[1:],
+                                            teacher_cfg.MODEL.HEATMAP_SIZE,
+                                            attention.shape[2:] if attention is not None else None)
+            # crops of the un-augmented samples, to warp the maps onto the augmented student crops
+            store.write(start, heatmaps.float().cpu().numpy(), meta['center'].numpy(), meta['scale'].numpy(),
+                        attention)
+            start += len(heatmaps)
+
+    if handle is not None:
+        handle.remove()
+    store.flush()
+    print("\033[92m" + f"Teacher store with {start} samples written to {args.output}" + "\033[0m")
+
+
+if __name__ == '__main__':
+    main()
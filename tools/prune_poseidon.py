@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Structured pruning of a trained Poseidon (see models/best/pruning.py) with a short fine-tune after
+each step. Steps are cumulative and applied in the order given:
+
+    depth:N      keep the first N ViT layers (N > deepest layer read by the fusion)
+    heads:R      remove the fraction R of the remaining backbone attention heads, least important first
+    ppm:S1,S2    keep the PyramidPoolingModule branches of pool sizes S1, S2, ...
+
+After each step the model is saved as a standalone artifact (loaded by val.py / inference.py without
+mmpose) and the report gives its parameter count, FLOPs per window, CPU / GPU latency and the mAP of
+PoseTrack.evaluate, to pick a point on the accuracy / cost Pareto front.
+
+    python tools/prune_poseidon.py --config configs/posetrack21/configPoseidonVitB.yaml \
+        --weights results/best_model.pt --output_dir results/pruned --steps depth:10 heads:0.25 ppm:1,3,6
+"""
+import argparse
+import itertools
+import os
+import os.path as osp
+import sys
+import time
+
+import torch
+from tabulate import tabulate
+from torch.utils.data import DataLoader
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_checkpoint, is_poseidon_artifact, load_poseidon, save_poseidon
+from models.best.pruning import (head_importance, select_heads, prune_heads, truncate_backbone, prune_pyramid_pooling,
+                                 pruning_info)
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from core.loss import get_loss_function
+from core.function import validate
+from utils.common import TRAIN_PHASE, VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Structured pruning of Poseidon')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--output_dir', type=str, required=True)
+    parser.add_argument('--steps', type=str, nargs='+', required=True, help='depth:N, heads:R or ppm:S1,S2,...')
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--finetune_iters', type=int, default=500, help='training iterations after each step')
+    parser.add_argument('--lr', type=float, default=1e-5)
+    parser.add_argument('--calib_batches', type=int, default=8, help='training batches ranking the heads')
+    parser.add_argument('--iters', type=int, default=10, help='timed iterations per latency measure')
+    parser.add_argument('--no_eval', action='store_true', help='skip the mAP on the validation set')
+    parser.add_argument('--device', type=str, default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def parse_step(step):
+    kind, _, value = step.partition(':')
+    if kind == 'depth':
+        return kind, int(value)
+    if kind == 'heads':
+        return kind, float(value)
+    if kind == 'ppm':
+        return kind, [int(size) for size in value.split(',') if size]
+    raise ValueError(f"Unknown pruning step: {step}")
+
+
+def count_flops(model, x):
+    """FLOPs of one forward pass, None when torch has no FlopCounterMode (< 2.1)."""
+    try:
+        from torch.utils.flop_counter import FlopCounterMode
+    except ImportError:
+        return None
+    counter = FlopCounterMode(display=False)
+    with torch.no_grad(), counter:
+        model(x)
+    return counter.get_total_flops()
+
+
+def latency(model, x, device, iters):
+    use_amp = str(device).startswith('cuda')
+    with torch.no_grad(), torch.autocast(device_type=torch.device(device).type, enabled=use_amp):
+        model(x)  # warmup
+        if use_amp:
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+        if use_amp:
+            torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def finetune(model, train_loader, criterion, iters, lr, device):
+    """A few training iterations to recover from a pruning step."""
+    model.train()
+    model.set_phase(TRAIN_PHASE)
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=lr)
+    use_amp = str(device).startswith('cuda')
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+
+    def batches():
+        # a new pass over the loader each time, fresh augmentations and no batches kept
+        while True:
+            yield from train_loader
+
+    for x, meta, target_heatmaps, target_heatmaps_weight in itertools.islice(batches(), iters):
+        with torch.autocast(device_type=torch.device(device).type, enabled=use_amp):
+            output = model(x.to(device, non_blocking=True), meta)
+            loss = criterion(output, target_heatmaps.to(device, non_blocking=True),
+                             target_heatmaps_weight.to(device, non_blocking=True))
+        optimizer.zero_grad()
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+    model.eval()
+    model.set_phase(VAL_PHASE)
+
+
+def main():
+    args = parse_args()
+    steps = [parse_step(step) for step in args.steps]
+    cfg = load_config(args.config, args.root_dir)
+    cfg.defrost()
+    cfg.TRAIN.DEVICE_AUGMENTATION = False  # the training windows go to the model as they are
+    cfg.freeze()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    checkpoint = load_checkpoint(args.weights)
+    model = load_poseidon(cfg, checkpoint, device=args.device, phase=VAL_PHASE)
+    model.to(args.device).eval()
+
+    train_dataset = PoseTrack(cfg, phase=TRAIN_PHASE)
+    worker_context = train_dataset.multiprocessing_context if cfg.WORKERS > 0 else None
+    train_loader = DataLoader(train_dataset, batch_size=cfg.TRAIN.BATCH_SIZE, shuffle=True, num_workers=cfg.WORKERS,
+                              pin_memory=True, drop_last=True, multiprocessing_context=worker_context)
+    criterion = get_loss_function(cfg, args.device)
+    if not args.no_eval:
+        val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+        val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, num_workers=cfg.WORKERS,
+                                pin_memory=True)
+
+    width, height = cfg.MODEL.IMAGE_SIZE
+    window = torch.randn(1, cfg.WINDOWS_SIZE, 3, height, width)
+
+    def measure(name):
+        flops = count_flops(model.cpu(), window)
+        cpu_ms = latency(model, window, 'cpu', args.iters)
+        model.to(args.device)
+        gpu_ms = latency(model, window.to(args.device), args.device, args.iters) \
+            if str(args.device).startswith('cuda') else None
+        map_value = "-"
+        if not args.no_eval:
+            _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, model, criterion, cfg.OUTPUT_DIR, 0,
+                                               device=args.device)
+            map_value = f"{perf_indicator:.2f}"
+            print(f"{name}: mAP {perf_indicator:.2f}")
+        return [name, f"{model.count_parameters() / 1e6:.1f}", f"{flops / 1e9:.1f}" if flops is not None else "-",
+                f"{cpu_ms:.1f}", f"{gpu_ms:.2f}" if gpu_ms is not None else "-", map_value]
+
+    rows = [measure("original")]
+    for i, (kind, value) in enumerate(steps, start=1):
+        if kind == 'depth':
+            truncate_backbone(model, value)
+        elif kind == 'heads':
+            batches = (x for x, _, _, _ in itertools.islice(train_loader, args.calib_batches))
+            prune_heads(model, select_heads(head_importance(model, batches), value))
+        else:
+            prune_pyramid_pooling(model, value)
+        name = f"{i}. {kind}:{value if kind != 'ppm' else ','.join(map(str, value))}"
+        print("\033[92m" + f"Step {name}, fine-tuning for {args.finetune_iters} iterations" + "\033[0m")
+        if args.finetune_iters > 0:
+            finetune(model, train_loader, criterion, args.finetune_iters, args.lr, args.device)
+
+        # standalone artifact of the step
+        path = osp.join(args.output_dir, f"pruned_step{i}.pt")
+        if is_poseidon_artifact(checkpoint):
+            artifact = dict(checkpoint)
+            artifact['model_state_dict'] = model.state_dict()
+            artifact['pruning'] = pruning_info(model)
+            torch.save(artifact, path)
+        else:
+            save_poseidon(model, cfg, path, pruning=pruning_info(model))
+        print("\033[92m" + f"Pruned model saved to {path}" + "\033[0m")
+        rows.append(measure(name))
+
+    headers = ["Step", "Params (M)", "GFLOPs / window", "CPU latency bs=1 (ms)", "GPU latency bs=1 (ms)", "mAP"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+"""
+Post-training int8 quantization of Poseidon for CPU deployment (see models/best/quantization.py).
+
+The static blocks are calibrated on --calib_windows windows evenly spread over the PoseTrack
+validation set. The quantized checkpoint is loaded by val.py / inference.py like a regular one
+(CPU only). The report compares the float and int8 models: serialized size, CPU latency and, with
+--evaluate, the mAP of PoseTrack.evaluate on the full validation set.
+
+    python tools/quantize_poseidon.py --config configs/posetrack21/configPoseidonVitH.yaml \
+        --weights results/best_model.pt --output results/best_model_int8.pt --evaluate
+"""
+import argparse
+import io
+import os.path as osp
+import sys
+import time
+
+import numpy as np
+import torch
+from tabulate import tabulate
+from torch.utils.data import DataLoader, Subset
+
+sys.path.insert(0, osp.abspath(osp.join(osp.dirname(__file__), '..')))
+
+from posetimation import load_config
+from models.best.artifact import load_checkpoint, is_poseidon_artifact, load_poseidon
+from models.best.quantization import quantize_poseidon, quantization_info, quantized_engine
+from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from utils.common import VAL_PHASE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='int8 post-training quantization of Poseidon')
+    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--weights', type=str, required=True, help='Poseidon .pt checkpoint or artifact')
+    parser.add_argument('--output', type=str, required=True)
+    parser.add_argument('--root_dir', type=str, default='../')
+    parser.add_argument('--calib_windows', type=int, default=256, help='validation windows used for calibration')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--latency_batch_sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--evaluate', action='store_true', help='mAP of both models on the validation set (slow on CPU)')
+    return parser.parse_args()
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2 ** 20
+
+
+def cpu_latency(model, cfg, batch_size, iters):
+    width, height = cfg.MODEL.IMAGE_SIZE
+    x = torch.randn(batch_size, cfg.WINDOWS_SIZE, 3, height, width)
+    with torch.no_grad():
+        model(x)  # warmup
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(x)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def evaluate(model, cfg, val_dataset):
+    from core.loss import get_loss_function
+    from core.function import validate
+
+    val_loader = DataLoader(val_dataset, batch_size=cfg.VAL.BATCH_SIZE, shuffle=False, num_workers=cfg.WORKERS)
+    _, perf_indicator, _, _ = validate(cfg, val_loader, val_dataset, model, get_loss_function(cfg, 'cpu'),
+                                       cfg.OUTPUT_DIR, 0, device='cpu')
+    return perf_indicator
+
+
+def main():
+    args = parse_args()
+    cfg = load_config(args.config, args.root_dir)
+    checkpoint = load_checkpoint(args.weights)
+
+    # Calibration windows, evenly spread over the validation set
+    val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
+    indices = np.linspace(0, len(val_dataset) - 1, min(args.calib_windows, len(val_dataset))).astype(int)
+    calib_loader = DataLoader(Subset(val_dataset, indices.tolist()), batch_size=args.batch_size, shuffle=False,
+                              num_workers=cfg.WORKERS)
+
+    engine = quantized_engine()
+    model = load_poseidon(cfg, checkpoint, device='cpu', phase=VAL_PHASE).eval()
+    print("\033[92m" + f"Calibrating on {len(indices)} windows ({engine})" + "\033[0m")
+    quantize_poseidon(model, (x for x, _, _, _ in calib_loader), engine=engine)
+
+    # Same layout as the input checkpoint (artifact or .pt), with int8 weights
+    output = dict(checkpoint) if is_poseidon_artifact(checkpoint) else {}
+    output['model_state_dict'] = model.state_dict()
+    output['quantization'] = quantization_info(engine)
+    torch.save(output, args.output)
+    print("\033[92m" + f"Quantized checkpoint saved to {args.output}" + "\033[0m")
+
+    # Report
+    float_model = load_poseidon(cfg, checkpoint, device='cpu', phase=VAL_PHASE).eval()
+    rows = []
+    for name, m in (('float32', float_model), ('int8', model)):
+        row = [name, f"{serialized_size(m):.1f}"]
+        row += [f"{cpu_latency(m, cfg, batch_size, args.iters):.1f}" for batch_size in args.latency_batch_sizes]
+        row.append(f"{evaluate(m, cfg, val_dataset):.2f}" if args.evaluate else "-")
+        rows.append(row)
+    if args.evaluate:
+        rows.append(['delta', '', *[''] * len(args.latency_batch_sizes), f"{float(rows[1][-1]) - float(rows[0][-1]):+.2f}"])
+
+    headers = ["Model", "Size (MiB)", *[f"CPU latency bs={b} (ms)" for b in args.latency_batch_sizes], "mAP"]
+    print(tabulate(rows, headers=headers, tablefmt="pipe", numalign="left"))
+
+
+if __name__ == '__main__':
+    main()
@@ -21,9 +21,10 @@ sys.path.insert(0, os.path.abspath('../'))
 from datasets.transforms.build import reverse_transforms
 from models.best.Poseidon import Poseidon
 from datasets.zoo.posetrack.PoseTrack import PoseTrack 
+from datasets.samplers import build_train_sampler, build_val_sampler
 from posetimation import get_cfg, update_config 
 from engine.defaults import default_parse_args
-from core.loss import get_loss_function
+from core.loss import get_loss_function, get_distillation_loss
 from core.optimizer import Optimizer
 from utils.common import TRAIN_PHASE, VAL_PHASE, TEST_PHASE
 from core.function import train, validate, train_batch_accumulation
@@ -90,8 +91,17 @@ def main():
     if cfg.MODEL.METHOD == 'poseidon':
         model = Poseidon(cfg, phase=phase, device=device).to(device)
 
+    # activation checkpointing: recompute the backbone / fusion activations in backward
+    if cfg.TRAIN.CHECKPOINT_BACKBONE or cfg.TRAIN.CHECKPOINT_FUSION:
+        model.set_gradient_checkpointing(backbone=cfg.TRAIN.CHECKPOINT_BACKBONE, fusion=cfg.TRAIN.CHECKPOINT_FUSION)
+        print("\033[93m" + "Gradient checkpointing enabled." + "\033[0m")
+
     # define loss function (criterion) and optimizer
     loss = get_loss_function(cfg, device)
+    # teacher supervision (DISTILL), None when disabled
+    distillation = get_distillation_loss(cfg, model, device)
+    if distillation is not None:
+        print("\033[93m" + f"Distillation from the teacher store {cfg.DISTILL.TEACHER_STORE}" + "\033[0m")
 
     # define optimizer
     optimizer = Optimizer(model, cfg).get_optimizer()
@@ -115,12 +125,15 @@ def main():
     val_dataset = PoseTrack(cfg, phase=VAL_PHASE)
 
     # load the dataloaders
+    train_sampler = build_train_sampler(cfg, train_dataset)
     train_loader = torch.utils.data.DataLoader(
         train_dataset,
         batch_size=cfg.TRAIN.BATCH_SIZE,
-        shuffle=True,
+        shuffle=train_sampler is None,
+        sampler=train_sampler,
         num_workers=cfg.WORKERS,
         pin_memory=True,
+        multiprocessing_context=train_dataset.multiprocessing_context if cfg.WORKERS > 0 else None,
     )
 
    # print in red color
@@ -133,6 +146,7 @@ def main():
         val_dataset,
         batch_size=cfg.VAL.BATCH_SIZE,
         shuffle=False,
+        sampler=build_val_sampler(cfg, val_dataset),
         num_workers=cfg.WORKERS,
         pin_memory=True,
     )
@@ -190,6 +204,9 @@ def main():
     for epoch in range(start_epoch, cfg.TRAIN.END_EPOCH):
         
         print("\033[92m" + "Epoch: " + "\033[0m", epoch)
+
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
         
         if cfg.SAVE_RESULTS: 
             save_examples = (epoch == cfg.TRAIN.BEGIN_EPOCH)
@@ -198,10 +215,15 @@ def main():
 
         if cfg.TRAIN.ACCUMULATION_STEPS > 1:
             train_loss, train_acc = train_batch_accumulation(cfg, train_loader, model, loss, optimizer, epoch,
-                output_dir=cfg.OUTPUT_DIR, device=device, experiment_dir=experiment_dir, save_examples=save_examples)
+                output_dir=cfg.OUTPUT_DIR, device=device, experiment_dir=experiment_dir, save_examples=save_examples,
+                distillation=distillation)
         else:
             train_loss, train_acc = train(cfg, train_loader, model, loss, optimizer, epoch,
-                output_dir=cfg.OUTPUT_DIR, device=device, experiment_dir=experiment_dir, save_examples=save_examples)
+                output_dir=cfg.OUTPUT_DIR, device=device, experiment_dir=experiment_dir, save_examples=save_examples,
+                distillation=distillation)
+
+        if train_dataset.frame_cache is not None:
+            print("\033[92m" + train_dataset.frame_cache.summary() + "\033[0m")
 
         # Step the scheduler if applicable
         if cfg.TRAIN.LR_SCHEDULER == 'StepLR' or cfg.TRAIN.LR_SCHEDULER == 'CosineAnnealingLR':
@@ -7,6 +7,7 @@ from .utils_folder import create_folder, folder_exists
 import os.path as osp
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 from turbojpeg import TurboJPEG
 
 jpeg = TurboJPEG()
@@ -32,6 +33,60 @@ def read_images_parallel(image_files, format='jpg'):
         with ThreadPoolExecutor() as executor:
             return list(executor.map(read_image_pil, image_files))
 
+# DCT-domain scaling factors of read_jpeg_region (denominators)
+JPEG_SCALE_DENOMS = (1, 2, 4, 8)
+# lossless crop origins are aligned to the largest iMCU (4:1:1 / 4:4:1), whatever the subsampling
+JPEG_CROP_ALIGN = 32
+# the lossless crop entropy-decodes the whole image, it only pays off for regions smaller than this
+JPEG_CROP_MAX_FRACTION = 0.5
+
+
+def read_file_bytes(image_path):
+    if not osp.exists(image_path):
+        raise Exception(f"Failed to read image from path: {image_path}")
+    with open(image_path, 'rb') as file:
+        return file.read()
+
+
+def read_files_parallel(image_files):
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(read_file_bytes, image_files))
+
+
+def jpeg_size(jpeg_buf):
+    """(width, height) of a JPEG from its header."""
+    width, height = jpeg.decode_header(jpeg_buf)[:2]
+    return width, height
+
+
+def read_jpeg_region(jpeg_buf, region=None, scale_denom=1):
+    """Decode the region (x0, y0, x1, y1) of a JPEG at 1 / scale_denom of its resolution.
+
+    The region is cut losslessly (its origin rounded down to JPEG_CROP_ALIGN) when it is small enough
+    to pay off, and scaled in the DCT domain. Pixel (u, v) of the result is centered on image pixel
+    ((u + 0.5) * scale_denom - 0.5 + x, (v + 0.5) * scale_denom - 0.5 + y).
+
+    Returns:
+        np.ndarray: Decoded pixels, as read_image_turbojpeg.
+        tuple: Image coordinates (x, y) of the origin of the decoded pixels.
+    """
+    origin = (0, 0)
+    if region is not None:
+        width, height = jpeg_size(jpeg_buf)
+        x0, y0 = region[0] // JPEG_CROP_ALIGN * JPEG_CROP_ALIGN, region[1] // JPEG_CROP_ALIGN * JPEG_CROP_ALIGN
+        w, h = region[2] - x0, region[3] - y0
+        if 0 < w and 0 < h and w * h < JPEG_CROP_MAX_FRACTION * width * height:
+            jpeg_buf = jpeg.crop(jpeg_buf, x0, y0, w, h)
+            origin = (x0, y0)
+    scaling_factor = (1, scale_denom) if scale_denom > 1 else None
+    return jpeg.decode(jpeg_buf, scaling_factor=scaling_factor), origin
+
+
+def read_jpeg_regions_parallel(jpeg_bufs, region=None, scale_denom=1):
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(partial(read_jpeg_region, region=region, scale_denom=scale_denom), jpeg_bufs))
+
+
 def read_image(image_path):
     if not osp.exists(image_path):
         raise FileNotFoundError(f"Failed to read image from path: {image_path}")
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding:utf8 -*-
+import time
+
+import torch
+
+
+class ModelTimer:
+    """Model time and number of windows, collected with forward hooks.
+
+    With count_context, also counts the context frames entering the cross attention (frames kept by
+    the context frame skipping).
+    """
+
+    def __init__(self, model, device, count_context=False):
+        self.device = device
+        self.reset()
+        model.register_forward_pre_hook(self._start)
+        model.register_forward_hook(self._stop)
+        if count_context:
+            model.cross_attention.register_forward_pre_hook(self._count)
+
+    def reset(self):
+        self.elapsed, self.windows, self.context_frames = 0.0, 0, 0
+
+    def _sync(self):
+        if str(self.device).startswith('cuda'):
+            torch.cuda.synchronize(self.device)
+
+    def _start(self, module, inputs):
+        self._sync()
+        self._t0 = time.perf_counter()
+
+    def _stop(self, module, inputs, output):
+        self._sync()
+        self.elapsed += time.perf_counter() - self._t0
+        self.windows += inputs[0].shape[0]
+
+    def _count(self, module, inputs):
+        context = inputs[1]  # [B, num_context_frames, C, h, w]
+        self.context_frames += context.shape[0] * context.shape[1]
@@ -8,8 +8,12 @@ import numpy as np
 import yaml
 from torch.utils.data import DataLoader
 from datasets.transforms.build import reverse_transforms
-from models.best.Poseidon import Poseidon
+from models.best.artifact import load_checkpoint, load_poseidon
+from models.best.quantization import is_quantized_checkpoint
+from models.best.compiled import compile_poseidon
+from models.best.cpu_profile import autocast_context, cpu_profile_from_config
 from datasets.zoo.posetrack.PoseTrack import PoseTrack
+from datasets.samplers import build_val_sampler
 from posetimation import get_cfg, update_config
 from engine.defaults import default_parse_args
 from core.loss import get_loss_function
@@ -68,19 +72,26 @@ def main():
     device = "cuda:" + str(cfg.GPUS[0]) if torch.cuda.is_available() else 'cpu'
     print("\033[92m" + "Device: " + "\033[0m", device)
 
-    # Load the model
-    if cfg.MODEL.METHOD == 'poseidon':
-        model = Poseidon(cfg, phase=VAL_PHASE, device=device).to(device)
-
     model_weights_path = args.weights_path
     #model_weights_path = "/home/pace/Poseidon/results/best_results/2024-10-18_2_vitS/best_model.pt"
     #model_weights_path = "/home/pace/Poseidon/results/best_results/2024-10-17_1_VitH/best_model.pt"
 
     # Assuming model_weights_path is a string that contains the path to the checkpoint file
-    # Load the checkpoint onto the CPU and then move it to the GPU
-    checkpoint = torch.load(model_weights_path, map_location='cpu')
-    model.load_state_dict(checkpoint['model_state_dict'])
-    model.to(device)
+    # Load the checkpoint onto the CPU (memory-mapped) and then move it to the GPU
+    checkpoint = load_checkpoint(model_weights_path)
+
+    # int8 checkpoints (tools/quantize_poseidon.py) only run on the CPU
+    if is_quantized_checkpoint(checkpoint):
+        device = 'cpu'
+        print("\033[92m" + "Quantized checkpoint, running on the CPU" + "\033[0m")
+
+    # Load the model: exported artifacts (tools/export_poseidon.py) are built without mmpose
+    model = load_poseidon(cfg, checkpoint, device=device, phase=VAL_PHASE)
+
+    # CPU inference profile: bf16 autocast (in validate), channels-last convolutions, sized and pinned threads
+    if device == 'cpu' and cfg.CPU.PROFILE:
+        profile = cpu_profile_from_config(model.eval(), cfg)
+        print("\033[92m" + "CPU profile: " + profile.summary() + "\033[0m")
 
     # Define loss function (criterion)
     loss = get_loss_function(cfg, device)
@@ -96,6 +107,7 @@ def main():
         val_dataset,
         batch_size=cfg.VAL.BATCH_SIZE,
         shuffle=False,
+        sampler=build_val_sampler(cfg, val_dataset),
         num_workers=cfg.WORKERS,
         pin_memory=True,
     )
@@ -103,6 +115,12 @@ def main():
     print("\033[92m" + "Val loader loaded successfully." + "\033[0m")
     print("Number of elements in the val set: ", len(val_dataset))
 
+    # Compiled inference: warm up the full and the last (partial) batch size under validate's autocast
+    if args.compile:
+        batch_sizes = {cfg.VAL.BATCH_SIZE, len(val_dataset) % cfg.VAL.BATCH_SIZE} - {0}
+        compile_poseidon(model.eval(), batch_sizes, cfg.WINDOWS_SIZE, cfg.MODEL.IMAGE_SIZE, device,
+                         context=lambda: autocast_context(cfg, device), report=args.compile_report)
+
     # Start the validation process
     print("\033[92m" + "Starting validation..." + "\033[0m")
 